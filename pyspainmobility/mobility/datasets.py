@@ -0,0 +1,143 @@
+"""
+Declarative specifications of the MITMA datasets processed by :class:`~pyspainmobility.mobility.mobility.Mobility`.
+
+Each specification describes how a raw file is turned into the library's output:
+
+- ``m_types``: MITMA file prefix per data version (missing versions are not available)
+- ``columns``: source column -> output column translation (source names of every version)
+- ``required`` / ``optional``: output columns that must exist / are added as NA when missing
+- ``normalizers``: output column -> normalizer kind (date, identifier, hour, numeric, category)
+- ``labels``: output column -> value translation map
+- ``dropna``: rows with NA in these columns are discarded
+- ``hourly``: whether the dataset has an 'hour' column
+- ``dimensions`` / ``optional_dimensions``: group keys besides time, the optional ones enabled by flags
+- ``measures``: summed columns
+- ``zone_columns``: columns holding zone ids, translated when rolling data up to coarser zonings
+- ``group_native``: whether the native resolution output is grouped (otherwise rows are passed through)
+- ``keep_na_keys``: whether rows with NA group keys are kept as their own group when grouping
+- ``filters``: output columns usable in the ``filters`` argument
+
+Adding a MITMA product only requires a new entry here and a public get_* method calling
+``Mobility._get_dataset``.
+"""
+
+ACTIVITY_LABELS = {
+    "casa": "home",
+    "frecuente": "other_frequent",
+    "trabajo_estudio": "work_or_study",
+    "no_frecuente": "other_non_frequent",
+}
+GENDER_LABELS = {"hombre": "male", "mujer": "female"}
+
+DATASET_SPECS = {
+    "od": {
+        "label": "ODs",
+        "m_types": {1: "maestra1", 2: "Viajes"},
+        "columns": {
+            "fecha": "date",
+            "periodo": "hour",
+            "origen": "id_origin",
+            "destino": "id_destination",
+            "actividad_origen": "activity_origin",
+            "actividad_destino": "activity_destination",
+            "residencia": "residence_province_ine_code",
+            "distancia": "distance",
+            "viajes": "n_trips",
+            "viajes_km": "trips_total_length_km",
+            # socio-demo
+            "renta": "income",
+            "edad": "age",
+            "sexo": "gender",
+        },
+        "required": ["date", "hour", "id_origin", "id_destination", "n_trips", "trips_total_length_km"],
+        "optional": ["activity_origin", "activity_destination", "income", "age", "gender"],
+        "normalizers": {
+            "date": "date",
+            "id_origin": "identifier",
+            "id_destination": "identifier",
+            "residence_province_ine_code": "identifier",
+            "hour": "hour",
+            "n_trips": "numeric",
+            "trips_total_length_km": "numeric",
+        },
+        "labels": {
+            "activity_origin": ACTIVITY_LABELS,
+            "activity_destination": ACTIVITY_LABELS,
+            "gender": GENDER_LABELS,
+        },
+        "dropna": ["date", "id_origin", "id_destination", "n_trips", "trips_total_length_km"],
+        "hourly": True,
+        "dimensions": ["id_origin", "id_destination"],
+        "optional_dimensions": {
+            "keep_activity": ["activity_origin", "activity_destination"],
+            "social_agg": ["income", "age", "gender"],
+        },
+        "measures": ["n_trips", "trips_total_length_km"],
+        "zone_columns": ["id_origin", "id_destination"],
+        "group_native": True,
+        "keep_na_keys": False,
+        "filters": ("date", "hour", "id_origin", "id_destination", "activity_origin", "activity_destination",
+                    "residence_province_ine_code", "income", "age", "gender"),
+    },
+    "os": {
+        "label": "Overnight Stays",
+        "m_types": {2: "Pernoctaciones"},
+        "unavailable": "Overnight stays data is not available for version 1. Please use version 2.",
+        "columns": {
+            "fecha": "date",
+            "zona_residencia": "residence_area",
+            "zona_pernoctacion": "overnight_stay_area",
+            "personas": "people",
+        },
+        "required": ["date", "residence_area", "overnight_stay_area", "people"],
+        "optional": [],
+        "normalizers": {
+            "date": "date",
+            "residence_area": "identifier",
+            "overnight_stay_area": "identifier",
+            "people": "numeric",
+        },
+        "labels": {},
+        "dropna": ["date", "residence_area", "overnight_stay_area", "people"],
+        "hourly": False,
+        "dimensions": ["residence_area", "overnight_stay_area"],
+        "optional_dimensions": {},
+        "measures": ["people"],
+        "zone_columns": ["residence_area", "overnight_stay_area"],
+        "group_native": False,
+        "keep_na_keys": True,
+        "filters": ("date", "residence_area", "overnight_stay_area"),
+    },
+    "nt": {
+        "label": "Number of Trips",
+        "m_types": {1: "maestra2", 2: "Personas"},
+        "columns": {
+            "fecha": "date",
+            "zona_pernoctacion": "overnight_stay_area",
+            # version 1 files are keyed by district
+            "distrito": "overnight_stay_area",
+            "edad": "age",
+            "sexo": "gender",
+            "numero_viajes": "number_of_trips",
+            "personas": "people",
+        },
+        "required": ["date", "overnight_stay_area", "number_of_trips", "people"],
+        "optional": ["age", "gender"],
+        "normalizers": {
+            "date": "date",
+            "overnight_stay_area": "identifier",
+            "number_of_trips": "category",
+            "people": "numeric",
+        },
+        "labels": {"gender": GENDER_LABELS},
+        "dropna": ["date", "overnight_stay_area", "number_of_trips", "people"],
+        "hourly": False,
+        "dimensions": ["overnight_stay_area", "age", "gender", "number_of_trips"],
+        "optional_dimensions": {},
+        "measures": ["people"],
+        "zone_columns": ["overnight_stay_area"],
+        "group_native": False,
+        "keep_na_keys": True,
+        "filters": ("date", "overnight_stay_area", "age", "gender", "number_of_trips"),
+    },
+}
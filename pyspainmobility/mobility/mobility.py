@@ -1,19 +1,33 @@
 from pandas.errors import EmptyDataError 
+from pyspainmobility.mobility.datasets import DATASET_SPECS
 from pyspainmobility.utils import utils
+import hashlib
+import itertools
+import json
 import os
+import re
+import shutil
+import numpy as np
 import pandas as pd
 import tqdm
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from os.path import expanduser
 from typing import Optional
 
 # Optional Arrow import – used when backend='arrow'
 try:
     import pyarrow as pa
+    import pyarrow.compute as pc
     import pyarrow.csv as pacsv
+    import pyarrow.dataset as pads
+    import pyarrow.parquet as pq
 except ImportError:
     pa = None
+    pc = None
     pacsv = None
+    pads = None
+    pq = None
 
 # Optional Dask import – only used when caller sets use_dask=True
 try:
@@ -23,6 +37,99 @@ except ImportError:
     dd = None
     delayed = None
 
+# Optional DuckDB import – only used by Mobility.sql()
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Optional SciPy import – only used by the sparse OD matrix exports
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+# Optional psutil import – used to read the available memory for engine='auto'
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Bump whenever the processed output schema changes, so stale cached results are not reused.
+_RESULT_SCHEMA_VERSION = 1
+_RESULT_CACHE_DIRECTORY = ".pyspainmobility_cache"
+
+# Parquet layout used with parquet_layout='optimized'. Rows are sorted so
+# that min/max statistics of each row group prune on date and zone ids.
+_OPTIMIZED_PARQUET_LAYOUT = {
+    "sort_by": ["date", "week", "month", "day_type", "id_origin", "residence_area",
+                "id_destination", "overnight_stay_area", "hour"],
+    "row_group_size": 131072,
+    "compression": "zstd",
+    "compression_level": 3,
+    "dictionary_columns": ["id_origin", "id_destination", "residence_area", "overnight_stay_area",
+                           "residence_province_ine_code", "activity_origin", "activity_destination",
+                           "income", "age", "gender", "number_of_trips", "week", "month", "day_type"],
+}
+_PARQUET_LAYOUT_METADATA_KEY = b"pyspainmobility.layout"
+
+# Folder (inside the output directory) of the chunked OD array store and
+# number of hourly slices stored per day.
+_OD_STORE_DIRECTORY = "od_store"
+_OD_STORE_HOURS = 24
+
+# Folder (inside the output directory) of the per-zone time-series store.
+_ZONE_TIMESERIES_DIRECTORY = "zone_timeseries"
+_ZONE_TIMESERIES_MEASURES = ["outflow", "inflow", "intra", "outflow_km", "inflow_km"]
+
+# Aggregates materialised by get_od_data(aggregates=True), stored next to
+# the main output in a '<output>_aggregates' folder.
+_OD_AGGREGATES = ("by_origin", "by_destination", "by_hour", "daily_totals")
+
+# Dimensions of the socio-demographic OD cube built by Mobility.build_od_cube().
+# Every cuboid also keeps the 'date' column.
+_OD_CUBE_DIMENSIONS = ["activity_origin", "activity_destination", "income", "age", "gender"]
+
+# Default bins (km) of the mean trip length histogram of Mobility.get_od_summary().
+_TRIP_LENGTH_BINS = [0, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, np.inf]
+
+# SQL view name -> dataset key of DATASET_SPECS, used by Mobility.sql()
+_SQL_VIEWS = {"od": "od", "overnight_stays": "os", "number_of_trips": "nt"}
+
+_ENGINES = ("sequential", "threads", "processes", "streaming", "dask")
+
+# Rough sizing profiles used by Mobility.plan(). ``compressed_bytes`` is only
+# used when none of the requested raw files is cached locally yet.
+_PLAN_PROFILES = {
+    "Viajes": {"compressed_bytes": {"distritos": 110e6, "municipios": 75e6, "GAU": 25e6},
+               "csv_bytes_per_row": 80, "output_ratio": 0.35},
+    "maestra1": {"compressed_bytes": {"distritos": 60e6, "municipios": 40e6},
+                 "csv_bytes_per_row": 60, "output_ratio": 0.6},
+    "Pernoctaciones": {"compressed_bytes": {"distritos": 3e6, "municipios": 2e6, "GAU": 0.5e6},
+                       "csv_bytes_per_row": 40, "output_ratio": 1.0},
+    "Personas": {"compressed_bytes": {"distritos": 1.5e6, "municipios": 1e6, "GAU": 0.2e6},
+                 "csv_bytes_per_row": 45, "output_ratio": 1.0},
+    "maestra2": {"compressed_bytes": {"distritos": 0.5e6, "municipios": 0.3e6},
+                 "csv_bytes_per_row": 35, "output_ratio": 1.0},
+}
+_GZIP_EXPANSION = 8.0
+# Parsed bytes per row and rows processed per second on a single core.
+_BACKEND_PROFILES = {
+    "arrow": {"bytes_per_row": 180, "rows_per_second": 450_000},
+    "pandas": {"bytes_per_row": 650, "rows_per_second": 160_000},
+}
+_OUTPUT_BYTES_PER_ROW = 90
+
+_TIME_RESOLUTIONS = ("hour", "day", "week", "month", "day_type")
+# Time columns of the output for each time resolution.
+_TIME_KEYS = {
+    "hour": ["date", "hour"],
+    "day": ["date"],
+    "week": ["week"],
+    "month": ["month"],
+    "day_type": ["month", "day_type", "hour"],
+}
+
 class Mobility:
     """
     This is the object taking care of the data download and preprocessing of (i) daily origin-destination matrices (ii), overnight stays and (iii) number of trips.
@@ -53,6 +160,22 @@ class Mobility:
         classic pandas dtypes. If 'arrow' is requested but pyarrow is not
         installed, the class automatically falls back to 'pandas' and
         emits a warning.
+    engine : str
+        Execution strategy used to process the raw files. Default is None, which keeps the previous behaviour
+        ('dask' if use_dask is True, 'sequential' otherwise). Must be one of the following: sequential, threads,
+        processes, streaming, dask or auto. 'streaming' appends every processed file to the output parquet instead
+        of holding all of them in memory; 'auto' picks the cheapest engine returned by :meth:`plan`.
+    cache : bool
+        Whether to memoise the results of the get_* methods. Default is False. If True, results are stored in a
+        '.pyspainmobility_cache' folder of the output directory, keyed by the call parameters and the size and
+        modification time of the raw files, and reused by later calls with the same parameters.
+    parquet_layout : str or dict
+        Layout of the parquet files written. Default is 'default', which keeps pandas' defaults. With 'optimized'
+        rows are sorted by date, zone ids and hour, row groups hold 131072 rows, ids and categorical columns are
+        dictionary encoded and zstd compression is used, so that selective reads through :meth:`scan` and
+        :meth:`query` skip most of the file. A dict overrides single options of the optimized layout (sort_by,
+        row_group_size, compression, compression_level, dictionary_columns). The layout used is recorded in the
+        file metadata under the 'pyspainmobility.layout' key.
     Examples
     --------
     >>> from pyspainmobility import Mobility
@@ -74,6 +197,9 @@ class Mobility:
         output_directory: str = None,
         use_dask: bool = False,
         backend: str = "arrow",
+        engine: str = None,
+        cache: bool = False,
+        parquet_layout="default",
     ):
         self.version = version
         self.zones = zones
@@ -81,6 +207,27 @@ class Mobility:
         self.output_directory = output_directory
         self.use_dask = use_dask
         self.backend = str(backend).lower()
+        if engine is None:
+            engine = "dask" if use_dask else "sequential"
+        self.engine = str(engine).lower()
+        self._planned_workers = {}
+        self._zone_attributes_df = None
+        self.cache = cache
+        if isinstance(parquet_layout, dict):
+            unknown = [key for key in parquet_layout if key not in _OPTIMIZED_PARQUET_LAYOUT]
+            if unknown:
+                raise ValueError(
+                    f"Unknown parquet_layout option(s) {unknown}. Options: {', '.join(_OPTIMIZED_PARQUET_LAYOUT)}"
+                )
+            self.parquet_layout = {**_OPTIMIZED_PARQUET_LAYOUT, **parquet_layout}
+        elif parquet_layout == "optimized":
+            self.parquet_layout = dict(_OPTIMIZED_PARQUET_LAYOUT)
+        elif parquet_layout in (None, "default"):
+            self.parquet_layout = None
+        else:
+            raise ValueError("parquet_layout must be 'default', 'optimized' or a dict of layout options")
+        if self.parquet_layout is not None and pq is None:
+            raise ImportError("pyarrow is not installed. Please install pyarrow to use parquet_layout")
 
         if self.backend not in {"arrow", "pandas"}:
             raise ValueError("backend must be either 'arrow' or 'pandas'")
@@ -94,8 +241,14 @@ class Mobility:
             )
             self.backend = "pandas"
 
+        if self.engine != "auto" and self.engine not in _ENGINES:
+            raise ValueError(
+                "engine must be one of the following: auto, sequential, threads, processes, streaming, dask"
+            )
         if self.use_dask and dd is None:
             raise ImportError("Dask is not installed. Please install dask to use use_dask=True")
+        if self.engine == "dask" and dd is None:
+            raise ImportError("Dask is not installed. Please install dask to use engine='dask'")
 
         utils.zone_assert(zones, version)
         utils.version_assert(version)
@@ -244,6 +397,17 @@ class Mobility:
             )
             return Mobility._read_pipe_file_pandas(filepath, dtype=dtype)
 
+        try:
+            return Mobility._read_pipe_table(filepath, dtype=dtype).to_pandas(types_mapper=pd.ArrowDtype)
+        except Exception as exc:
+            print(f"[warn] Arrow parser failed for {filepath}: {exc}. Falling back to pandas parser.")
+            return Mobility._read_pipe_file_pandas(filepath, dtype=dtype)
+
+    @staticmethod
+    def _read_pipe_table(filepath: str, dtype: dict = None):
+        """
+        Parse a MITMA pipe-separated file into a ``pyarrow.Table``.
+        """
         column_types = None
         aligned_dtype = Mobility._align_dtype_map_to_source_columns(filepath, dtype)
         if aligned_dtype:
@@ -252,26 +416,21 @@ class Mobility:
                 if str(typ).lower() == "string":
                     column_types[col] = pa.string()
 
-        try:
-            table = pacsv.read_csv(
-                filepath,
-                read_options=pacsv.ReadOptions(encoding="utf8", use_threads=True),
-                parse_options=pacsv.ParseOptions(delimiter="|"),
-                convert_options=pacsv.ConvertOptions(
-                    strings_can_be_null=True,
-                    column_types=column_types,
-                ),
-            )
-            return table.to_pandas(types_mapper=pd.ArrowDtype)
-        except Exception as exc:
-            print(f"[warn] Arrow parser failed for {filepath}: {exc}. Falling back to pandas parser.")
-            return Mobility._read_pipe_file_pandas(filepath, dtype=dtype)
+        return pacsv.read_csv(
+            filepath,
+            read_options=pacsv.ReadOptions(encoding="utf8", use_threads=True),
+            parse_options=pacsv.ParseOptions(delimiter="|"),
+            convert_options=pacsv.ConvertOptions(
+                strings_can_be_null=True,
+                column_types=column_types,
+            ),
+        )
 
     def _finalize_backend_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Normalize output dtypes according to the selected backend.
         """
-        if self.backend != "arrow" or df is None:
+        if self.backend != "arrow" or df is None or (pa is not None and isinstance(df, pa.Table)):
             return df
         try:
             return df.convert_dtypes(dtype_backend="pyarrow")
@@ -359,48 +518,205 @@ class Mobility:
         compacted = normalized.where(integer_like, normalized.str.replace(".", "", regex=False))
         return pd.to_numeric(compacted, errors="coerce").astype("Int64")
 
-    def _process_single_od_file(self, filepath, keep_activity, social_agg):
-        """Extract common OD file processing logic."""
-        
+    @staticmethod
+    def _normalize_series(series: pd.Series, kind: str) -> pd.Series:
+        """
+        Apply one of the normalizer kinds used in ``DATASET_SPECS``.
+        """
+        if kind == "date":
+            return Mobility._normalize_date_series(series)
+        if kind == "identifier":
+            return Mobility._normalize_identifier_series(series)
+        if kind == "numeric":
+            return Mobility._to_numeric(series, strip_thousands=True)
+        if kind == "hour":
+            hour_numeric = Mobility._to_numeric(series)
+            if hour_numeric.notna().all():
+                return hour_numeric.astype(int)
+            return series.astype("string").str.strip()
+        if kind == "category":
+            return series.astype("string").str.strip().str.replace(r"\.0+$", "", regex=True)
+        return series
+
+    @staticmethod
+    def _normalize_filter_column(dataset: str, column: str, series: pd.Series) -> pd.Series:
+        """
+        Bring raw values of a filter column to the vocabulary of the output
+        data, so filters can be written with the final labels and ids.
+        """
+        spec = DATASET_SPECS[dataset]
+        kind = spec["normalizers"].get(column)
+        if kind == "hour":
+            hour_numeric = Mobility._to_numeric(series)
+            return hour_numeric.astype("Int64").astype(object).where(hour_numeric.notna(), series.astype("string").str.strip())
+        if kind is not None:
+            return Mobility._normalize_series(series, kind)
+        normalized = series.astype("string").str.strip()
+        if column in spec["labels"]:
+            normalized = normalized.replace(spec["labels"][column])
+        return normalized
+
+    @staticmethod
+    def _prepare_filters(filters: Optional[dict], dataset: str) -> Optional[dict]:
+        """
+        Validate a ``filters`` argument and turn every value into a set of
+        allowed values. Scalars are accepted as single values and ranges
+        (e.g. ``range(7, 10)`` for hours) as collections.
+        """
+        if not filters:
+            return None
+
+        spec = DATASET_SPECS[dataset]
+        allowed_columns = spec["filters"]
+        unknown = [col for col in filters if col not in allowed_columns]
+        if unknown:
+            raise ValueError(
+                f"Unsupported filter column(s) {unknown}. filters must use the following columns: {', '.join(allowed_columns)}"
+            )
+
+        prepared = {}
+        for column, values in filters.items():
+            if isinstance(values, (str, int, np.integer)) or not hasattr(values, "__iter__"):
+                values = [values]
+            kind = spec["normalizers"].get(column)
+            if kind == "hour":
+                prepared[column] = {int(v) if str(v).strip().isdigit() else str(v).strip() for v in values}
+            elif kind in ("date", "identifier"):
+                # Accept the same raw spellings the source files use (e.g. '20220101', '01001.0').
+                normalized = Mobility._normalize_series(pd.Series([str(v) for v in values]), kind)
+                prepared[column] = set(normalized.dropna().tolist())
+            else:
+                prepared[column] = {str(v).strip() for v in values}
+        return prepared
+
+    def _apply_filters(self, df: pd.DataFrame, filters: Optional[dict], dataset: str) -> pd.DataFrame:
+        """
+        Keep the rows matching every filter. Each filter column is normalised
+        once per distinct raw value rather than once per row, so filtering is
+        cheap enough to run before the full normalisation and grouping.
+        """
+        if not filters:
+            return df
+
+        mask = np.ones(len(df), dtype=bool)
+        for column, allowed in filters.items():
+            if column not in df.columns:
+                return df.iloc[0:0]
+            codes, uniques = pd.factorize(df[column])
+            normalized = self._normalize_filter_column(dataset, column, pd.Series(uniques))
+            keep = normalized.isin(allowed).fillna(False).to_numpy(dtype=bool)
+            column_mask = np.zeros(len(df), dtype=bool)
+            valid = codes >= 0
+            column_mask[valid] = keep[codes[valid]]
+            mask &= column_mask
+        return df[mask]
+
+    @staticmethod
+    def _group_cols(dataset: str, time_resolution: str, keep_activity: bool = False, social_agg: bool = False) -> Optional[list]:
+        """
+        Group keys of a dataset at the given time resolution, or None when
+        the rows are passed through ungrouped.
+        """
+        spec = DATASET_SPECS[dataset]
+        if not spec["group_native"] and time_resolution in ("hour", "day"):
+            return None
+
+        group_cols = [key for key in _TIME_KEYS[time_resolution] if spec["hourly"] or key != "hour"]
+        group_cols += spec["dimensions"]
+        flags = {"keep_activity": keep_activity, "social_agg": social_agg}
+        for flag, columns in spec["optional_dimensions"].items():
+            if flags.get(flag):
+                group_cols += columns
+        return group_cols
+
+    @staticmethod
+    def _period_columns(dates: pd.Series, time_resolution: str) -> dict:
+        """
+        Derive the period columns ('week', 'month', 'day_type') of a
+        YYYY-MM-DD date series. Dates are parsed once per distinct value.
+        """
+        codes, uniques = pd.factorize(dates)
+        parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format="%Y-%m-%d", errors="coerce")
+        labels = {}
+        if time_resolution == "week":
+            iso = parsed.dt.isocalendar()
+            labels["week"] = iso["year"].astype(str) + "-W" + iso["week"].astype(str).str.zfill(2)
+        if time_resolution in ("month", "day_type"):
+            labels["month"] = parsed.dt.strftime("%Y-%m")
+        if time_resolution == "day_type":
+            labels["day_type"] = pd.Series(np.where(parsed.dt.dayofweek >= 5, "weekend", "weekday"))
+        return {
+            name: pd.Series(np.asarray(values, dtype=object)[codes], index=dates.index, dtype="string")
+            for name, values in labels.items()
+        }
+
+    def _raw_file_dates(self, local_list: list) -> list:
+        """
+        Days of the requested range with a raw file, read from the
+        YYYYMMDD prefix of the file names (all the days if none has one).
+        """
+        found = set()
+        for path in local_list:
+            match = re.search(r"(\d{4})(\d{2})(\d{2})", os.path.basename(path))
+            if match:
+                found.add("-".join(match.groups()))
+        if not found:
+            return list(self.dates)
+        return [date for date in self.dates if date in found]
+
+    def _average_day_types(self, df: pd.DataFrame, measures: list, dates: list = None) -> pd.DataFrame:
+        """
+        Turn day-type sums into averages per processed day (days of ``dates``,
+        by default the requested range, without flows count as zero).
+        """
+        calendar = pd.DataFrame(self._period_columns(pd.Series(self.dates if dates is None else dates, dtype=object), "day_type"))
+        n_days = calendar.groupby(["month", "day_type"]).size().rename("_n_days")
+        if pa is not None and isinstance(df, pa.Table):
+            n_days = pa.Table.from_pandas(n_days.reset_index(), preserve_index=False)
+            n_days = n_days.cast(pa.schema([("month", pa.string()), ("day_type", pa.string()), ("_n_days", pa.float64())]))
+            names = df.column_names
+            df = df.join(n_days, keys=["month", "day_type"])
+            for measure in measures:
+                df = df.set_column(
+                    df.column_names.index(measure), measure, pc.divide(df[measure].cast(pa.float64()), df["_n_days"])
+                )
+            return df.select(names).sort_by([(col, "ascending") for col in names if col not in measures])
+        df = df.join(n_days, on=["month", "day_type"])
+        df[measures] = df[measures].div(df["_n_days"], axis=0)
+        return df.drop(columns="_n_days")
+
+    def _process_single_file(
+        self,
+        filepath: str,
+        dataset: str,
+        group_cols: Optional[list] = None,
+        filters: Optional[dict] = None,
+        time_resolution: str = None,
+    ):
+        """
+        Parse, filter, normalize and (optionally) group one raw file following
+        its specification in ``DATASET_SPECS``.
+        """
+        spec = DATASET_SPECS[dataset]
         print(f"Processing file: {filepath}")
-        
-        # Check if file exists and get size
+
         if not os.path.exists(filepath):
             print(f"[ERROR] File does not exist: {filepath}")
             return None
-        
-        file_size = os.path.getsize(filepath)
-        #print(f"File size: {file_size} bytes")
-        
-        if file_size == 0:
+
+        if os.path.getsize(filepath) == 0:
             print(f"[warn] {os.path.basename(filepath)} is actually empty (0 bytes), skipped")
             return None
-        
+
         try:
             print(f"Reading {'gzipped' if filepath.endswith('.gz') else 'regular'} file...")
-            df = self._read_pipe_file(
-                filepath,
-                dtype={
-                    "fecha": "string",
-                    "periodo": "string",
-                    "origen": "string",
-                    "destino": "string",
-                    "actividad_origen": "string",
-                    "actividad_destino": "string",
-                    "residencia": "string",
-                    "renta": "string",
-                    "edad": "string",
-                    "sexo": "string",
-                    "viajes": "string",
-                    "viajes_km": "string",
-                },
-            )
+            df = self._read_pipe_file(filepath, dtype={source: "string" for source in spec["columns"]})
             df = self._normalize_input_columns(df)
 
             if df.empty:
                 print(f"[warn] {os.path.basename(filepath)} contains no data rows, skipped")
                 return None
-                
+
         except EmptyDataError:
             print(f"[warn] {os.path.basename(filepath)} triggered EmptyDataError, skipped")
             return None
@@ -408,96 +724,280 @@ class Mobility:
             print(f"[ERROR] Error reading {filepath}: {e}")
             return None
 
-        df.rename(
-            columns={
-                "fecha": "date",
-                "periodo": "hour",
-                "origen": "id_origin",
-                "destino": "id_destination",
-                "actividad_origen": "activity_origin",
-                "actividad_destino": "activity_destination",
-                "residencia": "residence_province_ine_code",
-                "distancia": "distance",
-                "viajes": "n_trips",
-                "viajes_km": "trips_total_length_km",
-                # socio-demo
-                "renta": "income",
-                "edad": "age",
-                "sexo": "gender",
-            },
-            inplace=True,
-        )
+        try:
+            df.rename(columns=spec["columns"], inplace=True)
 
-        required_cols = ["date", "hour", "id_origin", "id_destination", "n_trips", "trips_total_length_km"]
-        missing = [col for col in required_cols if col not in df.columns]
-        if missing:
-            print(
-                f"[warn] {os.path.basename(filepath)} missing expected columns after translation: {missing}. "
-                f"Columns found: {list(df.columns)}"
-            )
+            missing = [col for col in spec["required"] if col not in df.columns]
+            if missing:
+                print(
+                    f"[warn] {os.path.basename(filepath)} missing expected columns after translation: {missing}. "
+                    f"Columns found: {list(df.columns)}"
+                )
+                return None
+
+            df = self._apply_filters(df, filters, dataset)
+            if df.empty:
+                print(f"[warn] {os.path.basename(filepath)} has no rows matching the filters, skipped")
+                return None
+
+            for optional_col in spec["optional"]:
+                if optional_col not in df.columns:
+                    df[optional_col] = pd.NA
+
+            for column, kind in spec["normalizers"].items():
+                if column in df.columns:
+                    df[column] = self._normalize_series(df[column], kind)
+
+            df.dropna(subset=spec["dropna"], inplace=True)
+            if df.empty:
+                print(f"[warn] {os.path.basename(filepath)} has no valid rows after preprocessing, skipped")
+                return None
+
+            # map activity / gender labels
+            labels = {col: mapping for col, mapping in spec["labels"].items() if col in df.columns}
+            if labels:
+                df.replace(labels, inplace=True)
+
+            if group_cols is None:
+                return df
+
+            if time_resolution in ("week", "month", "day_type"):
+                df = df.assign(**self._period_columns(df["date"], time_resolution))
+            return df.groupby(group_cols, as_index=False, dropna=not spec["keep_na_keys"])[spec["measures"]].sum()
+        except Exception as e:
+            print(f"[ERROR] Error processing {filepath}: {e}")
             return None
 
-        for optional_col in ["activity_origin", "activity_destination", "income", "age", "gender"]:
-            if optional_col not in df.columns:
-                df[optional_col] = pd.NA
+    def _process_single_file_arrow(
+        self,
+        filepath: str,
+        dataset: str,
+        group_cols: Optional[list] = None,
+        filters: Optional[dict] = None,
+        time_resolution: str = None,
+    ):
+        """
+        Arrow counterpart of :meth:`_process_single_file` used with
+        ``return_type='arrow'``: the file is parsed, filtered, normalized and
+        grouped as a ``pyarrow.Table`` with ``pyarrow.compute`` kernels.
+        Normalizers and labels are applied to the distinct values only.
+        """
+        spec = DATASET_SPECS[dataset]
+        print(f"Processing file: {filepath}")
+
+        if not os.path.exists(filepath):
+            print(f"[ERROR] File does not exist: {filepath}")
+            return None
 
-        df["date"] = self._normalize_date_series(df["date"])
-        df["id_origin"] = self._normalize_identifier_series(df["id_origin"])
-        df["id_destination"] = self._normalize_identifier_series(df["id_destination"])
-        if "residence_province_ine_code" in df.columns:
-            df["residence_province_ine_code"] = self._normalize_identifier_series(df["residence_province_ine_code"])
+        if os.path.getsize(filepath) == 0:
+            print(f"[warn] {os.path.basename(filepath)} is actually empty (0 bytes), skipped")
+            return None
 
-        hour_numeric = self._to_numeric(df["hour"])
-        if hour_numeric.notna().all():
-            df["hour"] = hour_numeric.astype(int)
-        else:
-            df["hour"] = df["hour"].astype("string").str.strip()
+        try:
+            print(f"Reading {'gzipped' if filepath.endswith('.gz') else 'regular'} file...")
+            table = self._read_pipe_table(filepath, dtype={source: "string" for source in spec["columns"]})
+            if table.num_rows == 0:
+                print(f"[warn] {os.path.basename(filepath)} contains no data rows, skipped")
+                return None
+        except Exception as e:
+            print(f"[ERROR] Error reading {filepath}: {e}")
+            return None
 
-        df["n_trips"] = self._to_numeric(df["n_trips"], strip_thousands=True)
-        df["trips_total_length_km"] = self._to_numeric(df["trips_total_length_km"], strip_thousands=True)
+        try:
+            table = table.rename_columns([
+                spec["columns"].get(self._normalize_column_name(col), self._normalize_column_name(col))
+                for col in table.column_names
+            ])
 
-        df.dropna(
-            subset=["date", "id_origin", "id_destination", "n_trips", "trips_total_length_km"],
-            inplace=True,
-        )
-        if df.empty:
-            print(f"[warn] {os.path.basename(filepath)} has no valid rows after preprocessing, skipped")
+            missing = [col for col in spec["required"] if col not in table.column_names]
+            if missing:
+                print(
+                    f"[warn] {os.path.basename(filepath)} missing expected columns after translation: {missing}. "
+                    f"Columns found: {table.column_names}"
+                )
+                return None
+
+            if filters:
+                mask = pa.array(np.ones(table.num_rows, dtype=bool))
+                for column, allowed in filters.items():
+                    if column not in table.column_names:
+                        mask = pa.array(np.zeros(table.num_rows, dtype=bool))
+                        break
+                    keep = self._map_arrow_values(
+                        table[column],
+                        lambda uniques, column=column, allowed=allowed: self._normalize_filter_column(
+                            dataset, column, uniques
+                        ).isin(allowed).fillna(False),
+                    )
+                    mask = pc.and_(mask, pc.fill_null(keep, False))
+                table = table.filter(mask)
+                if table.num_rows == 0:
+                    print(f"[warn] {os.path.basename(filepath)} has no rows matching the filters, skipped")
+                    return None
+
+            for optional_col in spec["optional"]:
+                if optional_col not in table.column_names:
+                    table = table.append_column(optional_col, pa.nulls(table.num_rows, pa.string()))
+
+            for column, kind in spec["normalizers"].items():
+                if column not in table.column_names:
+                    continue
+                if kind == "numeric":
+                    normalized = self._arrow_to_numeric(table[column])
+                else:
+                    normalized = self._map_arrow_values(
+                        table[column], lambda uniques, kind=kind: self._normalize_series(uniques, kind)
+                    )
+                table = table.set_column(table.column_names.index(column), column, normalized)
+
+            valid = pa.array(np.ones(table.num_rows, dtype=bool))
+            for column in spec["dropna"]:
+                valid = pc.and_(valid, pc.is_valid(table[column]))
+            table = table.filter(valid)
+            if table.num_rows == 0:
+                print(f"[warn] {os.path.basename(filepath)} has no valid rows after preprocessing, skipped")
+                return None
+
+            # map activity / gender labels
+            for column, mapping in spec["labels"].items():
+                if column in table.column_names:
+                    labelled = self._map_arrow_values(table[column], lambda uniques, mapping=mapping: uniques.replace(mapping))
+                    table = table.set_column(table.column_names.index(column), column, labelled)
+
+            if group_cols is None:
+                return table
+
+            if time_resolution in ("week", "month", "day_type"):
+                encoded = pc.dictionary_encode(table["date"].combine_chunks())
+                uniques = pd.Series(encoded.dictionary.to_pylist(), dtype="string")
+                for name, values in self._period_columns(uniques, time_resolution).items():
+                    table = table.append_column(name, pa.array(values, type=pa.string()).take(encoded.indices))
+            if not spec["keep_na_keys"]:
+                valid = pa.array(np.ones(table.num_rows, dtype=bool))
+                for column in group_cols:
+                    valid = pc.and_(valid, pc.is_valid(table[column]))
+                table = table.filter(valid)
+            return self._group_table(table, group_cols, spec["measures"])
+        except Exception as e:
+            print(f"[ERROR] Error processing {filepath}: {e}")
             return None
 
-        #  map activity / gender labels
-        df.replace(
-            {
-                "activity_origin": {
-                    "casa": "home",
-                    "frecuente": "other_frequent",
-                    "trabajo_estudio": "work_or_study",
-                    "no_frecuente": "other_non_frequent",
-                },
-                "activity_destination": {
-                    "casa": "home",
-                    "frecuente": "other_frequent",
-                    "trabajo_estudio": "work_or_study",
-                    "no_frecuente": "other_non_frequent",
-                },
-                "gender": {"hombre": "male", "mujer": "female"},
-            },
-            inplace=True,
-        )
+    @staticmethod
+    def _map_arrow_values(column, fn):
+        """
+        Apply ``fn`` (a function of a pandas string series) to the distinct
+        values of an Arrow column and broadcast the result back to the rows
+        through the dictionary indices.
+        """
+        if isinstance(column, pa.ChunkedArray):
+            column = column.combine_chunks()
+        encoded = pc.dictionary_encode(column.cast(pa.string()))
+        mapped = fn(pd.Series(encoded.dictionary.to_pylist(), dtype="string"))
+        return pa.array(mapped, from_pandas=True).take(encoded.indices)
 
-        # ------------------------------------------------------
-        # BUILD GROUP-BY KEY ACCORDING TO THE TWO FLAGS
-        # ------------------------------------------------------
-        group_cols = ["date", "hour", "id_origin", "id_destination"]
-        if keep_activity:
-            group_cols += ["activity_origin", "activity_destination"]
-        if social_agg:
-            group_cols += ["income", "age", "gender"]
+    @staticmethod
+    def _arrow_to_numeric(column):
+        """
+        ``pyarrow.compute`` version of ``_to_numeric(strip_thousands=True)``.
+        """
+        text = pc.utf8_trim_whitespace(column.cast(pa.string()))
+        text = pc.replace_substring(text, ",", ".")
+        if pc.any(pc.match_substring_regex(text, r"^[+-]?\d{1,3}(?:\.\d{3}){2,}$")).as_py():
+            thousands = pc.fill_null(pc.match_substring_regex(text, r"^[+-]?\d{1,3}(?:\.\d{3})+$"), False)
+            text = pc.if_else(thousands, pc.replace_substring(text, ".", ""), text)
+        valid = pc.fill_null(pc.match_substring_regex(text, r"^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$"), False)
+        text = pc.if_else(valid, text, pa.scalar(None, pa.string()))
+        if pc.any(pc.match_substring_regex(text, r"[.eE]")).as_py():
+            return text.cast(pa.float64())
+        return text.cast(pa.int64())
 
-        df = df.groupby(group_cols, as_index=False)[["n_trips", "trips_total_length_km"]].sum()
-        
-        return df
+    @staticmethod
+    def _group_table(table, group_cols: list, measures: list):
+        """
+        Sum ``measures`` over ``group_cols`` of a ``pyarrow.Table``, sorted by
+        the group keys like pandas' groupby.
+        """
+        grouped = table.group_by(group_cols).aggregate([(measure, "sum") for measure in measures])
+        grouped = grouped.select(group_cols + [f"{measure}_sum" for measure in measures])
+        grouped = grouped.rename_columns(group_cols + measures)
+        return grouped.sort_by([(col, "ascending") for col in group_cols])
 
-    def get_od_data(self, keep_activity: bool = False, return_df: bool = False,  social_agg: bool = False,):
+    @staticmethod
+    def _concat_results(results: list):
+        if pa is not None and isinstance(results[0], pa.Table):
+            return pa.concat_tables(results, promote_options="permissive")
+        return results[0] if len(results) == 1 else pd.concat(results, ignore_index=True)
+
+    @staticmethod
+    def _combine_results(result, group_cols: list, measures: list):
+        if pa is not None and isinstance(result, pa.Table):
+            return Mobility._group_table(result, group_cols, measures)
+        return result.groupby(group_cols, as_index=False, dropna=False)[measures].sum()
+
+    def _process_single_od_file(self, filepath, keep_activity, social_agg, filters: Optional[dict] = None, time_resolution: str = "hour"):
+        """Extract common OD file processing logic."""
+        group_cols = self._group_cols("od", time_resolution, keep_activity=keep_activity, social_agg=social_agg)
+        return self._process_single_file(filepath, "od", group_cols, filters, time_resolution)
+
+    def _get_dataset(
+        self,
+        dataset: str,
+        return_df: bool = False,
+        filters: Optional[dict] = None,
+        time_resolution: str = None,
+        keep_activity: bool = False,
+        social_agg: bool = False,
+        return_type: str = "pandas",
+        aggregates: bool = False,
+    ):
+        """
+        Download, process, combine and save a dataset described in
+        ``DATASET_SPECS``. Shared by all the get_* methods.
+        """
+        if return_type not in ("pandas", "arrow"):
+            raise ValueError("return_type must be either 'pandas' or 'arrow'")
+        if return_type == "arrow" and (pa is None or pacsv is None):
+            raise ImportError("pyarrow is not installed. Please install pyarrow to use return_type='arrow'")
+        spec = DATASET_SPECS[dataset]
+        m_type = spec["m_types"].get(self.version)
+        if m_type is None:
+            raise Exception(spec["unavailable"])
+
+        allowed_resolutions = _TIME_RESOLUTIONS if spec["hourly"] else _TIME_RESOLUTIONS[1:]
+        if time_resolution is None:
+            time_resolution = allowed_resolutions[0]
+        if time_resolution not in allowed_resolutions:
+            raise ValueError(f"time_resolution must be one of the following: {', '.join(allowed_resolutions)}")
+        filters = self._prepare_filters(filters, dataset)
+        group_cols = self._group_cols(dataset, time_resolution, keep_activity=keep_activity, social_agg=social_agg)
+
+        local_list = self._donwload_helper(m_type)
+        # Day-type averages divide by the days actually downloaded and kept by the date filter.
+        dates = self._raw_file_dates(local_list)
+        if filters and "date" in filters:
+            dates = [date for date in dates if date in filters["date"]]
+        # Hourly unfiltered OD ingests keep the existing OD and zone time-series stores up to date.
+        feeds_stores = dataset == "od" and time_resolution == "hour" and not filters
+        print(f"Generating parquet file for {spec['label']}....")
+        engine = self._select_engine(m_type, return_df, keep_activity=keep_activity, social_agg=social_agg)
+        process_fn = self._process_single_file_arrow if return_type == "arrow" else self._process_single_file
+        return self._run_pipeline(
+            process_fn, local_list, m_type, return_df, engine,
+            dataset, group_cols, filters, time_resolution,
+            group_cols=group_cols,
+            measures=spec["measures"],
+            time_resolution=time_resolution,
+            return_type=return_type,
+            aggregates=aggregates,
+            dates=dates,
+            zone_timeseries=feeds_stores and os.path.exists(os.path.join(self._zone_timeseries_path(), "store.json")),
+            od_store=[
+                value for value in spec["measures"]
+                if feeds_stores and os.path.exists(os.path.join(self._od_store_path(value), "store.json"))
+            ],
+        )
+
+    def get_od_data(self, keep_activity: bool = False, return_df: bool = False,  social_agg: bool = False, filters: dict = None, time_resolution: str = "hour", return_type: str = "pandas", aggregates: bool = False):
         """
         Function to download and save the origin-destination data.
 
@@ -517,7 +1017,37 @@ class Mobility:
         • age:  0 to 24, 25 to 44, 45 to 64, >65 yrs, NA  
         • gender:  male, female, NA  
 
-        
+        filters : dict
+            Default value is None. Keep only the rows matching all the given filters. Keys are output column names
+            (date, hour, id_origin, id_destination, activity_origin, activity_destination, residence_province_ine_code,
+            income, age, gender) and values are collections of allowed values, e.g.
+            {'id_origin': {'01001', '01002'}, 'hour': range(7, 10), 'activity_destination': ['work_or_study']}.
+            Filters are applied right after parsing, before normalisation and grouping, so the processing time and
+            the output size scale with the requested slice.
+
+        time_resolution : str
+            Default value is 'hour'. Temporal granularity of the output, applied while grouping each file and when
+            combining the files. Must be one of the following:
+            • hour: one row per 'date' and 'hour' (original resolution)
+            • day: daily totals per 'date'
+            • week: totals per ISO 'week' (e.g. '2022-W01')
+            • month: totals per 'month' (e.g. '2022-01')
+            • day_type: average day profile per 'month', 'day_type' ('weekday' or 'weekend') and 'hour', i.e. the
+            hourly totals divided by the number of days of that type in the requested range.
+
+        return_type : str
+            Default value is 'pandas'. Type of the data returned when return_df is True. With 'arrow' the files are
+            parsed, filtered and grouped with pyarrow.compute and a ``pyarrow.Table`` is returned (a
+            ``pyarrow.RecordBatchReader`` over the saved file with engine='streaming'), so Arrow-native tools such as
+            DuckDB or Polars can consume the result without a pandas dataframe ever being built.
+
+        aggregates : bool
+            Default value is False. If True, the following small tables are computed from every processed file in the
+            same pass and saved next to the output (see :meth:`read_od_aggregate`), at the requested time resolution:
+            • by_origin / by_destination: trips and kilometres per origin / destination zone
+            • by_hour: trips and kilometres per hour (hourly resolutions only)
+            • daily_totals: trips, kilometres, intra-zone trips and intra-zone share of the trips
+
         Examples
         --------
 
@@ -536,412 +1066,1949 @@ class Mobility:
         3  2023-04-01     0     01001          01059   42.835             512.278674
         4  2023-04-01     0     01001          48036    2.750             147.724000
         """
+        if self.version == 1:
+            keep_activity, social_agg = False, False
+        return self._get_dataset(
+            "od",
+            return_df=return_df,
+            filters=filters,
+            time_resolution=time_resolution,
+            keep_activity=keep_activity,
+            social_agg=social_agg,
+            return_type=return_type,
+            aggregates=aggregates,
+        )
+
+    def get_overnight_stays_data(self, return_df: bool = False, filters: dict = None, time_resolution: str = "day", return_type: str = "pandas"):
+        """
+        Function to download and save the overnight stays data.
 
-        if self.version == 2:
-            m_type = "Viajes"
-            local_list = self._donwload_helper(m_type)
-            temp_dfs = []
-            print("Generating parquet file for ODs....")
-            
-            if self.use_dask:
-                # Use Dask for processing
-                return self._process_od_data_dask(local_list, m_type, keep_activity, social_agg, return_df)
-            else:
-                # Original pandas processing using extracted method
-                for f in tqdm.tqdm(local_list):
-                    result = self._process_single_od_file(f, keep_activity, social_agg)
-                    if result is not None:
-                        temp_dfs.append(result)
-
-                if not temp_dfs:
-                    print("No valid data found")
-                    return None
+        Parameters
+        ----------
+        return_df : bool
+            Default value is False. If True, the function will return the dataframe in addition to saving it to a file.
+        filters : dict
+            Default value is None. Keep only the rows matching all the given filters, applied right after parsing.
+            Keys are output column names (date, residence_area, overnight_stay_area) and values are collections of allowed values.
+        time_resolution : str
+            Default value is 'day'. Temporal granularity of the output. Must be one of the following: day (original
+            resolution), week (totals per ISO 'week'), month (totals per 'month') or day_type (average day per
+            'month' and 'day_type', i.e. 'weekday' or 'weekend').
+        return_type : str
+            Default value is 'pandas'. Type of the data returned when return_df is True: 'pandas' or 'arrow' (a
+            ``pyarrow.Table``, see :meth:`get_od_data`).
+        Examples
+        --------
 
-                print("Concatenating all the dataframes....")
-                df = temp_dfs[0] if len(temp_dfs) == 1 else pd.concat(temp_dfs)
-                df = self._finalize_backend_dataframe(df)
+        >>> from pyspainmobility import Mobility
+        >>> # instantiate the object
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-06', output_directory='/Desktop/spain/data/')
+        >>> # download and save the overnight stays data and return the dataframe
+        >>> df = mobility_data.get_overnight_stays_data( return_df=True)
+        >>> print(df.head())
+           date residence_area overnight_stay_area    people
+        0  2023-04-01          01001               01001  2716.303
+        1  2023-04-01          01001            01009_AM    14.088
+        2  2023-04-01          01001            01017_AM     2.476
+        3  2023-04-01          01001            01058_AM    18.939
+        4  2023-04-01          01001               01059   144.118
+        """
+        return self._get_dataset(
+            "os", return_df=return_df, filters=filters, time_resolution=time_resolution, return_type=return_type
+        )
 
-                self._saving_parquet(df, m_type)
-                return df if return_df else None
+    def get_number_of_trips_data(self, return_df: bool = False, filters: dict = None, time_resolution: str = "day", return_type: str = "pandas"):
+        """
+        Function to download and save the data regarding the number of trips to an area of certain demographic categories.
 
-        elif self.version == 1:
-            m_type = "maestra1"
-            local_list = self._donwload_helper(m_type)
-            temp_dfs = []
-            print("Generating parquet file for ODs....")
-
-            if self.use_dask:
-                # Use Dask for processing
-                return self._process_od_data_dask(local_list, m_type, False, False, return_df)
-            else:
-                # Original pandas processing using extracted method
-                for f in tqdm.tqdm(local_list):
-                    result = self._process_single_od_file(f, False, False)
-                    if result is not None:
-                        temp_dfs.append(result)
-
-                if not temp_dfs:
-                    print("No valid data found")
-                    return None
+        Parameters
+        ----------
+        return_df : bool
+            Default value is False. If True, the function will return the dataframe in addition to saving it to a file.
+        filters : dict
+            Default value is None. Keep only the rows matching all the given filters, applied right after parsing.
+            Keys are output column names (date, overnight_stay_area, age, gender, number_of_trips) and values are collections of allowed values.
+        time_resolution : str
+            Default value is 'day'. Temporal granularity of the output. Must be one of the following: day (original
+            resolution), week (totals per ISO 'week'), month (totals per 'month') or day_type (average day per
+            'month' and 'day_type', i.e. 'weekday' or 'weekend').
+        return_type : str
+            Default value is 'pandas'. Type of the data returned when return_df is True: 'pandas' or 'arrow' (a
+            ``pyarrow.Table``, see :meth:`get_od_data`).
+        Examples
+        --------
 
-                print("Concatenating all the dataframes....")
-                df = temp_dfs[0] if len(temp_dfs) == 1 else pd.concat(temp_dfs)
-                df = self._finalize_backend_dataframe(df)
+        >>> from pyspainmobility import Mobility
+        >>> # instantiate the object
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-06', output_directory='/Desktop/spain/data/')
+        >>> # download and save the overnight stays data and return the dataframe
+        >>> df = mobility_data.get_number_of_trips_data( return_df=True)
+        >>> print(df.head())
+        date overnight_stay_area   age  gender number_of_trips   people
+        0  2023-04-01               01001  0-25    male               0  128.457
+        1  2023-04-01               01001  0-25    male               1   38.537
+        2  2023-04-01               01001  0-25    male               2  129.136
+        3  2023-04-01               01001  0-25    male              2+  129.913
+        4  2023-04-01               01001  0-25  female               0  188.744
+        """
+        return self._get_dataset(
+            "nt", return_df=return_df, filters=filters, time_resolution=time_resolution, return_type=return_type
+        )
 
-                self._saving_parquet(df, m_type)
-                return df if return_df else None
+    def scan(self, mobility_type: str = "od", filters=None, columns: list = None, source=None):
+        """
+        Lazily scan the parquet output written by a get_* method, pushing filters and the column selection down
+        to the parquet reader. Only the row groups whose statistics can match the filters and the requested columns
+        are read.
 
-        return None
+        Parameters
+        ----------
+        mobility_type : str
+            Default value is 'od'. The dataset to read. Must be one of the following: od, origin-destination, os, overnight_stays, nt, number_of_trips
+        filters : dict or pyarrow.compute.Expression
+            Default value is None. Dictionary keyed by output column name (e.g. date, hour, id_origin, id_destination,
+            activity_origin, income, age, gender, residence_area, overnight_stay_area). Values are collections of
+            allowed values, a single value, or a ``slice(start, stop)`` for an inclusive range, e.g.
+            {'id_origin': '41091', 'date': slice('2022-01-01', '2022-03-31'), 'hour': range(7, 10)}.
+            A ``pyarrow.compute.Expression`` is used as is.
+        columns : list
+            Default value is None. The columns to read. If None, all columns are read.
+        source : str or list
+            Default value is None. Parquet file(s) or folder to read. If not specified, the output file of this
+            object's dataset, zoning and dates is used.
+
+        Returns
+        -------
+        pyarrow.dataset.Scanner
+            Lazy scanner; call ``to_table()``, ``to_batches()`` or ``to_reader()`` to consume it.
 
-    def _process_od_data_dask(self, local_list, m_type, keep_activity, social_agg, return_df):
-        """Process OD data using Dask for better performance with large datasets """
-        print("Processing with Dask...")
-        
-        if delayed is None:
-            raise ImportError("Dask delayed is not available")
-        
-        @delayed
-        def process_single_file(filepath):
-            return self._process_single_od_file(filepath, keep_activity, social_agg)
-        
-        # Create delayed tasks for each file
-        delayed_tasks = [process_single_file(f) for f in local_list]
-        
-        # Compute all delayed tasks
-        try:
-            processed_dfs = dd.compute(*delayed_tasks)
-        except Exception as e:
-            print(f"Dask computation failed: {e}")
-            print("Falling back to pandas processing...")
-            # Fallback using the same processing method
-            processed_dfs = []
-            for f in tqdm.tqdm(local_list):
-                result = self._process_single_od_file(f, keep_activity, social_agg)
-                if result is not None:
-                    processed_dfs.append(result)
-        
-        # Filter out None results and concatenate
-        valid_dfs = [df for df in processed_dfs if df is not None]
-        
-        if not valid_dfs:
-            print("No valid data found")
-            return None
-        
-        print("Concatenating results...")
-        df = pd.concat(valid_dfs, ignore_index=True)
-        df = self._finalize_backend_dataframe(df)
-        
-        self._saving_parquet(df, m_type)
-        return df if return_df else None
+        Examples
+        --------
 
-    def _process_single_overnight_file(self, filepath: str):
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-12-31')
+        >>> mobility_data.get_od_data()
+        >>> scanner = mobility_data.scan('od', filters={'id_origin': '41091'}, columns=['date', 'id_destination', 'n_trips'])
+        >>> table = scanner.to_table()
         """
-        Parse and normalize one overnight stays file.
+        if pads is None:
+            raise ImportError("pyarrow is not installed. Please install pyarrow to use scan() and query()")
+
+        dataset = self._open_output_dataset(mobility_type, source)
+        if columns is not None:
+            unknown = [col for col in columns if col not in dataset.schema.names]
+            if unknown:
+                raise ValueError(f"Unknown column(s) {unknown}. Available columns: {', '.join(dataset.schema.names)}")
+        expression = self._filters_to_expression(filters, dataset.schema)
+        return dataset.scanner(columns=columns, filter=expression)
+
+    def query(self, mobility_type: str = "od", filters=None, columns: list = None, source=None) -> pd.DataFrame:
         """
-        try:
-            df = self._read_pipe_file(
-                filepath,
-                dtype={
-                    "fecha": "string",
-                    "zona_residencia": "string",
-                    "zona_pernoctacion": "string",
-                    "personas": "string",
-                },
-            )
-            df = self._normalize_input_columns(df)
-            if df.empty:
-                return None
+        Read a filtered selection of a stored output into a dataframe. Same parameters as :meth:`scan`.
 
-            df.rename(
-                columns={
-                    "fecha": "date",
-                    "zona_residencia": "residence_area",
-                    "zona_pernoctacion": "overnight_stay_area",
-                    "personas": "people",
-                },
-                inplace=True,
-            )
+        Examples
+        --------
 
-            required_cols = ["date", "residence_area", "overnight_stay_area", "people"]
-            missing = [col for col in required_cols if col not in df.columns]
-            if missing:
-                print(
-                    f"[warn] {os.path.basename(filepath)} missing expected columns after translation: {missing}. "
-                    f"Columns found: {list(df.columns)}"
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-12-31')
+        >>> df = mobility_data.query('od', filters={'id_origin': '41091', 'hour': range(7, 10)})
+        """
+        table = self.scan(mobility_type, filters=filters, columns=columns, source=source).to_table()
+        df = table.to_pandas(types_mapper=pd.ArrowDtype) if self.backend == "arrow" else table.to_pandas()
+        return self._finalize_backend_dataframe(df)
+
+    def reaggregate(self, to_zones: str, mobility_type: str = "od", data=None, return_df: bool = False):
+        """
+        Roll data of this object's zoning up to a coarser zoning (e.g. districts to municipalities or large urban areas)
+        without downloading and parsing the files of the coarser zoning.
+
+        The zone ids are translated through :meth:`Zones.map_ids` (each distinct id is mapped once and the result is
+        gathered by integer code) and the rows are grouped by every non-measure column, summing the measures. Flows
+        between zones merged into the same coarser zone become intra-zone flows. Ids without a relation (e.g. foreign
+        origins) are kept as they are. Note that MITMA publishes each zoning from its own estimates, so the rolled-up
+        figures may differ slightly from the ones of the coarser zoning files.
+
+        Parameters
+        ----------
+        to_zones : str
+            The zoning to roll the data up to. Must be coarser than this object's zoning: municipalities or large urban
+            areas (version 2 only), with the same aliases as the ``zones`` argument.
+        mobility_type : str
+            Default value is 'od'. The dataset to roll up. Must be one of the following: od, origin-destination, os, overnight_stays, nt, number_of_trips
+        data : pandas.DataFrame or pyarrow.Table
+            Default value is None. Data as returned by the corresponding get_* method. If None, its stored output for
+            this object's zoning and dates is read.
+        return_df : bool
+            Default value is False. If True, the rolled-up data is returned as a pandas DataFrame. It is always saved
+            as '{m_type}_{to_zones}_{start_date}_{end_date}_v{version}_from_{zones}.parquet' in the output directory.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='districts', start_date='2022-01-01', end_date='2022-01-07')
+        >>> mobility_data.get_od_data()
+        >>> municipal = mobility_data.reaggregate('municipalities', return_df=True)
+        >>> gau = mobility_data.reaggregate('gau', return_df=True)
+        """
+        from pyspainmobility.zones.zones import Zones, _ZONE_LEVELS
+
+        utils.mobility_assert(mobility_type)
+        m_type = utils.mobility_type_normalization(mobility_type, self.version)
+        dataset = next(key for key, spec in DATASET_SPECS.items() if spec["m_types"].get(self.version) == m_type)
+        spec = DATASET_SPECS[dataset]
+
+        utils.zone_assert(to_zones, self.version)
+        source_zones = utils.zone_normalization(self.zones)
+        target_zones = utils.zone_normalization(to_zones)
+        order = list(_ZONE_LEVELS)
+        if order.index(target_zones) <= order.index(source_zones):
+            raise ValueError(f"to_zones must be a coarser zoning than {self.zones}")
+
+        if data is None:
+            data = self._open_output_dataset(mobility_type).to_table()
+        if pa is not None and isinstance(data, pa.Table):
+            data = data.to_pandas()
+        missing = [col for col in spec["zone_columns"] + spec["measures"] if col not in data.columns]
+        if missing:
+            raise ValueError(f"Missing column(s) {missing} in the {spec['label']} data. Columns found: {list(data.columns)}")
+
+        zones = Zones(zones=source_zones, version=self.version, output_directory=self.output_path)
+        rolled = data.copy(deep=False)
+        for col in spec["zone_columns"]:
+            codes, uniques = pd.factorize(rolled[col])
+            uniques = np.asarray(uniques, dtype=object)
+            mapped = zones.map_ids(uniques.astype(str), _ZONE_LEVELS[source_zones], _ZONE_LEVELS[target_zones])
+            mapped = np.where(pd.isna(mapped), uniques, mapped)
+            rolled[col] = np.append(mapped, None)[codes]
+
+        measures = [col for col in spec["measures"] if col in rolled.columns]
+        keys = [col for col in rolled.columns if col not in measures]
+        rolled = (
+            rolled.groupby(keys, sort=False, observed=True, dropna=not spec["keep_na_keys"])[measures]
+            .sum()
+            .reset_index()
+        )
+        rolled = self._finalize_backend_dataframe(rolled)
+
+        target = "GAU" if self.version == 2 and target_zones == "gaus" else target_zones
+        output_file = os.path.join(
+            self.output_path,
+            f"{m_type}_{target}_{self.start_date}_{self.end_date}_v{self.version}_from_{self.zones}.parquet",
+        )
+        self._write_parquet(rolled, output_file)
+        print('Parquet file generated successfully at ', output_file)
+        if return_df:
+            return rolled
+
+    def project(self, target, mobility_type: str = "od", data=None, weighting: str = "area", target_id: str = None) -> pd.DataFrame:
+        """
+        Project OD, overnight stays or number-of-trips data onto a custom polygon layer (a regular grid, service
+        areas, ...) with the overlap weights ``W`` of :meth:`Zones.get_overlap_weights`: zone values become ``W @ v``
+        and every OD matrix becomes ``W @ OD @ W.T``, computed as sparse matrix products for all the time slices and
+        categories at once. The weights are cached per target layer, so repeated projections need no geometry work.
+
+        Parameters
+        ----------
+        target : geopandas.GeoDataFrame or geopandas.GeoSeries
+            The target polygons, in any CRS.
+        mobility_type : str
+            Default value is 'od'. The dataset to project. Must be one of the following: od, origin-destination, os, overnight_stays, nt, number_of_trips
+        data : pandas.DataFrame or pyarrow.Table
+            Default value is None. Data as returned by the corresponding get_* method. If None, its stored output for
+            this object's zoning and dates is read.
+        weighting : str
+            Default value is 'area'. How zones are split between target polygons: 'area' or 'population' (see
+            :meth:`Zones.get_overlap_weights`).
+        target_id : str
+            Default value is None. Column of ``target`` holding the target ids. If None, the index is used.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The data with the zone id columns replaced by target ids and the measures split accordingly, keeping all
+            the other columns (date, hour, activities, ...). Values of zone parts outside the target layer and rows of
+            zones unknown to the zoning are dropped.
+
+        Examples
+        --------
+
+        >>> import geopandas as gpd
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='districts', start_date='2022-01-01', end_date='2022-01-07')
+        >>> mobility_data.get_od_data(time_resolution='day')
+        >>> grid = gpd.read_file('grid_5km.gpkg')
+        >>> grid_od = mobility_data.project(grid, target_id='cell_id')
+        """
+        from pyspainmobility.zones.zones import Zones
+
+        if sparse is None:
+            raise ImportError("scipy is not installed. Please install scipy (pip install pyspainmobility[sparse]) to project data onto custom polygons")
+        utils.mobility_assert(mobility_type)
+        m_type = utils.mobility_type_normalization(mobility_type, self.version)
+        dataset = next(key for key, spec in DATASET_SPECS.items() if spec["m_types"].get(self.version) == m_type)
+        spec = DATASET_SPECS[dataset]
+
+        if data is None:
+            data = self._open_output_dataset(mobility_type).to_table()
+        if pa is not None and isinstance(data, pa.Table):
+            data = data.to_pandas()
+        zone_cols = spec["zone_columns"]
+        missing = [col for col in zone_cols + spec["measures"] if col not in data.columns]
+        if missing:
+            raise ValueError(f"Missing column(s) {missing} in the {spec['label']} data. Columns found: {list(data.columns)}")
+
+        zones = Zones(zones=self.zones.lower(), version=self.version, output_directory=self.output_path)
+        weights, target_index, zone_index = zones.get_overlap_weights(target, weighting=weighting, target_id=target_id)
+        n_targets, n_zones = weights.shape
+
+        positions = [self._zone_positions(data[col], zone_index) for col in zone_cols]
+        known = np.logical_and.reduce([position >= 0 for position in positions])
+        if not known.all():
+            warnings.warn(
+                f"{int((~known).sum())} rows refer to zone ids missing from the zoning and were dropped.",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+        data, positions = data[known], [position[known] for position in positions]
+
+        measures = spec["measures"]
+        keys = [col for col in data.columns if col not in measures and col not in zone_cols]
+        if keys:
+            # Codes per key (NA kept as its own value), combined into one code per slice.
+            key_codes, levels = zip(*(pd.factorize(data[key], use_na_sentinel=False) for key in keys))
+            shape = [max(len(level), 1) for level in levels]
+            slice_codes, slices = pd.factorize(np.ravel_multi_index(key_codes, shape))
+            slice_keys = np.unravel_index(slices, shape)
+        else:
+            slice_codes, slices, slice_keys = np.zeros(len(data), dtype=np.int64), [0], ()
+        n_slices = len(slices)
+
+        parts = []
+        for measure in measures:
+            values = pd.to_numeric(data[measure], errors="coerce").to_numpy(dtype=float, na_value=0.0)
+            if len(zone_cols) == 1:
+                matrix = sparse.csr_matrix((values, (slice_codes, positions[0])), shape=(n_slices, n_zones))
+                projected = (matrix @ weights.T).tocoo()
+                codes = {"slice": projected.row, zone_cols[0]: projected.col}
+            else:
+                rows = slice_codes.astype(np.int64) * n_zones + positions[0]
+                matrix = sparse.csr_matrix((values, (rows, positions[1])), shape=(n_slices * n_zones, n_zones))
+                destinations = (matrix @ weights.T).tocoo()
+                # Origins as rows and (slice, target destination) as columns, so one product with W projects the
+                # origins of every slice.
+                origins = sparse.csr_matrix(
+                    (destinations.data, (destinations.row % n_zones, (destinations.row // n_zones) * n_targets + destinations.col)),
+                    shape=(n_zones, n_slices * n_targets),
                 )
-                return None
+                projected = (weights @ origins).tocoo()
+                codes = {"slice": projected.col // n_targets, zone_cols[0]: projected.row, zone_cols[1]: projected.col % n_targets}
+            parts.append(pd.DataFrame({**codes, measure: projected.data}))
+
+        code_cols = ["slice"] + zone_cols
+        result = pd.concat(parts, ignore_index=True).groupby(code_cols, sort=True)[measures].sum().reset_index()
+        for key, level, key_position in zip(keys, levels if keys else (), slice_keys):
+            result[key] = level[key_position[result["slice"].to_numpy()]]
+        for col in zone_cols:
+            result[col] = target_index.to_numpy()[result[col].to_numpy()]
+        result = result[[col for col in data.columns if col in result.columns]]
+        return self._finalize_backend_dataframe(result)
+
+    def read_od_aggregate(self, name: str) -> pd.DataFrame:
+        """
+        Read one of the aggregates saved by ``get_od_data(aggregates=True)`` for this object's zoning and dates.
 
-            df["date"] = self._normalize_date_series(df["date"])
-            df["residence_area"] = self._normalize_identifier_series(df["residence_area"])
-            df["overnight_stay_area"] = self._normalize_identifier_series(df["overnight_stay_area"])
-            df["people"] = self._to_numeric(df["people"], strip_thousands=True)
-            df.dropna(subset=required_cols, inplace=True)
+        Parameters
+        ----------
+        name : str
+            The aggregate to read. Must be one of the following: by_origin, by_destination, by_hour, daily_totals.
 
-            return df
-        except EmptyDataError:
-            print(f"[warn] {os.path.basename(filepath)} triggered EmptyDataError, skipped")
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-31')
+        >>> mobility_data.get_od_data(aggregates=True)
+        >>> daily = mobility_data.read_od_aggregate('daily_totals')
+        """
+        if name not in _OD_AGGREGATES:
+            raise ValueError(f"name must be one of the following: {', '.join(_OD_AGGREGATES)}")
+        path = os.path.join(self._od_aggregates_path(DATASET_SPECS["od"]["m_types"][self.version]), f"{name}.parquet")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No {name} aggregate found at {path}. Call get_od_data(aggregates=True) first.")
+        return self._finalize_backend_dataframe(pd.read_parquet(path))
+
+    def build_od_cube(self):
+        """
+        Build the socio-demographic OD cube of this object's date range (version 2 only).
+
+        The raw files are reduced while they are processed to the trips and kilometres per date, activity at origin and
+        destination, income, age and gender (zones are summed up; missing values are kept as 'NA'). The dimensions are
+        stored as integer codes and every roll-up (one cuboid per subset of the dimensions) is pre-computed, so
+        :meth:`query_od_cube` answers cross-tabs from the smallest cuboid holding the requested dimensions.
+
+        The cube is built in its own pass over the raw files (downloaded if missing), independent of
+        :meth:`get_od_data`, whose output usually lacks the activity and socio-demographic columns. Calling both for
+        the same dates therefore parses every file twice.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-31')
+        >>> mobility_data.build_od_cube()
+        >>> df = mobility_data.query_od_cube(by=['age'], filters={'activity_destination': 'work_or_study'})
+        """
+        if self.version != 2:
+            raise Exception("The socio-demographic OD cube is only available for version 2.")
+
+        m_type = DATASET_SPECS["od"]["m_types"][self.version]
+        local_list = self._donwload_helper(m_type)
+        print("Building the OD cube....")
+        engine = self._select_engine(m_type, False, keep_activity=True, social_agg=True)
+        if engine == "streaming":
+            # Per-file results are small here, so there is nothing to stream.
+            engine = "sequential"
+        results = [df for df in self._map_files(self._process_cube_file, local_list, engine) if df is not None]
+        if not results:
+            print("No valid data found")
             return None
-        except Exception as e:
-            print(f"Error processing {filepath}: {e}")
+
+        measures = DATASET_SPECS["od"]["measures"]
+        base = pd.concat(results, ignore_index=True).groupby(["date"] + _OD_CUBE_DIMENSIONS, as_index=False)[measures].sum()
+        encodings = {}
+        for dimension in _OD_CUBE_DIMENSIONS:
+            codes, uniques = pd.factorize(base[dimension], sort=True)
+            base[dimension] = codes.astype(np.int16)
+            encodings[dimension] = [str(value) for value in uniques]
+
+        directory = self._od_cube_path()
+        os.makedirs(directory, exist_ok=True)
+        cuboids = {}
+        for size in range(len(_OD_CUBE_DIMENSIONS) + 1):
+            for dimensions in itertools.combinations(_OD_CUBE_DIMENSIONS, size):
+                name = "__".join(dimensions) or "date"
+                cuboid = base.groupby(["date", *dimensions], as_index=False)[measures].sum()
+                self._write_parquet(cuboid, os.path.join(directory, f"{name}.parquet"))
+                cuboids[name] = {"dimensions": list(dimensions), "rows": len(cuboid)}
+        # The metadata is written last so an interrupted build is never read.
+        with open(os.path.join(directory, "cube.json"), "w", encoding="utf-8") as fh:
+            json.dump({"encodings": encodings, "cuboids": cuboids}, fh)
+        print('OD cube generated successfully at ', directory)
+        return None
+
+    def query_od_cube(self, by: list = None, filters: dict = None, start_date: str = None, end_date: str = None) -> pd.DataFrame:
+        """
+        Aggregate the OD cube built by :meth:`build_od_cube`, reading the smallest pre-computed roll-up that holds the
+        requested dimensions.
+
+        Parameters
+        ----------
+        by : list
+            Default value is None. Dimensions of the result, among date, activity_origin, activity_destination, income,
+            age and gender. If None, the grand totals are returned.
+        filters : dict
+            Default value is None. Allowed values per dimension, e.g. {'activity_destination': 'work_or_study',
+            'age': ['25-44', '45-64']}.
+        start_date : str
+            Default value is None. First date (YYYY-MM-DD) aggregated. If None, the whole cube is used.
+        end_date : str
+            Default value is None. Last date (YYYY-MM-DD) aggregated. If None, the whole cube is used.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The requested dimensions with the summed 'n_trips' and 'trips_total_length_km'.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-31')
+        >>> df = mobility_data.query_od_cube(by=['date', 'gender'], filters={'income': '>15'})
+        """
+        directory = self._od_cube_path()
+        metadata_path = os.path.join(directory, "cube.json")
+        if not os.path.exists(metadata_path):
+            raise FileNotFoundError(f"No OD cube found at {directory}. Call build_od_cube() first.")
+        with open(metadata_path, "r", encoding="utf-8") as fh:
+            metadata = json.load(fh)
+
+        by = [by] if isinstance(by, str) else list(by or [])
+        filters = filters or {}
+        allowed = ["date"] + _OD_CUBE_DIMENSIONS
+        unknown = [col for col in by + list(filters) if col not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown cube dimension(s) {unknown}. Dimensions: {', '.join(allowed)}")
+
+        needed = {col for col in by + list(filters) if col != "date"}
+        name, _ = min(
+            ((name, cuboid) for name, cuboid in metadata["cuboids"].items() if needed <= set(cuboid["dimensions"])),
+            key=lambda item: item[1]["rows"],
+        )
+        df = pd.read_parquet(os.path.join(directory, f"{name}.parquet"))
+
+        mask = np.ones(len(df), dtype=bool)
+        if start_date is not None:
+            mask &= (df["date"] >= start_date).to_numpy(dtype=bool)
+        if end_date is not None:
+            mask &= (df["date"] <= end_date).to_numpy(dtype=bool)
+        for dimension, values in filters.items():
+            if isinstance(values, str) or not hasattr(values, "__iter__"):
+                values = [values]
+            values = {str(v) for v in values}
+            if dimension == "date":
+                mask &= df["date"].isin(values).to_numpy(dtype=bool)
+                continue
+            codes = [code for code, label in enumerate(metadata["encodings"][dimension]) if label in values]
+            mask &= df[dimension].isin(codes).to_numpy(dtype=bool)
+        df = df[mask]
+
+        measures = DATASET_SPECS["od"]["measures"]
+        if by:
+            df = df.groupby(by, as_index=False)[measures].sum()
+        else:
+            df = df[measures].sum().to_frame().T
+        for dimension in by:
+            if dimension != "date":
+                df[dimension] = np.asarray(metadata["encodings"][dimension], dtype=object)[df[dimension].to_numpy()]
+        return self._finalize_backend_dataframe(df.reset_index(drop=True))
+
+    def _process_cube_file(self, filepath: str):
+        """
+        Reduce one raw OD file to the cube's base cuboid. Missing dimension
+        values are kept as 'NA' so that the cube totals match the files.
+        """
+        df = self._process_single_file(filepath, "od")
+        if df is None:
+            return None
+        df[_OD_CUBE_DIMENSIONS] = df[_OD_CUBE_DIMENSIONS].astype("string").fillna("NA")
+        return df.groupby(["date"] + _OD_CUBE_DIMENSIONS, as_index=False)[DATASET_SPECS["od"]["measures"]].sum()
+
+    def _od_cube_path(self) -> str:
+        return os.path.join(self.output_path, f"od_cube_{self.zones}_{self.start_date}_{self.end_date}_v{self.version}")
+
+    def get_od_summary(self, top_k: int = 10, top_destinations: int = 5, bins: list = None, capacity: int = None) -> dict:
+        """
+        Compute summary statistics of the OD data of this object's date range in a single streaming pass over the
+        raw files, without building the OD table. Every file is reduced to small mergeable summaries (heavy-hitter
+        counters, fixed-bin histogram, running moments) that are merged as the files are processed.
+
+        Parameters
+        ----------
+        top_k : int
+            Default value is 10. Number of OD pairs with the most trips returned.
+        top_destinations : int
+            Default value is 5. Number of top destinations returned per origin.
+        bins : list
+            Default value is None. Bin edges (km) of the histogram of the mean trip length (trips_total_length_km /
+            n_trips) of each OD pair and day, weighted by trips. If None, 0, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500
+            and infinity are used.
+        capacity : int
+            Default value is None. Number of counters kept by the heavy-hitter summaries (per origin for the top
+            destinations). If None, 100 times top_k (at least 1000) and 20 times top_destinations are used.
+            Counts of the top pairs are lower bounds, off by at most the number of trips divided by capacity + 1.
+
+        Returns
+        -------
+        dict
+            • top_flows: dataframe of the top_k (id_origin, id_destination) pairs with their n_trips
+            • top_destinations: dataframe of the top destinations of every origin with their n_trips and rank
+            • trip_length_histogram: dataframe with the bin edges (bin_start, bin_end) and the n_trips of each bin
+            • trip_length_moments: dict with the total n_trips, total_km and the trips-weighted mean and standard
+            deviation of the mean trip length
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-12-31')
+        >>> summary = mobility_data.get_od_summary(top_k=20)
+        >>> summary['top_flows'].head()
+        """
+        bins = np.asarray(_TRIP_LENGTH_BINS if bins is None else bins, dtype=float)
+        capacities = (capacity or max(100 * top_k, 1000), capacity or 20 * top_destinations)
+
+        m_type = DATASET_SPECS["od"]["m_types"][self.version]
+        local_list = self._donwload_helper(m_type)
+        print("Computing the OD summary....")
+        engine = self._select_engine(m_type, False)
+        summary = None
+        # Each file summary is merged as soon as it is ready, so only the running summary is kept.
+        for partial in self._iter_files(self._summarise_od_file, local_list, engine, bins, capacities):
+            summary = self._merge_od_summaries(summary, partial, capacities)
+        if summary is None:
+            print("No valid data found")
             return None
 
-    def _process_single_number_of_trips_file(self, filepath: str):
+        top_flows = summary["pairs"].nlargest(top_k, "n_trips").reset_index(drop=True)
+        top = summary["destinations"].sort_values(["id_origin", "n_trips"], ascending=[True, False])
+        top = top.assign(rank=top.groupby("id_origin").cumcount() + 1)
+        weight, mean, m2 = summary["moments"]
+        return {
+            "top_flows": self._finalize_backend_dataframe(top_flows),
+            "top_destinations": self._finalize_backend_dataframe(top[top["rank"] <= top_destinations].reset_index(drop=True)),
+            "trip_length_histogram": self._finalize_backend_dataframe(
+                pd.DataFrame({"bin_start": bins[:-1], "bin_end": bins[1:], "n_trips": summary["histogram"]})
+            ),
+            "trip_length_moments": {
+                "n_trips": weight,
+                "total_km": summary["total_km"],
+                "mean_km": mean,
+                "std_km": float(np.sqrt(m2 / weight)) if weight > 0 else np.nan,
+            },
+        }
+
+    def _summarise_od_file(self, filepath: str, bins: np.ndarray, capacities: tuple) -> Optional[dict]:
+        """
+        Mergeable summaries of one raw OD file.
+        """
+        df = self._process_single_file(filepath, "od", self._group_cols("od", "day"), None, "day")
+        if df is None:
+            return None
+        trips = df["n_trips"].to_numpy(dtype=float, na_value=0.0)
+        km = df["trips_total_length_km"].to_numpy(dtype=float, na_value=0.0)
+        valid = trips > 0
+        lengths = km[valid] / trips[valid]
+        weight = float(trips[valid].sum())
+        mean = float(np.average(lengths, weights=trips[valid])) if weight > 0 else 0.0
+        pairs = df.groupby(["id_origin", "id_destination"], as_index=False)["n_trips"].sum()
+        pairs["n_trips"] = pairs["n_trips"].astype(float)
+        return {
+            "pairs": self._prune_heavy_hitters(pairs, capacities[0]),
+            "destinations": self._prune_heavy_hitters(pairs, capacities[1], per="id_origin"),
+            "histogram": np.histogram(lengths, bins=bins, weights=trips[valid])[0],
+            "moments": (weight, mean, float(np.sum(trips[valid] * (lengths - mean) ** 2))),
+            "total_km": float(km.sum()),
+        }
+
+    @staticmethod
+    def _merge_od_summaries(summary: Optional[dict], partial: Optional[dict], capacities: tuple) -> Optional[dict]:
+        """
+        Merge two OD summaries (heavy hitters, histogram, moments).
         """
-        Parse and normalize one number-of-trips file for the active version.
+        if partial is None or summary is None:
+            return summary if partial is None else partial
+        (weight_a, mean_a, m2_a), (weight_b, mean_b, m2_b) = summary["moments"], partial["moments"]
+        weight = weight_a + weight_b
+        delta = mean_b - mean_a
+        # Chan et al. parallel update of the weighted mean and sum of squares.
+        mean = mean_a + delta * weight_b / weight if weight > 0 else 0.0
+        m2 = m2_a + m2_b + (delta ** 2 * weight_a * weight_b / weight if weight > 0 else 0.0)
+        return {
+            "pairs": Mobility._prune_heavy_hitters(pd.concat([summary["pairs"], partial["pairs"]]), capacities[0]),
+            "destinations": Mobility._prune_heavy_hitters(
+                pd.concat([summary["destinations"], partial["destinations"]]), capacities[1], per="id_origin"
+            ),
+            "histogram": summary["histogram"] + partial["histogram"],
+            "moments": (weight, mean, m2),
+            "total_km": summary["total_km"] + partial["total_km"],
+        }
+
+    @staticmethod
+    def _prune_heavy_hitters(counts: pd.DataFrame, capacity: int, per: str = None) -> pd.DataFrame:
+        """
+        Misra-Gries summary of weighted (id_origin, id_destination) counts:
+        keep at most ``capacity`` counters (per ``per`` group), decreasing all
+        of them by the (capacity + 1)-th largest one.
+        """
+        counts = counts.groupby(["id_origin", "id_destination"], as_index=False)["n_trips"].sum()
+        if per is None:
+            if len(counts) <= capacity:
+                return counts
+            threshold = counts["n_trips"].nlargest(capacity + 1).iloc[-1]
+        else:
+            rank = counts.groupby(per)["n_trips"].rank(method="first", ascending=False)
+            threshold = counts["n_trips"].where(rank == capacity + 1).groupby(counts[per]).transform("max").fillna(0.0)
+        counts = counts.assign(n_trips=counts["n_trips"] - threshold)
+        return counts[counts["n_trips"] > 0].reset_index(drop=True)
+
+    def sql(self, query: str, params: list = None, return_type: str = "pandas"):
+        """
+        Run a SQL query with DuckDB over the stored outputs, without loading them into dataframes. DuckDB reads the
+        parquet files out-of-core, pushing filters and column selections down to the row groups.
+
+        The following views are available:
+        • od, overnight_stays, number_of_trips: the outputs of get_od_data, get_overnight_stays_data and
+        get_number_of_trips_data for this object's zoning, version and dates (only the ones already generated)
+        • zones: the attributes of the zoning returned by :meth:`Zones.get_zone_table`, keyed by 'id'. It is only loaded when the query refers to it.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query. DuckDB's dialect is used.
+        params : list
+            Default value is None. Values of the ``?`` placeholders of the query.
+        return_type : str
+            Default value is 'pandas'. Type of the returned result: 'pandas' or 'arrow' (a ``pyarrow.Table``).
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-31')
+        >>> mobility_data.get_od_data()
+        >>> df = mobility_data.sql(
+        ...     "SELECT z.name, SUM(od.n_trips) AS trips FROM od JOIN zones z ON od.id_destination = z.id "
+        ...     "WHERE od.id_origin = ? GROUP BY z.name ORDER BY trips DESC LIMIT 5",
+        ...     params=['41091'],
+        ... )
         """
+        if duckdb is None:
+            raise ImportError("duckdb is not installed. Please install duckdb (pip install pyspainmobility[sql]) to use sql()")
+        if return_type not in ("pandas", "arrow"):
+            raise ValueError("return_type must be either 'pandas' or 'arrow'")
+
+        connection = duckdb.connect()
         try:
-            if self.version == 2:
-                dtype = {
-                    "fecha": "string",
-                    "zona_pernoctacion": "string",
-                    "edad": "string",
-                    "sexo": "string",
-                    "numero_viajes": "string",
-                    "personas": "string",
-                }
-                rename_map = {
-                    "fecha": "date",
-                    "zona_pernoctacion": "overnight_stay_area",
-                    "edad": "age",
-                    "sexo": "gender",
-                    "numero_viajes": "number_of_trips",
-                    "personas": "people",
-                }
-            else:
-                dtype = {
-                    "fecha": "string",
-                    "distrito": "string",
-                    "numero_viajes": "string",
-                    "personas": "string",
-                }
-                rename_map = {
-                    "fecha": "date",
-                    "distrito": "overnight_stay_area",
-                    "numero_viajes": "number_of_trips",
-                    "personas": "people",
-                }
+            for view, dataset in _SQL_VIEWS.items():
+                m_type = DATASET_SPECS[dataset]["m_types"].get(self.version)
+                if m_type is None or not os.path.exists(self._output_parquet_path(m_type)):
+                    continue
+                path = self._output_parquet_path(m_type).replace("'", "''")
+                connection.execute(f"CREATE VIEW {view} AS SELECT * FROM read_parquet('{path}')")
+            if re.search(r"\bzones\b", query, flags=re.IGNORECASE):
+                connection.register("zones", self._zone_attributes())
+
+            result = connection.execute(query, params or [])
+            if return_type == "arrow":
+                table = result.arrow()
+                return table.read_all() if isinstance(table, pa.RecordBatchReader) else table
+            return self._finalize_backend_dataframe(result.df())
+        finally:
+            connection.close()
+
+    def get_od_matrices(self, data=None, value: str = "n_trips", time_keys: list = None, zone_index=None):
+        """
+        Convert OD data into one ``scipy.sparse.csr_matrix`` (origin x destination) per time slice.
 
-            df = self._read_pipe_file(filepath, dtype=dtype)
-            df = self._normalize_input_columns(df)
-            if df.empty:
-                return None
+        Parameters
+        ----------
+        data : pandas.DataFrame or pyarrow.Table
+            Default value is None. OD data as returned by :meth:`get_od_data`. If None, the stored output of
+            get_od_data for this object's zoning and dates is read (only the needed columns).
+        value : str
+            Default value is 'n_trips'. The column stored in the cells ('n_trips' or 'trips_total_length_km').
+            Rows sharing origin, destination and time slice (e.g. different activities) are summed.
+        time_keys : list
+            Default value is None. Columns defining a time slice. If None, the time columns found in the data among
+            date, week, month, day_type and hour are used, e.g. ['date', 'hour'] for the hourly output.
+        zone_index : list or pandas.Index
+            Default value is None. Zone ids giving the row/column order of the matrices. If None, the index of
+            :meth:`Zones.get_zone_geodataframe` for this object's zoning is used, so that row ``i`` of every matrix
+            is the ``i``-th zone of the geodataframe. Flows from or to ids missing from the index are dropped with a
+            warning.
+
+        Returns
+        -------
+        tuple
+            ``(matrices, zone_index)``: a dict mapping each time slice (a value or a tuple of values of
+            ``time_keys``) to its sparse matrix, and the zone index as a ``pandas.Index``.
 
-            df.rename(columns=rename_map, inplace=True)
+        Examples
+        --------
 
-            required_cols = ["date", "overnight_stay_area", "number_of_trips", "people"]
-            missing = [col for col in required_cols if col not in df.columns]
-            if missing:
-                print(
-                    f"[warn] {os.path.basename(filepath)} missing expected columns after translation: {missing}. "
-                    f"Columns found: {list(df.columns)}"
-                )
-                return None
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-31')
+        >>> mobility_data.get_od_data(time_resolution='day')
+        >>> matrices, zone_index = mobility_data.get_od_matrices()
+        >>> # trips between the first two zones of Zones.get_zone_geodataframe() on 2022-01-03
+        >>> matrices['2022-01-03'][0, 1]
+        """
+        tensor, time_index, zone_index = self.get_od_tensor(data, value=value, time_keys=time_keys, zone_index=zone_index)
+        n_zones = len(zone_index)
+        matrices = {
+            label: tensor[position * n_zones:(position + 1) * n_zones]
+            for position, label in enumerate(time_index)
+        }
+        return matrices, zone_index
 
-            if "age" not in df.columns:
-                df["age"] = pd.NA
-            if "gender" not in df.columns:
-                df["gender"] = pd.NA
+    def get_od_tensor(self, data=None, value: str = "n_trips", time_keys: list = None, zone_index=None):
+        """
+        Convert OD data into a sparse (time, origin, destination) tensor. Same parameters as
+        :meth:`get_od_matrices`.
 
-            df["date"] = self._normalize_date_series(df["date"])
-            df["overnight_stay_area"] = self._normalize_identifier_series(df["overnight_stay_area"])
-            df["number_of_trips"] = df["number_of_trips"].astype("string").str.strip().str.replace(r"\.0+$", "", regex=True)
-            df["people"] = self._to_numeric(df["people"], strip_thousands=True)
+        The tensor is stored as a ``scipy.sparse.csr_matrix`` of shape ``(n_times * n_zones, n_zones)``: the block of
+        rows ``t * n_zones`` to ``(t + 1) * n_zones`` is the OD matrix of the ``t``-th time slice. Row and column
+        positions are integer codes computed in a vectorised way, so no pivot table is built.
 
-            df.replace({"gender": {"hombre": "male", "mujer": "female"}}, inplace=True)
-            df.dropna(subset=["date", "overnight_stay_area", "number_of_trips", "people"], inplace=True)
+        Returns
+        -------
+        tuple
+            ``(tensor, time_index, zone_index)``: the sparse tensor, the sorted time slices as a ``pandas.Index``
+            (a ``pandas.MultiIndex`` for several time keys) and the zone index.
 
-            return df
-        except EmptyDataError:
-            print(f"[warn] {os.path.basename(filepath)} triggered EmptyDataError, skipped")
-            return None
-        except Exception as e:
-            print(f"Error processing {filepath}: {e}")
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-31')
+        >>> mobility_data.get_od_data()
+        >>> tensor, time_index, zone_index = mobility_data.get_od_tensor()
+        >>> # OD matrix of 2022-01-01 at 08:00
+        >>> t = time_index.get_loc(('2022-01-01', 8))
+        >>> od = tensor[t * len(zone_index):(t + 1) * len(zone_index)]
+        """
+        if sparse is None:
+            raise ImportError("scipy is not installed. Please install scipy (pip install pyspainmobility[sparse]) to export sparse OD matrices")
+
+        if data is None:
+            dataset = self._open_output_dataset("od")
+            names = dataset.schema.names
+        else:
+            names = data.column_names if pa is not None and isinstance(data, pa.Table) else list(data.columns)
+        if time_keys is None:
+            time_keys = [col for col in ("date", "week", "month", "day_type", "hour") if col in names]
+        else:
+            time_keys = [time_keys] if isinstance(time_keys, str) else list(time_keys)
+        needed = time_keys + ["id_origin", "id_destination", value]
+        missing = [col for col in needed if col not in names]
+        if missing:
+            raise ValueError(f"Missing column(s) {missing} in the OD data. Columns found: {names}")
+
+        if data is None:
+            data = dataset.to_table(columns=needed)
+        if pa is not None and isinstance(data, pa.Table):
+            data = data.select(needed).to_pandas()
+        else:
+            data = data[needed]
+
+        if zone_index is None:
+            zone_index = self._zone_attributes()["id"]
+        zone_index = pd.Index(zone_index).astype(str)
+        n_zones = len(zone_index)
+
+        origins = self._zone_positions(data["id_origin"], zone_index)
+        destinations = self._zone_positions(data["id_destination"], zone_index)
+        known = (origins >= 0) & (destinations >= 0)
+        if not known.all():
+            unknown = pd.unique(pd.concat([
+                data["id_origin"][origins < 0], data["id_destination"][destinations < 0]
+            ]).astype(str))
+            warnings.warn(
+                f"{int((~known).sum())} OD rows refer to zone ids missing from the zone index "
+                f"(e.g. {', '.join(unknown[:5])}) and were dropped.",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+
+        data, origins, destinations = data[known], origins[known], destinations[known]
+        if time_keys:
+            # Sorted codes per key, combined into one integer code per time slice.
+            key_codes, levels = zip(*(pd.factorize(data[key], sort=True) for key in time_keys))
+            valid = np.logical_and.reduce([codes >= 0 for codes in key_codes])
+            shape = [max(len(level), 1) for level in levels]
+            combined = np.ravel_multi_index([np.where(valid, codes, 0) for codes in key_codes], shape)
+            time_codes, slices = pd.factorize(combined, sort=True)
+            time_codes[~valid] = -1
+            positions = np.unravel_index(slices, shape)
+            time_index = pd.MultiIndex.from_arrays(
+                [level[position] for level, position in zip(levels, positions)], names=time_keys
+            )
+            if len(time_keys) == 1:
+                time_index = time_index.get_level_values(0)
+        else:
+            time_codes, time_index = np.zeros(len(data), dtype=np.int64), pd.Index([None])
+        known = time_codes >= 0
+
+        values = pd.to_numeric(data[value], errors="coerce").to_numpy(dtype=float, na_value=0.0)
+        rows = time_codes[known].astype(np.int64) * n_zones + origins[known]
+        tensor = sparse.coo_matrix(
+            (values[known], (rows, destinations[known])), shape=(len(time_index) * n_zones, n_zones)
+        ).tocsr()
+        return tensor, time_index, zone_index
+
+    def update_od_store(self, value: str = "n_trips", zone_index=None, dtype: str = "float32"):
+        """
+        Add the days of this object's date range to the on-disk OD array store, processing only the days that are not
+        stored yet.
+
+        The store keeps, for every day, the hourly OD values as a sparse matrix in CSR layout of shape
+        ``(24 * n_zones, n_zones)`` (row ``hour * n_zones + origin``), saved as three NumPy ``.npy`` files that are
+        memory-mapped when read. Zones are addressed through a fixed zone dictionary saved with the store, so
+        :meth:`read_od_store` can read the flows of a few zones across hundreds of days by touching only the
+        corresponding rows.
+
+        Once a store exists, hourly :meth:`get_od_data` calls without filters write the days they ingest and are not
+        stored yet, from the files they process anyway, so this method only has to back-fill the other days.
+
+        Parameters
+        ----------
+        value : str
+            Default value is 'n_trips'. The OD column stored ('n_trips' or 'trips_total_length_km'). Each value has its
+            own store.
+        zone_index : list or pandas.Index
+            Default value is None. Zone ids of the store, used when the store is created. If None, the index of
+            :meth:`Zones.get_zone_geodataframe` is used. Flows from or to ids missing from it are dropped with a
+            warning.
+        dtype : str
+            Default value is 'float32'. NumPy dtype of the stored values.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2023-12-31')
+        >>> mobility_data.update_od_store()
+        >>> values, dates = mobility_data.read_od_store(origins=['28079'])
+        """
+        if value not in DATASET_SPECS["od"]["measures"]:
+            raise ValueError(f"value must be one of the following: {', '.join(DATASET_SPECS['od']['measures'])}")
+        store = self._od_store_path(value)
+        self._od_store_metadata(store, zone_index, dtype)
+        pending = [d for d in self.dates if not os.path.exists(self._od_store_day_path(store, d, "indptr"))]
+        if not pending:
+            print(f"The OD store at {store} is up to date")
             return None
 
-    def get_overnight_stays_data(self, return_df: bool = False):
+        m_type = DATASET_SPECS["od"]["m_types"][self.version]
+        local_list = self._donwload_helper(m_type, pending)
+        group_cols = self._group_cols("od", "hour")
+        for filepath in tqdm.tqdm(local_list):
+            df = self._process_single_file(filepath, "od", group_cols, None, "hour")
+            if df is not None:
+                self._append_od_store(df, [value])
+        print('OD store updated at ', store)
+        return None
+
+    def read_od_store(self, origins: list = None, destinations: list = None, hours: list = None, value: str = "n_trips"):
         """
-        Function to download and save the overnight stays data.
+        Read OD values of this object's date range from the store built by :meth:`update_od_store`, without loading
+        the stored days: only the rows of the requested origins and hours are read from the memory-mapped files.
 
         Parameters
         ----------
-        return_df : bool
-            Default value is False. If True, the function will return the dataframe in addition to saving it to a file.
+        origins : list
+            Default value is None. Origin zone ids. If None, all the zones of the store are used.
+        destinations : list
+            Default value is None. Destination zone ids. If None, all the zones of the store are used.
+        hours : list
+            Default value is None. Hours (0 to 23). If None, all the hours are used.
+        value : str
+            Default value is 'n_trips'. The stored OD column to read.
+
+        Returns
+        -------
+        tuple
+            ``(values, dates)``: a dense ``numpy.ndarray`` of shape (n_dates, n_hours, n_origins, n_destinations) in the
+            order of the requested dates, hours and zones, and the list of the stored dates it contains (days of the
+            range that are not stored are left out).
+
         Examples
         --------
 
         >>> from pyspainmobility import Mobility
-        >>> # instantiate the object
-        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-06', output_directory='/Desktop/spain/data/')
-        >>> # download and save the overnight stays data and return the dataframe
-        >>> df = mobility_data.get_overnight_stays_data( return_df=True)
-        >>> print(df.head())
-           date residence_area overnight_stay_area    people
-        0  2023-04-01          01001               01001  2716.303
-        1  2023-04-01          01001            01009_AM    14.088
-        2  2023-04-01          01001            01017_AM     2.476
-        3  2023-04-01          01001            01058_AM    18.939
-        4  2023-04-01          01001               01059   144.118
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2023-12-31')
+        >>> # hourly trips from Madrid to every municipality over two years
+        >>> values, dates = mobility_data.read_od_store(origins=['28079'])
+        >>> # daily outflows of Madrid
+        >>> outflows = values.sum(axis=(1, 2, 3))
         """
-        if self.version == 2:
-            m_type = 'Pernoctaciones'
-            local_list = self._donwload_helper(m_type)
-            print('Generating parquet file for Overnight Stays....')
+        store = self._od_store_path(value)
+        if not os.path.exists(os.path.join(store, "store.json")):
+            raise FileNotFoundError(f"No OD store found at {store}. Call update_od_store() first.")
+        metadata = self._read_od_store_metadata(store)
+        zone_index = pd.Index(metadata["zone_ids"])
+        n_zones = len(zone_index)
+
+        def _selection(ids):
+            if ids is None:
+                return np.arange(n_zones)
+            positions = zone_index.get_indexer(pd.Index([str(i) for i in ids]))
+            if (positions < 0).any():
+                missing = [str(i) for i, pos in zip(ids, positions) if pos < 0]
+                raise ValueError(f"Unknown zone id(s) {missing} for the OD store at {store}")
+            return positions
+
+        origin_positions = _selection(origins)
+        destination_positions = _selection(destinations)
+        hours = np.arange(_OD_STORE_HOURS) if hours is None else np.asarray(list(hours), dtype=np.int64)
+        destination_lookup = np.full(n_zones, -1, dtype=np.int64)
+        destination_lookup[destination_positions] = np.arange(len(destination_positions))
+        rows = (hours[:, None] * n_zones + origin_positions[None, :]).ravel()
+
+        dates = [d for d in self.dates if os.path.exists(self._od_store_day_path(store, d, "indptr"))]
+        values = np.zeros((len(dates), len(hours), len(origin_positions), len(destination_positions)), dtype=metadata["dtype"])
+        for position, date in enumerate(dates):
+            indptr = np.load(self._od_store_day_path(store, date, "indptr"), mmap_mode="r")
+            starts, ends = indptr[rows], indptr[rows + 1]
+            lengths = ends - starts
+            # Flat positions of the stored entries of every selected row.
+            entries = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+            row_ids = np.repeat(np.arange(len(rows)), lengths)
+            columns = destination_lookup[np.load(self._od_store_day_path(store, date, "indices"), mmap_mode="r")[entries]]
+            data = np.load(self._od_store_day_path(store, date, "data"), mmap_mode="r")[entries]
+            selected = columns >= 0
+            values[position].reshape(len(rows), -1)[row_ids[selected], columns[selected]] = data[selected]
+        return values, dates
+
+    def update_zone_timeseries(self):
+        """
+        Add the days of this object's date range to the per-zone time-series store, processing only the days that are
+        not stored yet.
 
-            if self.use_dask and len(local_list) > 1:
-                @delayed
-                def process_overnight_file(filepath):
-                    return self._process_single_overnight_file(filepath)
+        For every zone, day and hour the store keeps the trips leaving the zone (outflow), arriving to it (inflow),
+        starting and ending in it (intra) and the corresponding kilometres (outflow_km, inflow_km). Every update
+        appends one parquet file sorted by zone id, date and hour, so the series of a few zones are read from a handful
+        of row groups by :meth:`zone_timeseries`.
 
-                delayed_tasks = [process_overnight_file(f) for f in local_list]
-                try:
-                    processed_dfs = dd.compute(*delayed_tasks)
-                except Exception as e:
-                    print(f"Dask computation failed: {e}. Falling back to pandas processing...")
-                    processed_dfs = []
-                    for f in tqdm.tqdm(local_list):
-                        result = self._process_single_overnight_file(f)
-                        if result is not None:
-                            processed_dfs.append(result)
-            else:
-                processed_dfs = []
-                for f in tqdm.tqdm(local_list):
-                    result = self._process_single_overnight_file(f)
-                    if result is not None:
-                        processed_dfs.append(result)
-
-            valid_dfs = [df for df in processed_dfs if df is not None]
-            if not valid_dfs:
-                print("No valid data found")
-                return None
+        Once the store exists, hourly :meth:`get_od_data` calls without filters append the days they ingest and are
+        not stored yet, from the files they process anyway, so this method only has to back-fill the other days.
 
-            print('Concatenating all the dataframes....')
-            df = pd.concat(valid_dfs, ignore_index=True)
-            df = self._finalize_backend_dataframe(df)
-            self._saving_parquet(df, m_type)
-            if return_df:
-                return df
+        Examples
+        --------
 
-        elif self.version == 1:
-            raise Exception('Overnight stays data is not available for version 1. Please use version 2.')
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2023-12-31')
+        >>> mobility_data.update_zone_timeseries()
+        >>> df = mobility_data.zone_timeseries(['28079', '08019'])
+        """
+        if pq is None:
+            raise ImportError("pyarrow is not installed. Please install pyarrow to use the zone time-series store")
+
+        store = self._zone_timeseries_path()
+        stored_dates = self._zone_timeseries_dates(store)
+        pending = [d for d in self.dates if d not in stored_dates]
+        if not pending:
+            print(f"The zone time-series store at {store} is up to date")
+            return None
+
+        m_type = DATASET_SPECS["od"]["m_types"][self.version]
+        local_list = self._donwload_helper(m_type, pending)
+        group_cols = self._group_cols("od", "hour")
+        totals = []
+        for filepath in tqdm.tqdm(local_list):
+            df = self._process_single_file(filepath, "od", group_cols, None, "hour")
+            if df is not None:
+                totals.append(self._zone_totals(df))
+        if not totals:
+            print("No valid data found")
+            return None
+        self._write_zone_timeseries(totals)
         return None
 
-    def get_number_of_trips_data(self, return_df: bool = False):
+    def _append_zone_timeseries(self, results: list) -> None:
         """
-        Function to download and save the data regarding the number of trips to an area of certain demographic categories.
+        Append the per-zone totals of processed hourly OD files (dataframes or
+        Arrow tables) to the zone time-series store.
+        """
+        self._write_zone_timeseries([self._zone_totals(result) for result in results])
+
+    def _write_zone_timeseries(self, totals: list) -> None:
+        """
+        Write the zone totals of the days not stored yet as one more part of
+        the zone time-series store.
+        """
+        store = self._zone_timeseries_path()
+        stored_dates = self._zone_timeseries_dates(store)
+        totals = pd.concat(totals, ignore_index=True)
+        totals = totals[~totals["date"].isin(stored_dates)]
+        if totals.empty:
+            return
+
+        table = pa.Table.from_pandas(totals, preserve_index=False)
+        table = table.sort_by([("id", "ascending"), ("date", "ascending"), ("hour", "ascending")])
+        dates = sorted(set(table["date"].to_pylist()))
+        os.makedirs(store, exist_ok=True)
+        pq.write_table(
+            table,
+            os.path.join(store, f"part-{dates[0].replace('-', '')}-{dates[-1].replace('-', '')}.parquet"),
+            row_group_size=16384,
+            compression="zstd",
+        )
+        # The list of stored dates is updated last so an interrupted update is redone.
+        with open(os.path.join(store, "store.json"), "w", encoding="utf-8") as fh:
+            json.dump({"dates": sorted(stored_dates | set(dates))}, fh)
+        print('Zone time-series store updated at ', store)
+
+    def zone_timeseries(self, zone_ids, start_date: str = None, end_date: str = None, resolution: str = "day") -> pd.DataFrame:
+        """
+        Read the series of the given zones from the store built by :meth:`update_zone_timeseries`.
 
         Parameters
         ----------
-        return_df : bool
-            Default value is False. If True, the function will return the dataframe in addition to saving it to a file.
+        zone_ids : str or list
+            The zone id(s) to read.
+        start_date : str
+            Default value is None. First date (YYYY-MM-DD). If None, this object's start date is used.
+        end_date : str
+            Default value is None. Last date (YYYY-MM-DD). If None, this object's end date is used.
+        resolution : str
+            Default value is 'day'. 'day' for daily totals or 'hour' for hourly totals.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per zone and day (and hour) with the columns id, date, (hour,) outflow, inflow, intra, outflow_km
+            and inflow_km. Days and hours without trips are not listed.
+
         Examples
         --------
 
         >>> from pyspainmobility import Mobility
-        >>> # instantiate the object
-        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-06', output_directory='/Desktop/spain/data/')
-        >>> # download and save the overnight stays data and return the dataframe
-        >>> df = mobility_data.get_number_of_trips_data( return_df=True)
-        >>> print(df.head())
-        date overnight_stay_area   age  gender number_of_trips   people
-        0  2023-04-01               01001  0-25    male               0  128.457
-        1  2023-04-01               01001  0-25    male               1   38.537
-        2  2023-04-01               01001  0-25    male               2  129.136
-        3  2023-04-01               01001  0-25    male              2+  129.913
-        4  2023-04-01               01001  0-25  female               0  188.744
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2023-12-31')
+        >>> df = mobility_data.zone_timeseries('28079', start_date='2023-01-01')
         """
-        if self.version == 2:
-            m_type = 'Personas'
-            local_list = self._donwload_helper(m_type)
-            print('Generating parquet file for Number of Trips....')
+        if resolution not in ("day", "hour"):
+            raise ValueError("resolution must be either 'day' or 'hour'")
+        store = self._zone_timeseries_path()
+        if not os.path.exists(os.path.join(store, "store.json")):
+            raise FileNotFoundError(f"No zone time-series store found at {store}. Call update_zone_timeseries() first.")
+
+        zone_ids = [zone_ids] if isinstance(zone_ids, str) else list(zone_ids)
+        start_date = start_date or self.start_date
+        end_date = end_date or self.end_date
+        parts = sorted(os.path.join(store, name) for name in os.listdir(store) if name.endswith(".parquet"))
+        dataset = pads.dataset(parts, format="parquet")
+        table = dataset.to_table(
+            filter=pc.field("id").isin(pa.array([str(z) for z in zone_ids]))
+            & (pc.field("date") >= start_date)
+            & (pc.field("date") <= end_date)
+        )
+        keys = ["id", "date"] if resolution == "day" else ["id", "date", "hour"]
+        table = self._group_table(table, keys, _ZONE_TIMESERIES_MEASURES)
+        df = table.to_pandas(types_mapper=pd.ArrowDtype) if self.backend == "arrow" else table.to_pandas()
+        return self._finalize_backend_dataframe(df)
 
-            if self.use_dask and len(local_list) > 1:
-                @delayed
-                def process_trips_file(filepath):
-                    return self._process_single_number_of_trips_file(filepath)
+    def _zone_timeseries_path(self) -> str:
+        return os.path.join(self.output_path, _ZONE_TIMESERIES_DIRECTORY, f"{self.zones}_v{self.version}")
 
-                delayed_tasks = [process_trips_file(f) for f in local_list]
-                try:
-                    processed_dfs = dd.compute(*delayed_tasks)
-                except Exception as e:
-                    print(f"Dask computation failed: {e}. Falling back to pandas processing...")
-                    processed_dfs = []
-                    for f in tqdm.tqdm(local_list):
-                        result = self._process_single_number_of_trips_file(f)
-                        if result is not None:
-                            processed_dfs.append(result)
+    @staticmethod
+    def _zone_timeseries_dates(store: str) -> set:
+        metadata_path = os.path.join(store, "store.json")
+        if not os.path.exists(metadata_path):
+            return set()
+        with open(metadata_path, "r", encoding="utf-8") as fh:
+            return set(json.load(fh)["dates"])
+
+    @staticmethod
+    def _zone_totals(result) -> pd.DataFrame:
+        """
+        Per zone, date and hour totals of an hourly OD result (a dataframe or
+        an Arrow table). Arrow tables are summed with ``pyarrow.compute`` and
+        only the per-zone sums are converted to pandas.
+        """
+        measures = ["n_trips", "trips_total_length_km"]
+        keys = ["date", "hour", "id"]
+        arrow = pa is not None and isinstance(result, pa.Table)
+
+        def _sum(data, zone_col, columns, names):
+            if arrow:
+                data = data.select(["date", "hour", zone_col] + columns).rename_columns(keys + columns)
+                # pandas' groupby drops null keys, Arrow's keeps them.
+                data = data.filter(pc.and_(pc.is_valid(data["id"]), pc.and_(pc.is_valid(data["date"]), pc.is_valid(data["hour"]))))
+                summed = Mobility._group_table(data, keys, columns).to_pandas()
             else:
-                processed_dfs = []
-                for f in tqdm.tqdm(local_list):
-                    result = self._process_single_number_of_trips_file(f)
-                    if result is not None:
-                        processed_dfs.append(result)
-
-            valid_dfs = [df for df in processed_dfs if df is not None]
-            if not valid_dfs:
-                print("No valid data found")
-                return None
+                summed = data.rename(columns={zone_col: "id"}).groupby(keys, as_index=False)[columns].sum()
+            return summed.rename(columns=dict(zip(columns, names)))
 
-            print('Concatenating all the dataframes....')
-            df = pd.concat(valid_dfs, ignore_index=True)
-            df = self._finalize_backend_dataframe(df)
-            self._saving_parquet(df, m_type)
-            if return_df:
-                return df
+        if arrow:
+            intra = result.filter(pc.equal(result["id_origin"], result["id_destination"]))
+        else:
+            intra = result[result["id_origin"] == result["id_destination"]]
+        outflow = _sum(result, "id_origin", measures, ["outflow", "outflow_km"])
+        inflow = _sum(result, "id_destination", measures, ["inflow", "inflow_km"])
+        intra = _sum(intra, "id_origin", ["n_trips"], ["intra"])
+        totals = outflow.merge(inflow, on=keys, how="outer").merge(intra, on=keys, how="left")
+        totals[_ZONE_TIMESERIES_MEASURES] = totals[_ZONE_TIMESERIES_MEASURES].fillna(0).astype(float)
+        totals["id"] = totals["id"].astype(str)
+        totals["date"] = totals["date"].astype(str)
+        return totals[["id", "date", "hour"] + _ZONE_TIMESERIES_MEASURES]
+
+    def _od_store_path(self, value: str) -> str:
+        return os.path.join(self.output_path, _OD_STORE_DIRECTORY, f"{self.zones}_v{self.version}", value)
+
+    def _od_store_metadata(self, store: str, zone_index, dtype: str) -> dict:
+        """
+        Metadata of the OD store, including its zone dictionary. They are
+        created with the store and fixed afterwards so that positions stay
+        valid across updates.
+        """
+        metadata_path = os.path.join(store, "store.json")
+        if os.path.exists(metadata_path):
+            metadata = self._read_od_store_metadata(store)
+            if zone_index is not None and list(pd.Index(zone_index).astype(str)) != metadata["zone_ids"]:
+                raise ValueError(f"zone_index differs from the zone ids of the existing OD store at {store}")
+            return metadata
+
+        if zone_index is None:
+            zone_index = self._zone_attributes()["id"]
+        metadata = {
+            "zone_ids": list(pd.Index(zone_index).astype(str)),
+            "hours": _OD_STORE_HOURS,
+            "dtype": str(np.dtype(dtype)),
+        }
+        os.makedirs(store, exist_ok=True)
+        with open(metadata_path, "w", encoding="utf-8") as fh:
+            json.dump(metadata, fh)
+        return metadata
 
-        if self.version == 1:
-            m_type = 'maestra2'
-            local_list = self._donwload_helper(m_type)
-            print('Generating parquet file for Number of Trips....')
+    @staticmethod
+    def _read_od_store_metadata(store: str) -> dict:
+        with open(os.path.join(store, "store.json"), "r", encoding="utf-8") as fh:
+            return json.load(fh)
 
-            if self.use_dask and len(local_list) > 1:
-                @delayed
-                def process_trips_file(filepath):
-                    return self._process_single_number_of_trips_file(filepath)
+    def _append_od_store(self, result, values: list) -> None:
+        """
+        Write the days of a processed hourly OD file (a dataframe or an Arrow
+        table) that are not stored yet to the OD stores of ``values``.
+        """
+        arrow = pa is not None and isinstance(result, pa.Table)
+        dates = pc.unique(result["date"]).to_pylist() if arrow else result["date"].dropna().unique().tolist()
+        for value in values:
+            store = self._od_store_path(value)
+            metadata = self._read_od_store_metadata(store)
+            for date in dates:
+                date = str(date)
+                if os.path.exists(self._od_store_day_path(store, date, "indptr")):
+                    continue
+                if arrow:
+                    day = result.filter(pc.equal(result["date"].cast(pa.string()), date))
+                else:
+                    day = result[result["date"].astype(str) == date]
+                self._write_od_store_day(store, date, day, metadata, value)
 
-                delayed_tasks = [process_trips_file(f) for f in local_list]
-                try:
-                    processed_dfs = dd.compute(*delayed_tasks)
-                except Exception as e:
-                    print(f"Dask computation failed: {e}. Falling back to pandas processing...")
-                    processed_dfs = []
-                    for f in tqdm.tqdm(local_list):
-                        result = self._process_single_number_of_trips_file(f)
-                        if result is not None:
-                            processed_dfs.append(result)
+    @staticmethod
+    def _od_store_day_path(store: str, date: str, part: str) -> str:
+        return os.path.join(store, f"{date.replace('-', '')}.{part}.npy")
+
+    def _write_od_store_day(self, store: str, date: str, df, metadata: dict, value: str) -> None:
+        """
+        Write the hourly OD values of one day (a dataframe or an Arrow table)
+        as CSR arrays of shape ``(24 * n_zones, n_zones)``.
+        """
+        zone_ids = pd.Index(metadata["zone_ids"])
+        n_zones = len(zone_ids)
+        origins = self._zone_positions(df["id_origin"], zone_ids)
+        destinations = self._zone_positions(df["id_destination"], zone_ids)
+        hours = self._numeric_values(df["hour"], -1)
+        known = (origins >= 0) & (destinations >= 0) & (hours >= 0) & (hours < _OD_STORE_HOURS)
+        if not known.all():
+            warnings.warn(
+                f"{int((~known).sum())} OD rows of {date} refer to zone ids missing from the OD store or to invalid "
+                "hours and were not stored.",
+                RuntimeWarning,
+                stacklevel=3,
+            )
+
+        rows = hours[known].astype(np.int64) * n_zones + origins[known]
+        keys, inverse = np.unique(rows * n_zones + destinations[known], return_inverse=True)
+        data = np.bincount(inverse, weights=self._numeric_values(df[value], 0.0)[known])
+        indptr = np.zeros(_OD_STORE_HOURS * n_zones + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n_zones, minlength=_OD_STORE_HOURS * n_zones), out=indptr[1:])
+
+        np.save(self._od_store_day_path(store, date, "data"), data.astype(metadata["dtype"]))
+        np.save(self._od_store_day_path(store, date, "indices"), (keys % n_zones).astype(np.int32))
+        # indptr is written last: its presence marks the day as complete.
+        np.save(self._od_store_day_path(store, date, "indptr"), indptr)
+
+    @staticmethod
+    def _numeric_values(column, fill: float) -> np.ndarray:
+        """
+        Float values of a pandas or Arrow column, with ``fill`` for NA.
+        """
+        if pa is not None and isinstance(column, (pa.Array, pa.ChunkedArray)):
+            return pc.fill_null(column.cast(pa.float64()), fill).to_numpy()
+        return pd.to_numeric(column, errors="coerce").to_numpy(dtype=float, na_value=fill)
+
+    @staticmethod
+    def _zone_positions(ids, zone_index: pd.Index) -> np.ndarray:
+        """
+        Position of every id (of a pandas or Arrow column) in ``zone_index``,
+        or -1 for ids missing from it (and NA). Each distinct id is looked up
+        once.
+        """
+        if pa is not None and isinstance(ids, (pa.Array, pa.ChunkedArray)):
+            positions = pc.index_in(ids.cast(pa.string()), value_set=pa.array(zone_index.astype(str), pa.string()))
+            return pc.fill_null(positions, -1).to_numpy().astype(np.int64)
+        codes, uniques = pd.factorize(ids)
+        lookup = np.append(zone_index.get_indexer(pd.Index(uniques).astype(str)), -1)
+        return lookup[codes]
+
+    def _zone_attributes(self) -> pd.DataFrame:
+        """
+        Zone attributes of this object's zoning (without geometries), loaded
+        once per object.
+        """
+        if self._zone_attributes_df is None:
+            from pyspainmobility.zones.zones import Zones
+
+            zones = Zones(zones=self.zones.lower(), version=self.version, output_directory=self.output_path)
+            self._zone_attributes_df = zones.get_zone_table().reset_index()
+        return self._zone_attributes_df
+
+    def _open_output_dataset(self, mobility_type: str, source=None):
+        if source is None:
+            utils.mobility_assert(mobility_type)
+            m_type = utils.mobility_type_normalization(mobility_type, self.version)
+            source = self._output_parquet_path(m_type)
+            if not os.path.exists(source):
+                raise FileNotFoundError(
+                    f"No stored output found at {source}. Call the corresponding get_* method first or pass source=."
+                )
+        return pads.dataset(source, format="parquet")
+
+    @staticmethod
+    def _filters_to_expression(filters, schema):
+        """
+        Translate a ``filters`` dictionary into a pyarrow expression over the
+        stored columns.
+        """
+        if filters is None or isinstance(filters, pc.Expression):
+            return filters
+
+        expression = None
+        for column, values in filters.items():
+            if column not in schema.names:
+                raise ValueError(f"Unknown filter column '{column}'. Available columns: {', '.join(schema.names)}")
+            field = pc.field(column)
+            column_type = schema.field(column).type
+            if pa.types.is_dictionary(column_type):
+                column_type = column_type.value_type
+
+            if isinstance(values, slice):
+                condition = None
+                if values.start is not None:
+                    condition = field >= pa.scalar(values.start).cast(column_type)
+                if values.stop is not None:
+                    upper = field <= pa.scalar(values.stop).cast(column_type)
+                    condition = upper if condition is None else condition & upper
+                if condition is None:
+                    continue
             else:
-                processed_dfs = []
-                for f in tqdm.tqdm(local_list):
-                    result = self._process_single_number_of_trips_file(f)
-                    if result is not None:
-                        processed_dfs.append(result)
-
-            valid_dfs = [df for df in processed_dfs if df is not None]
-            if not valid_dfs:
-                print("No valid data found")
-                return None
+                if isinstance(values, (str, int, float, np.integer)) or not hasattr(values, "__iter__"):
+                    values = [values]
+                value_set = pa.array(list(values))
+                if value_set.type != column_type:
+                    value_set = value_set.cast(column_type)
+                condition = field.isin(value_set)
 
-            print('Concatenating all the dataframes....')
-            df = pd.concat(valid_dfs, ignore_index=True)
-            df = self._finalize_backend_dataframe(df)
-            self._saving_parquet(df, m_type)
-            if return_df:
-                return df
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def plan(self, mobility_type: str = "od", return_df: bool = False, keep_activity: bool = False, social_agg: bool = False) -> pd.DataFrame:
+        """
+        Estimate the cost of processing the requested dates with every available engine.
+
+        Sizes are taken from the raw files already cached in the output directory. Files that are not cached yet are
+        extrapolated from the cached ones or, if none is cached, from typical MITMA file sizes for the selected zoning.
+
+        Parameters
+        ----------
+        mobility_type : str
+            Default value is 'od'. The dataset to plan for. Must be one of the following: od, origin-destination, os, overnight_stays, nt, number_of_trips
+        return_df : bool
+            Default value is False. Whether the result will be returned, which requires holding it in memory.
+        keep_activity : bool
+            Default value is False. Same meaning as in :meth:`get_od_data`, used to estimate the output size.
+        social_agg : bool
+            Default value is False. Same meaning as in :meth:`get_od_data`, used to estimate the output size.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per engine with the estimated rows, compressed and decompressed bytes, peak memory and runtime.
+            The 'viable' column tells whether the peak memory fits in the available RAM and the 'selected' column
+            marks the engine that engine='auto' would use.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Mobility
+        >>> mobility_data = Mobility(version=2, zones='municipalities', start_date='2022-01-01', end_date='2022-01-31', engine='auto')
+        >>> print(mobility_data.plan('od')[['workers', 'est_peak_memory_bytes', 'est_runtime_seconds', 'selected']])
+                    workers  est_peak_memory_bytes  est_runtime_seconds  selected
+        engine
+        sequential        1           8.673750e+09           516.666667     False
+        threads           4           1.272375e+10           206.666667      True
+        processes         1           1.599750e+10           644.461887     False
+        streaming         1           1.586250e+09           542.500000     False
+        """
+        utils.mobility_assert(mobility_type)
+        m_type = utils.mobility_type_normalization(mobility_type, self.version)
+        if mobility_type in ("od", "origin-destination") and self.version == 1:
+            keep_activity, social_agg = False, False
+        return self._build_plan(m_type, return_df, keep_activity=keep_activity, social_agg=social_agg)
+
+    @staticmethod
+    def _available_memory() -> Optional[int]:
+        """
+        Available RAM in bytes, or None when it cannot be determined.
+        """
+        if psutil is not None:
+            return int(psutil.virtual_memory().available)
+        try:
+            return int(os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE"))
+        except (AttributeError, ValueError, OSError):
+            return None
+
+    def _build_plan(self, m_type: str, return_df: bool = False, keep_activity: bool = False, social_agg: bool = False) -> pd.DataFrame:
+        """
+        Cost model behind :meth:`plan`.
+        """
+        profile = _PLAN_PROFILES[m_type]
+        backend = _BACKEND_PROFILES[self.backend]
+
+        paths = [self._local_raw_path(d, m_type) for d in self.dates]
+        cached_sizes = [os.path.getsize(p) for p in paths if os.path.exists(p) and os.path.getsize(p) > 0]
+        n_files = len(paths)
+        if cached_sizes:
+            per_file_bytes = float(pd.Series(cached_sizes).median())
+        else:
+            per_file_bytes = profile["compressed_bytes"].get(self.zones, max(profile["compressed_bytes"].values()))
+
+        compressed = sum(cached_sizes) + per_file_bytes * (n_files - len(cached_sizes))
+        decompressed = compressed * _GZIP_EXPANSION
+        rows = decompressed / profile["csv_bytes_per_row"]
+
+        output_ratio = profile["output_ratio"]
+        if keep_activity:
+            output_ratio *= 2.0
+        if social_agg:
+            output_ratio *= 2.5
+        output_bytes = rows * min(output_ratio, 1.0) * _OUTPUT_BYTES_PER_ROW
+        file_peak = rows / max(n_files, 1) * backend["bytes_per_row"]
+        base_runtime = rows / backend["rows_per_second"]
+
+        memory = self._available_memory()
+        budget = None if memory is None else 0.8 * memory
+        cores = os.cpu_count() or 1
+
+        def _workers(held_output):
+            workers = max(1, min(cores, n_files))
+            if budget is not None and file_peak > 0:
+                workers = max(1, min(workers, int((budget - held_output) // file_peak)))
+            return workers
+
+        # GIL-bound string normalisation limits thread scaling, Arrow parsing
+        # releases it for a larger share of the work.
+        thread_gain = 0.5 if self.backend == "arrow" else 0.25
+        estimates = []
+        estimates.append(("sequential", 1, base_runtime, file_peak + output_bytes))
+        workers = _workers(output_bytes)
+        estimates.append((
+            "threads", workers, base_runtime / (1 + (workers - 1) * thread_gain), workers * file_peak + output_bytes
+        ))
+        workers = _workers(2 * output_bytes)
+        estimates.append((
+            "processes",
+            workers,
+            base_runtime / (workers * 0.85) + output_bytes / 200e6,
+            workers * file_peak + 2 * output_bytes,
+        ))
+        estimates.append((
+            "streaming",
+            1,
+            base_runtime * 1.05,
+            file_peak + (output_bytes if return_df else output_bytes / max(n_files, 1)),
+        ))
+        if dd is not None and delayed is not None:
+            workers = _workers(output_bytes)
+            estimates.append((
+                "dask", workers, base_runtime / (1 + (workers - 1) * thread_gain) * 1.1, workers * file_peak + output_bytes
+            ))
+
+        plan = pd.DataFrame(
+            [
+                {
+                    "engine": engine,
+                    "workers": workers,
+                    "files": n_files,
+                    "cached_files": len(cached_sizes),
+                    "est_rows": int(rows),
+                    "est_compressed_bytes": compressed,
+                    "est_decompressed_bytes": decompressed,
+                    "est_peak_memory_bytes": peak,
+                    "est_runtime_seconds": runtime,
+                    "viable": budget is None or peak <= budget,
+                }
+                for engine, workers, runtime, peak in estimates
+            ]
+        ).set_index("engine")
+
+        candidates = plan[plan["viable"]]
+        chosen = candidates["est_runtime_seconds"].idxmin() if not candidates.empty else "streaming"
+        plan["selected"] = plan.index == chosen
+        return plan
+
+    def _select_engine(self, m_type: str, return_df: bool = False, keep_activity: bool = False, social_agg: bool = False) -> str:
+        """
+        Resolve the configured engine, running the planner and reporting its
+        choice when engine='auto'.
+        """
+        if self.engine != "auto":
+            return self.engine
+
+        plan = self._build_plan(m_type, return_df, keep_activity=keep_activity, social_agg=social_agg)
+        engine = plan.index[plan["selected"]][0]
+        chosen = plan.loc[engine]
+        self._planned_workers[engine] = int(chosen["workers"])
+        print(
+            f"Execution plan: engine='{engine}' with {int(chosen['workers'])} worker(s) for {int(chosen['files'])} file(s) "
+            f"(~{chosen['est_rows'] / 1e6:.1f}M rows, ~{chosen['est_decompressed_bytes'] / 1e9:.2f} GB decompressed, "
+            f"~{chosen['est_peak_memory_bytes'] / 1e9:.2f} GB peak memory, ~{chosen['est_runtime_seconds']:.0f} s)"
+        )
+        return engine
+
+    def _run_pipeline(
+        self,
+        process_fn,
+        local_list: list,
+        m_type: str,
+        return_df: bool,
+        engine: str,
+        *args,
+        group_cols: list = None,
+        measures: list = None,
+        time_resolution: str = "hour",
+        return_type: str = "pandas",
+        aggregates: bool = False,
+        dates: list = None,
+        zone_timeseries: bool = False,
+        od_store: list = None,
+    ):
+        """
+        Process the raw files with the given engine, then concatenate,
+        finalize and save the result. With a time resolution coarser than a
+        day, the per-file partial sums are combined across files on
+        ``group_cols``. With ``aggregates`` the OD aggregates are computed
+        from the per-file results and saved next to the output. ``dates``
+        are the processed days the day-type averages divide by. With
+        ``zone_timeseries`` the per-zone totals of the days missing from the
+        zone time-series store are appended to it, and the days missing from
+        the OD stores of the ``od_store`` values are written to them.
+        """
+        cache_entry = None
+        if self.cache and local_list:
+            cache_entry = self._result_cache_entry(m_type, local_list, args, aggregates=aggregates, return_type=return_type)
+            hit, cached = self._load_cached_result(cache_entry, m_type, return_df, return_type, engine)
+            if hit:
+                return cached
+
+        combine = time_resolution in ("week", "month", "day_type")
+        if engine == "streaming":
+            if pa is not None and pq is not None:
+                result = self._stream_to_parquet(
+                    process_fn, local_list, m_type, return_df, *args,
+                    group_cols=group_cols if combine else None, measures=measures, time_resolution=time_resolution,
+                    return_type=return_type, aggregates=aggregates, dates=dates,
+                    zone_timeseries=zone_timeseries, od_store=od_store,
+                )
+                if cache_entry is not None and os.path.exists(self._output_parquet_path(m_type)):
+                    self._store_cached_result(
+                        cache_entry, source_file=self._output_parquet_path(m_type),
+                        aggregates_path=self._od_aggregates_path(m_type),
+                    )
+                return result
+            warnings.warn(
+                "engine='streaming' requires pyarrow. Falling back to engine='sequential'.",
+                RuntimeWarning,
+                stacklevel=3,
+            )
+            engine = "sequential"
+
+        processed_dfs = self._map_files(process_fn, local_list, engine, *args)
+        valid_dfs = [df for df in processed_dfs if df is not None]
+        if not valid_dfs:
+            print("No valid data found")
+            return None
+
+        if aggregates:
+            partials = None
+            for result in valid_dfs:
+                partials = self._merge_od_aggregates(partials, self._od_partial_aggregates(result, time_resolution))
+            self._save_od_aggregates(partials, m_type, time_resolution, dates)
+        if zone_timeseries:
+            self._append_zone_timeseries(valid_dfs)
+        if od_store:
+            for result in valid_dfs:
+                self._append_od_store(result, od_store)
+
+        print("Concatenating all the dataframes....")
+        df = self._concat_results(valid_dfs)
+        if combine:
+            df = self._combine_results(df, group_cols, measures)
+        if time_resolution == "day_type":
+            df = self._average_day_types(df, measures, dates)
+        df = self._finalize_backend_dataframe(df)
+        self._saving_parquet(df, m_type)
+        if cache_entry is not None:
+            self._store_cached_result(cache_entry, df=df, aggregates_path=self._od_aggregates_path(m_type))
+        return df if return_df else None
+
+    def _od_partial_aggregates(self, result, time_resolution: str) -> dict:
+        """
+        Aggregates of one processed OD file (a dataframe or an Arrow table),
+        returned as small pandas dataframes.
+        """
+        measures = ["n_trips", "trips_total_length_km"]
+        time_keys = _TIME_KEYS[time_resolution]
+        day_keys = [key for key in time_keys if key != "hour"]
+
+        def _sum(data, keys, columns):
+            grouped = self._combine_results(data, keys, columns)
+            return grouped.to_pandas() if pa is not None and isinstance(grouped, pa.Table) else grouped
+
+        if pa is not None and isinstance(result, pa.Table):
+            intra = result.filter(pc.equal(result["id_origin"], result["id_destination"]))
+        else:
+            intra = result[result["id_origin"] == result["id_destination"]]
+        partial = {
+            "by_origin": _sum(result, day_keys + ["id_origin"], measures),
+            "by_destination": _sum(result, day_keys + ["id_destination"], measures),
+            "daily_totals": _sum(result, day_keys, measures).merge(
+                _sum(intra, day_keys, ["n_trips"]).rename(columns={"n_trips": "intra_trips"}), on=day_keys, how="left"
+            ),
+        }
+        if "hour" in time_keys:
+            partial["by_hour"] = _sum(result, time_keys, measures)
+        return partial
+
+    @staticmethod
+    def _merge_od_aggregates(partials: Optional[dict], partial: dict) -> dict:
+        """
+        Add the aggregates of one more file to the running ones.
+        """
+        if partials is None:
+            return partial
+        merged = {}
+        for name, df in partial.items():
+            measures = [col for col in ("n_trips", "trips_total_length_km", "intra_trips") if col in df.columns]
+            keys = [col for col in df.columns if col not in measures]
+            combined = pd.concat([partials[name], df], ignore_index=True)
+            merged[name] = combined.groupby(keys, as_index=False, dropna=False)[measures].sum(min_count=1)
+        return merged
+
+    def _save_od_aggregates(self, partials: dict, m_type: str, time_resolution: str, dates: list = None) -> None:
+        """
+        Finalize the OD aggregates and save one parquet file per aggregate.
+        """
+        directory = self._od_aggregates_path(m_type)
+        # Aggregates of a previous call (e.g. by_hour of an hourly run) must not outlive it.
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        for name, df in partials.items():
+            measures = [col for col in ("n_trips", "trips_total_length_km", "intra_trips") if col in df.columns]
+            if name == "daily_totals":
+                df = df.assign(intra_trips=df["intra_trips"].fillna(0))
+            if time_resolution == "day_type":
+                df = self._average_day_types(df, measures, dates)
+            if name == "daily_totals":
+                df = df.assign(intra_share=df["intra_trips"] / df["n_trips"])
+            self._write_parquet(self._finalize_backend_dataframe(df), os.path.join(directory, f"{name}.parquet"))
+        print('Aggregates generated successfully at ', directory)
+
+    def _od_aggregates_path(self, m_type: str) -> str:
+        return self._output_parquet_path(m_type)[:-len(".parquet")] + "_aggregates"
+
+    def _result_cache_entry(
+        self, m_type: str, local_list: list, args: tuple, aggregates: bool = False, return_type: str = "pandas"
+    ) -> dict:
+        """
+        Build the cache key of a get_* call: a hash of everything the result
+        depends on, plus the manifest of the raw files it is computed from.
+        With ``aggregates`` the OD aggregates are cached with the result.
+        """
+        def _jsonable(value):
+            if isinstance(value, (set, frozenset, range)):
+                return sorted((_jsonable(v) for v in value), key=str)
+            if isinstance(value, dict):
+                return {str(k): _jsonable(v) for k, v in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [_jsonable(v) for v in value]
+            return value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+
+        params = {
+            "schema_version": _RESULT_SCHEMA_VERSION,
+            "dataset": m_type,
+            "version": self.version,
+            "zones": self.zones,
+            "dates": self.dates,
+            "backend": self.backend,
+            # The cached file is copied to the output, so it must have been written with the same layout.
+            "parquet_layout": _jsonable(self.parquet_layout),
+            "aggregates": bool(aggregates),
+            # The pandas and Arrow paths write different column types, so each keeps its own entry.
+            "return_type": return_type,
+            "arguments": _jsonable(list(args)),
+        }
+        key = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+        manifest = []
+        for path in local_list:
+            stat = os.stat(path) if os.path.exists(path) else None
+            manifest.append([os.path.basename(path), stat.st_size if stat else None, stat.st_mtime_ns if stat else None])
+
+        cache_directory = os.path.join(self.output_path, _RESULT_CACHE_DIRECTORY)
+        stem = os.path.join(cache_directory, f"{m_type}_{self.zones}_v{self.version}_{key}")
+        return {
+            "result": f"{stem}.parquet",
+            "manifest": f"{stem}.json",
+            "aggregates": f"{stem}_aggregates" if aggregates else None,
+            "content": {"params": params, "files": manifest},
+        }
+
+    def _load_cached_result(self, cache_entry: dict, m_type: str, return_df: bool, return_type: str = "pandas", engine: str = None):
+        """
+        Return ``(True, result)`` when a valid cached result exists, otherwise
+        ``(False, None)``. The result has the type an uncached call with the
+        same engine returns.
+        """
+        if not (os.path.exists(cache_entry["result"]) and os.path.exists(cache_entry["manifest"])):
+            return False, None
+        try:
+            with open(cache_entry["manifest"], "r", encoding="utf-8") as fh:
+                stored = json.load(fh)
+        except (OSError, ValueError):
+            return False, None
+        if stored != cache_entry["content"]:
+            return False, None
+        if cache_entry["aggregates"] is not None and not os.path.isdir(cache_entry["aggregates"]):
+            return False, None
+
+        print(f"Loading cached result from {cache_entry['result']}")
+        shutil.copyfile(cache_entry["result"], self._output_parquet_path(m_type))
+        if cache_entry["aggregates"] is not None:
+            shutil.rmtree(self._od_aggregates_path(m_type), ignore_errors=True)
+            shutil.copytree(cache_entry["aggregates"], self._od_aggregates_path(m_type))
+        if not return_df:
+            return True, None
+        if pq is not None:
+            if return_type == "arrow" and engine == "streaming":
+                parquet_file = pq.ParquetFile(self._output_parquet_path(m_type), memory_map=True)
+                return True, pa.RecordBatchReader.from_batches(parquet_file.schema_arrow, parquet_file.iter_batches())
+            table = pq.read_table(cache_entry["result"], memory_map=True)
+            if return_type == "arrow":
+                return True, table
+            df = table.to_pandas(types_mapper=pd.ArrowDtype) if self.backend == "arrow" else table.to_pandas()
+        else:
+            df = pd.read_parquet(cache_entry["result"])
+        return True, self._finalize_backend_dataframe(df)
+
+    def _store_cached_result(
+        self, cache_entry: dict, df: pd.DataFrame = None, source_file: str = None, aggregates_path: str = None
+    ) -> None:
+        os.makedirs(os.path.dirname(cache_entry["result"]), exist_ok=True)
+        if source_file is not None:
+            shutil.copyfile(source_file, cache_entry["result"])
+        else:
+            self._write_parquet(df, cache_entry["result"])
+        if cache_entry["aggregates"] is not None:
+            shutil.rmtree(cache_entry["aggregates"], ignore_errors=True)
+            shutil.copytree(aggregates_path, cache_entry["aggregates"])
+        # The manifest is written last so an interrupted write never looks valid.
+        with open(cache_entry["manifest"], "w", encoding="utf-8") as fh:
+            json.dump(cache_entry["content"], fh)
+
+    def _map_files(self, process_fn, local_list: list, engine: str, *args) -> list:
+        """
+        Apply ``process_fn`` to every raw file with the given engine. Parallel
+        engines fall back to sequential processing if they fail.
+        """
+        if engine in ("threads", "processes", "dask") and local_list:
+            try:
+                if engine == "dask":
+                    print("Processing with Dask...")
+                    delayed_tasks = [delayed(process_fn)(f, *args) for f in local_list]
+                    return list(dd.compute(*delayed_tasks))
+
+                workers = self._planned_workers.get(engine) or max(1, min(os.cpu_count() or 1, len(local_list)))
+                executor_cls = ThreadPoolExecutor if engine == "threads" else ProcessPoolExecutor
+                with executor_cls(max_workers=workers) as executor:
+                    futures = [executor.submit(process_fn, f, *args) for f in local_list]
+                    return [future.result() for future in tqdm.tqdm(futures)]
+            except Exception as e:
+                print(f"{engine.capitalize()} computation failed: {e}. Falling back to sequential processing...")
+
+        return [process_fn(f, *args) for f in tqdm.tqdm(local_list)]
+
+    def _iter_files(self, process_fn, local_list: list, engine: str, *args):
+        """
+        Like ``_map_files``, but yield the results in file order as they are
+        ready, so the caller can reduce them one at a time. Parallel engines
+        ('dask' runs on threads here) keep at most one file per worker in
+        flight; if they fail, the remaining files are processed sequentially.
+        """
+        done = 0
+        if engine in ("threads", "processes", "dask") and local_list:
+            try:
+                workers = self._planned_workers.get(engine) or max(1, min(os.cpu_count() or 1, len(local_list)))
+                executor_cls = ProcessPoolExecutor if engine == "processes" else ThreadPoolExecutor
+                with executor_cls(max_workers=workers) as executor:
+                    pending = []
+                    for filepath in tqdm.tqdm(local_list):
+                        pending.append(executor.submit(process_fn, filepath, *args))
+                        if len(pending) > workers:
+                            result = pending.pop(0).result()
+                            done += 1
+                            yield result
+                    while pending:
+                        result = pending.pop(0).result()
+                        done += 1
+                        yield result
+                return
+            except Exception as e:
+                print(f"{engine.capitalize()} computation failed: {e}. Falling back to sequential processing...")
+
+        for f in tqdm.tqdm(local_list[done:]):
+            yield process_fn(f, *args)
+
+    def _stream_to_parquet(
+        self,
+        process_fn,
+        local_list: list,
+        m_type: str,
+        return_df: bool,
+        *args,
+        group_cols: list = None,
+        measures: list = None,
+        time_resolution: str = "hour",
+        return_type: str = "pandas",
+        aggregates: bool = False,
+        dates: list = None,
+        zone_timeseries: bool = False,
+        od_store: list = None,
+    ):
+        """
+        Process the files one at a time and append every result to the output
+        parquet file, so the concatenated dataframe is never held in memory.
+        When ``group_cols`` is given, only the running combined partial sums
+        are kept and written once at the end. With ``return_type='arrow'``
+        the written file is returned as a ``pyarrow.RecordBatchReader``.
+        """
+        output_file = self._output_parquet_path(m_type)
+        print('Streaming the parquet file....')
+        writer = None
+        combined = None
+        partials = None
+        zone_totals = []
+
+        def _write(df):
+            nonlocal writer
+            table = self._to_layout_table(self._finalize_backend_dataframe(df))
+            if writer is None:
+                # All-null columns of the first file would otherwise pin a null type.
+                schema = pa.schema(
+                    [field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in table.schema],
+                    metadata=table.schema.metadata,
+                )
+                writer = pq.ParquetWriter(output_file, schema, **self._parquet_writer_options(schema.names))
+            writer.write_table(table.cast(writer.schema), row_group_size=self._row_group_size())
 
+        try:
+            for f in tqdm.tqdm(local_list):
+                df = process_fn(f, *args)
+                if df is None or (df.num_rows == 0 if isinstance(df, pa.Table) else df.empty):
+                    continue
+                if aggregates:
+                    partials = self._merge_od_aggregates(partials, self._od_partial_aggregates(df, time_resolution))
+                if zone_timeseries:
+                    zone_totals.append(self._zone_totals(df))
+                if od_store:
+                    self._append_od_store(df, od_store)
+                if group_cols is None:
+                    _write(df)
+                    continue
+                combined = df if combined is None else self._concat_results([combined, df])
+                combined = self._combine_results(combined, group_cols, measures)
+
+            if combined is not None:
+                if time_resolution == "day_type":
+                    combined = self._average_day_types(combined, measures, dates)
+                _write(combined)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            print("No valid data found")
+            return None
+        print('Parquet file generated successfully at ', output_file)
+        if partials is not None:
+            self._save_od_aggregates(partials, m_type, time_resolution, dates)
+        if zone_totals:
+            self._write_zone_timeseries(zone_totals)
+        if return_df and return_type == "arrow":
+            parquet_file = pq.ParquetFile(output_file, memory_map=True)
+            return pa.RecordBatchReader.from_batches(parquet_file.schema_arrow, parquet_file.iter_batches())
+        if return_df:
+            return self._finalize_backend_dataframe(pd.read_parquet(output_file))
         return None
 
+    def _output_parquet_path(self, m_type: str) -> str:
+        return os.path.join(
+            self.output_path, f"{m_type}_{self.zones}_{self.start_date}_{self.end_date}_v{self.version}.parquet"
+        )
+
+    def _local_raw_path(self, date: str, m_type: str) -> str:
+        extension = "csv.gz" if self.version == 2 else "txt.gz"
+        return os.path.join(self.output_path, f"{date.replace('-', '')}_{m_type}_{self.zones}_v{self.version}.{extension}")
+
     def _saving_parquet(self, df: pd.DataFrame, m_type: str):
         print('Writing the parquet file....')
-        df.to_parquet(
-            os.path.join(self.output_path,
-                         f"{m_type}_{self.zones}_{self.start_date}_{self.end_date}_v{self.version}.parquet"),
-            index=False)
-        print('Parquet file generated successfully at ',
-              os.path.join(self.output_path, f"{m_type}_{self.zones}_{self.start_date}_{self.end_date}_v{self.version}.parquet"))
-
-    def _donwload_helper(self, m_type:str):
+        output_file = self._output_parquet_path(m_type)
+        self._write_parquet(df, output_file)
+        print('Parquet file generated successfully at ', output_file)
+
+    def _write_parquet(self, df: pd.DataFrame, path: str) -> None:
+        """
+        Write ``df`` with the configured parquet layout.
+        """
+        if self.parquet_layout is None:
+            if pa is not None and isinstance(df, pa.Table):
+                pq.write_table(df, path)
+            else:
+                df.to_parquet(path, index=False)
+            return
+        table = self._to_layout_table(df)
+        pq.write_table(
+            table,
+            path,
+            row_group_size=self._row_group_size(),
+            **self._parquet_writer_options(table.schema.names),
+        )
+
+    def _to_layout_table(self, df: pd.DataFrame):
+        """
+        Convert ``df`` to an Arrow table sorted as the layout requires, with
+        the layout recorded in the schema metadata.
+        """
+        table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+        if self.parquet_layout is None:
+            return table
+
+        sort_by = [col for col in self.parquet_layout["sort_by"] if col in table.schema.names]
+        if sort_by:
+            table = table.sort_by([(col, "ascending") for col in sort_by])
+        layout = {
+            key: value for key, value in self.parquet_layout.items() if key not in ("sort_by", "dictionary_columns")
+        }
+        layout["sort_by"] = sort_by
+        layout["dictionary_columns"] = self._dictionary_columns(table.schema.names)
+        metadata = dict(table.schema.metadata or {})
+        metadata[_PARQUET_LAYOUT_METADATA_KEY] = json.dumps(layout).encode("utf-8")
+        return table.replace_schema_metadata(metadata)
+
+    def _dictionary_columns(self, names: list) -> list:
+        return [col for col in self.parquet_layout["dictionary_columns"] if col in names]
+
+    def _row_group_size(self) -> Optional[int]:
+        return None if self.parquet_layout is None else self.parquet_layout["row_group_size"]
+
+    def _parquet_writer_options(self, names: list) -> dict:
+        if self.parquet_layout is None:
+            return {}
+        return {
+            "compression": self.parquet_layout["compression"],
+            "compression_level": self.parquet_layout["compression_level"],
+            "use_dictionary": self._dictionary_columns(names),
+            "write_statistics": True,
+        }
+
+    def _donwload_helper(self, m_type:str, dates: list = None):
         local_list = []
+        dates = self.dates if dates is None else dates
         if self.version == 2:
-            for d in self.dates:
+            for d in dates:
                 d_first = d[:7]
                 d_second = d.replace("-", "")
                 if m_type == 'Personas':
@@ -951,8 +3018,8 @@ class Mobility:
 
                 print('Downloading file from', download_url)
                 try:
-                    utils.download_file_if_not_existing(download_url,os.path.join(self.output_path, f"{d_second}_{m_type}_{self.zones}_v{self.version}.csv.gz"))
-                    local_list.append(os.path.join(self.output_path, f"{d_second}_{m_type}_{self.zones}_v{self.version}.csv.gz"))
+                    utils.download_file_if_not_existing(download_url, self._local_raw_path(d, m_type))
+                    local_list.append(self._local_raw_path(d, m_type))
                 except Exception as exc:
                     print(f"[warn] Failed to download {download_url}: {exc}")
                     continue
@@ -961,13 +3028,13 @@ class Mobility:
             if self.zones == 'gaus':
                 raise Exception('gaus is not a valid zone for version 1. Please use version 2 or use a different zone')
 
-            for d in self.dates:
+            for d in dates:
                 d_first = d[:7]
                 d_second = d.replace("-", "")
                 try:
                     url_base = f"https://opendata-movilidad.mitma.es/{m_type}-mitma-{self.zones}/ficheros-diarios/{d_first}/{d_second}_{m_type[:-1]}_{m_type[-1]}_mitma_{self.zones[:-1]}.txt.gz"
-                    utils.download_file_if_not_existing(url_base, os.path.join(self.output_path, f"{d_second}_{m_type}_{self.zones}_v{self.version}.txt.gz"))
-                    local_list.append(os.path.join(self.output_path, f"{d_second}_{m_type}_{self.zones}_v{self.version}.txt.gz"))
+                    utils.download_file_if_not_existing(url_base, self._local_raw_path(d, m_type))
+                    local_list.append(self._local_raw_path(d, m_type))
                 except Exception as exc:
                     print(f"[warn] Failed to download {url_base}: {exc}")
                     continue
@@ -1,10 +1,50 @@
 from pyspainmobility.utils import utils
 import pandas as pd
 import geopandas as gpd
+import hashlib
+import json
 import os
+import threading
+import warnings
 import matplotlib
+import numpy as np
+import shapely
+import pyarrow.parquet as pq
+from collections import OrderedDict
 from os.path import expanduser
 
+# Optional SciPy import – only used by the sparse distance matrix
+try:
+    import scipy.sparse as sparse
+    from scipy.spatial import cKDTree
+except ImportError:
+    sparse = None
+    cKDTree = None
+
+# Process-wide LRU cache of zone links, frames and relation tables shared by
+# all Zones instances. Keys include a manifest (size, modification time) of the
+# files a value is read from, so changed files are read again.
+_ZONE_CACHE = OrderedDict()
+_ZONE_CACHE_LOCK = threading.Lock()
+_ZONE_CACHE_SIZE = 16
+
+# Simplification tolerances (degrees, EPSG:4326) of the rendering resolutions
+# of get_zone_geodataframe: about 50 m, 250 m and 1 km.
+_GEOMETRY_RESOLUTIONS = {"high": 0.0005, "medium": 0.0025, "low": 0.01}
+
+# Metric CRS (ETRS89-extended / LAEA Europe) of centroids and distances.
+_METRIC_CRS = "EPSG:3035"
+_CENTROIDS = ("geometric", "population")
+
+# Zones sharing a boundary point (queen) or a boundary segment (rook) are neighbours.
+_CONTIGUITY = ("queen", "rook")
+
+# Weightings of the overlap weights between zones and a target layer.
+_OVERLAP_WEIGHTINGS = ("area", "population")
+
+# Zoning -> level of the relation index, also used by Mobility.reaggregate().
+_ZONE_LEVELS = {"distritos": "districts_mitma", "municipios": "municipalities_mitma", "gaus": "luas_mitma"}
+
 class Zones:
     def __init__(self, zones: str = 'municipalities', version: int = 2, output_directory: str = None):
         """
@@ -44,6 +84,8 @@ class Zones:
         self.version = version
         self.zones = utils.zone_normalization(zones)
         self.complete_df = None
+        self._zone_table = None
+        self._simplified = {}
         self._zoning_links = None
         self._downloads_ready = False
 
@@ -77,17 +119,18 @@ class Zones:
         Resolve available zoning links lazily.
         """
         if self._zoning_links is None:
-            self._zoning_links = (
-                utils.available_zoning_data(self.version, self.zones)["link"]
-                .dropna()
-                .unique()
-                .tolist()
+            self._zoning_links = self._cached(
+                "links",
+                [],
+                lambda: utils.available_zoning_data(self.version, self.zones)["link"].dropna().unique().tolist(),
+                include_output_path=False,
             )
         return self._zoning_links
 
-    def _ensure_zoning_files_downloaded(self) -> None:
+    def _ensure_zoning_files_downloaded(self, file_names: list = None) -> None:
         """
         Download required files only when the user first requests data.
+        If ``file_names`` is given, only those files are downloaded.
         """
         if self._downloads_ready:
             return
@@ -95,6 +138,8 @@ class Zones:
         links = self._get_zoning_links()
         for link in links:
             file_name = link.split("/")[-1]
+            if file_names is not None and file_name not in file_names:
+                continue
             local_path = os.path.join(self.output_path, file_name)
 
             if not os.path.exists(local_path):
@@ -104,7 +149,8 @@ class Zones:
             if self.version == 1 and file_name.endswith(".zip"):
                 utils.unzip_file(local_path, self.output_path)
 
-        self._downloads_ready = True
+        if file_names is None:
+            self._downloads_ready = True
 
     def _load_zone_geodataframe(self) -> None:
         """
@@ -112,46 +158,29 @@ class Zones:
         """
         if self.complete_df is not None:
             return
+        self.complete_df = self._cached("geodataframe", self._zone_files(), self._build_zone_geodataframe)
 
+    def _build_zone_geodataframe(self):
         self._ensure_zoning_files_downloaded()
         print("Zones already downloaded. Reading the files....")
-        output_file_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.geojson")
+        output_file_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.parquet")
+        legacy_file_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.geojson")
 
         if os.path.exists(output_file_path):
             print(f"File {output_file_path} already exists. Loading it...")
-            self.complete_df = gpd.read_file(output_file_path)
-            return
+            return gpd.read_parquet(output_file_path)
+
+        if os.path.exists(legacy_file_path):
+            # Caches written by previous releases are converted to GeoParquet once.
+            print(f"File {legacy_file_path} already exists. Converting it to {output_file_path}...")
+            complete_df = gpd.read_file(legacy_file_path)
+            if "id" in complete_df.columns:
+                complete_df.set_index("id", inplace=True)
+            complete_df.to_parquet(output_file_path, compression="zstd")
+            return complete_df
 
         if self.version == 2:
-            def _read_pipe_csv(path, cols):
-                """
-                Read a ‘|’-separated MITMA CSV that may or may not contain a header
-                and may start with a UTF-8 BOM. Returns a tidy DataFrame.
-                """
-                df = pd.read_csv(
-                    path,
-                    sep="|",
-                    dtype=str,
-                    header=None,
-                    names=cols,
-                    encoding="utf-8-sig",
-                )
-                df[cols[0]] = df[cols[0]].str.strip()
-                if df.iloc[0, 0].upper() == cols[0].upper():
-                    df = df.iloc[1:]
-                return df
-
-            nombre = _read_pipe_csv(
-                self._resolve_data_file(f"nombres_{self.zones}.csv"),
-                ["ID", "name"],
-            )
-            pop = (
-                _read_pipe_csv(
-                    self._resolve_data_file(f"poblacion_{self.zones}.csv"),
-                    ["ID", "population"],
-                )
-                .replace("NA", None)
-            )
+            nombre, pop = self._read_names_and_population()
 
             zonification = gpd.read_file(
                 self._resolve_data_file(f"zonificacion_{self.zones}.shp")
@@ -175,9 +204,8 @@ class Zones:
             complete_df.reset_index(inplace=True)
             complete_df.rename(columns={"ID": "id"}, inplace=True)
             complete_df.set_index("id", inplace=True)
-            complete_df.to_file(output_file_path, driver="GeoJSON")
-            self.complete_df = complete_df
-            return
+            complete_df.to_parquet(output_file_path, compression="zstd")
+            return complete_df
 
         zonification = gpd.read_file(
             os.path.join(self.output_path, f"zonificacion-{self.zones}/{self.zones}_mitma.shp")
@@ -188,9 +216,220 @@ class Zones:
         complete_df = zonification
         complete_df.rename(columns={"ID": "id"}, inplace=True)
         complete_df.set_index("id", inplace=True)
-        complete_df.to_file(output_file_path, driver="GeoJSON")
-        self.complete_df = complete_df
+        complete_df.to_parquet(output_file_path, compression="zstd")
+        return complete_df
+
+
+    def _cached(self, kind: str, files: list, loader, include_output_path: bool = True):
+        """
+        Return the value of ``loader()`` through the process-wide zone cache.
+        Callers get a deep copy of cached frames, so changing a frame in
+        place (e.g. ``.loc`` assignments) never alters the cache whatever
+        the pandas version (geometries are immutable and only referenced).
+        """
+        def _key():
+            manifest = []
+            for path in files:
+                if os.path.exists(path):
+                    stat = os.stat(path)
+                    manifest.append((path, stat.st_size, stat.st_mtime_ns))
+            output_path = os.path.abspath(self.output_path) if include_output_path else None
+            return kind, self.version, self.zones, output_path, tuple(manifest)
+
+        def _shared(value):
+            if isinstance(value, pd.DataFrame):
+                return value.copy(deep=True)
+            return list(value) if isinstance(value, list) else value
+
+        key = _key()
+        with _ZONE_CACHE_LOCK:
+            if key in _ZONE_CACHE:
+                _ZONE_CACHE.move_to_end(key)
+                return _shared(_ZONE_CACHE[key])
+
+        value = loader()
+        # Files may have been downloaded or written by the loader.
+        key = _key()
+        with _ZONE_CACHE_LOCK:
+            _ZONE_CACHE[key] = value
+            _ZONE_CACHE.move_to_end(key)
+            while len(_ZONE_CACHE) > _ZONE_CACHE_SIZE:
+                _ZONE_CACHE.popitem(last=False)
+        return _shared(value)
+
+    @staticmethod
+    def set_cache_size(size: int) -> None:
+        """
+        Set the number of entries (zone links, geodataframes, zone tables and relation tables) kept by the cache
+        shared by all the Zones instances of the process. Default is 16; 0 disables the cache.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> Zones.set_cache_size(4)
+        """
+        global _ZONE_CACHE_SIZE
+        if size < 0:
+            raise ValueError("size must be a non-negative integer")
+        with _ZONE_CACHE_LOCK:
+            _ZONE_CACHE_SIZE = int(size)
+            while len(_ZONE_CACHE) > _ZONE_CACHE_SIZE:
+                _ZONE_CACHE.popitem(last=False)
+
+    @staticmethod
+    def clear_cache() -> None:
+        """
+        Empty the cache shared by all the Zones instances of the process.
+        """
+        with _ZONE_CACHE_LOCK:
+            _ZONE_CACHE.clear()
+
+    def _spatial_index_path(self) -> str:
+        return os.path.join(self.output_path, f"{self.zones}_{self.version}_index.npz")
+
+    def _load_spatial_index(self):
+        """
+        Load the zone ids and geometries of the point lookup index from the
+        ``{zones}_{version}_index.npz`` file next to the zone cache, writing it
+        from the zone geodataframe when missing or older than the cache.
+        Geometries are stored as concatenated WKB with offsets, so the file is
+        read without pickling and without building the geodataframe.
+        """
+        index_path = self._spatial_index_path()
+        cache_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.parquet")
+        if not os.path.exists(index_path) or (
+            os.path.exists(cache_path) and os.path.getmtime(index_path) < os.path.getmtime(cache_path)
+        ):
+            gdf = self.get_zone_geodataframe()
+            gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+            wkb = shapely.to_wkb(gdf.geometry.values)
+            offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+            np.cumsum([len(item) for item in wkb], out=offsets[1:])
+            tmp_path = index_path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                ids=np.asarray(gdf.index.astype(str), dtype=str),
+                wkb=np.frombuffer(b"".join(wkb), dtype=np.uint8),
+                offsets=offsets,
+            )
+            os.replace(tmp_path, index_path)
+
+        with np.load(index_path) as data:
+            ids, buffer, offsets = data["ids"], data["wkb"].tobytes(), data["offsets"]
+        geometries = shapely.from_wkb([buffer[start:end] for start, end in zip(offsets[:-1], offsets[1:])])
+        shapely.prepare(geometries)
+        return ids.astype(object), shapely.STRtree(geometries)
 
+    def _simplified_path(self, resolution: str) -> str:
+        return os.path.join(self.output_path, f"{self.zones}_{self.version}_{resolution}.parquet")
+
+    def _build_simplified_geodataframes(self) -> None:
+        """
+        Write the zones simplified at every rendering resolution next to the
+        zone cache. Shared borders are simplified once for both neighbours
+        (``shapely.coverage_simplify``), so simplified zones neither overlap
+        nor leave gaps; older GEOS versions simplify each zone on its own,
+        which keeps every polygon valid.
+        """
+        complete_df = self.get_zone_geodataframe()
+        has_geometry = complete_df.geometry.notna().to_numpy()
+        geometries = complete_df.geometry.values[has_geometry]
+        for resolution, tolerance in _GEOMETRY_RESOLUTIONS.items():
+            try:
+                simplified = shapely.coverage_simplify(np.asarray(geometries), tolerance)
+            except (AttributeError, shapely.errors.GEOSException):
+                simplified = shapely.simplify(np.asarray(geometries), tolerance, preserve_topology=True)
+            simplified_df = complete_df.copy()
+            values = np.array(complete_df.geometry.values, dtype=object, copy=True)
+            values[has_geometry] = simplified
+            simplified_df[complete_df.geometry.name] = gpd.GeoSeries(values, index=complete_df.index, crs=complete_df.crs)
+            tmp_path = self._simplified_path(resolution) + ".tmp"
+            simplified_df.to_parquet(tmp_path, compression="zstd")
+            os.replace(tmp_path, self._simplified_path(resolution))
+
+    def _load_simplified_geodataframe(self, resolution: str):
+        cache_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.parquet")
+        path = self._simplified_path(resolution)
+        if not os.path.exists(path) or (
+            os.path.exists(cache_path) and os.path.getmtime(path) < os.path.getmtime(cache_path)
+        ):
+            self._build_simplified_geodataframes()
+        return gpd.read_parquet(path)
+
+    def _zone_files(self) -> list:
+        """
+        Files the zone geodataframe and table are read from.
+        """
+        names = [f"{self.zones}_{self.version}.parquet", f"{self.zones}_{self.version}.geojson"]
+        if self.version == 2:
+            names += [f"nombres_{self.zones}.csv", f"poblacion_{self.zones}.csv", f"zonificacion_{self.zones}.shp"]
+        else:
+            names.append(f"zonificacion-{self.zones}/{self.zones}_mitma.shp")
+        return [self._resolve_data_file(name) for name in names]
+
+    @staticmethod
+    def _read_pipe_csv(path, cols):
+        """
+        Read a ‘|’-separated MITMA CSV that may or may not contain a header
+        and may start with a UTF-8 BOM. Returns a tidy DataFrame.
+        """
+        df = pd.read_csv(
+            path,
+            sep="|",
+            dtype=str,
+            header=None,
+            names=cols,
+            encoding="utf-8-sig",
+        )
+        df[cols[0]] = df[cols[0]].str.strip()
+        if df.iloc[0, 0].upper() == cols[0].upper():
+            df = df.iloc[1:]
+        return df
+
+    def _read_names_and_population(self):
+        """
+        Read the version 2 zone names and population tables.
+        """
+        nombre = self._read_pipe_csv(
+            self._resolve_data_file(f"nombres_{self.zones}.csv"),
+            ["ID", "name"],
+        )
+        pop = (
+            self._read_pipe_csv(
+                self._resolve_data_file(f"poblacion_{self.zones}.csv"),
+                ["ID", "population"],
+            )
+            .replace("NA", None)
+        )
+        return nombre, pop
+
+    def _load_zone_table(self) -> pd.DataFrame:
+        """
+        Build the zone attributes without reading or building geometries.
+        """
+        cache_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.parquet")
+        if os.path.exists(cache_path):
+            schema = pq.read_schema(cache_path)
+            geo = json.loads((schema.metadata or {}).get(b"geo", b"{}"))
+            geometry_columns = set(geo.get("columns", {})) or {"geometry"}
+            return pd.read_parquet(cache_path, columns=[col for col in schema.names if col not in geometry_columns and col != "id"])
+
+        if self.version == 2:
+            self._ensure_zoning_files_downloaded([f"nombres_{self.zones}.csv", f"poblacion_{self.zones}.csv"])
+            nombre, pop = self._read_names_and_population()
+            table = nombre.set_index("ID").join(pop.set_index("ID"))
+            table.index.name = "id"
+            return table
+
+        self._ensure_zoning_files_downloaded()
+        table = pd.DataFrame(
+            gpd.read_file(
+                os.path.join(self.output_path, f"zonificacion-{self.zones}/{self.zones}_mitma.shp"),
+                ignore_geometry=True,
+            )
+        )
+        return table.rename(columns={"ID": "id"}).set_index("id")
 
     def _resolve_data_file(self, filename: str) -> str:
         """
@@ -210,19 +449,18 @@ class Zones:
 
     def _read_relation_table(self, filename: str) -> pd.DataFrame:
         """
-        Read relation CSV files with robust delimiter detection.
+        Read relation CSV files, detecting the delimiter from the header line
+        so that the file is parsed only once.
         """
         path = self._resolve_data_file(filename)
-        for sep in ("|", ",", ";", "\t"):
-            try:
-                df = pd.read_csv(path, sep=sep, dtype=str, encoding="utf-8-sig")
-                if len(df.columns) > 1:
-                    return df
-            except Exception:
-                continue
-        return pd.read_csv(path, dtype=str, encoding="utf-8-sig")
+        with open(path, encoding="utf-8-sig") as f:
+            header = f.readline()
+        sep = max(("|", ",", ";", "\t"), key=header.count)
+        if header.count(sep) == 0:
+            sep = ","
+        return pd.read_csv(path, sep=sep, dtype=str, encoding="utf-8-sig")
 
-    def get_zone_geodataframe(self):
+    def get_zone_geodataframe(self, resolution: str = None):
         """
         Function that returns the geodataframe with the zones. The geodataframe contains the following columns:
         - id: the id of the zone
@@ -231,6 +469,12 @@ class Zones:
 
         Parameters
         ----------
+        resolution : str
+            Resolution of the geometries. Default value is None, which returns the full-resolution MITMA polygons (same
+            as 'full'). 'high', 'medium' and 'low' return the zones simplified with tolerances of about 50 m, 250 m
+            and 1 km, sharing simplified borders between neighbouring zones, which are much faster to plot and lighter
+            to export (e.g. as GeoJSON for web maps). All the simplified resolutions are computed on first request and
+            cached as ``{zones}_{version}_{resolution}.parquet`` next to the zone cache.
 
         Examples
         --------
@@ -247,10 +491,437 @@ class Zones:
         01002                                                 Amurrio    10307.0
         01004_AM                  Artziniega agregacion de municipios     3005.0
         01009_AM                   Asparrena agregacion de municipios     4599.0
+        >>> # lighter geometries for a choropleth
+        >>> gdf_low = zones.get_zone_geodataframe(resolution='low')
 
         """
-        self._load_zone_geodataframe()
-        return self.complete_df
+        if resolution in (None, "full"):
+            self._load_zone_geodataframe()
+            return self.complete_df
+        if resolution not in _GEOMETRY_RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {['full'] + list(_GEOMETRY_RESOLUTIONS)}")
+        if resolution not in self._simplified:
+            self._simplified[resolution] = self._cached(
+                f"geodataframe_{resolution}",
+                [self._simplified_path(resolution)] + self._zone_files(),
+                lambda: self._load_simplified_geodataframe(resolution),
+            )
+        return self._simplified[resolution]
+
+    def locate(self, lon, lat, chunk_size: int = 1000000) -> np.ndarray:
+        """
+        Function that returns the id of the zone containing each point, given as longitude/latitude coordinates
+        (EPSG:4326). Points are matched in bulk against a Shapely STRtree of the zone geometries with a vectorised
+        ``intersects`` query, so millions of coordinates are located without a spatial join.
+
+        The zone geometries of the index are saved in ``{zones}_{version}_index.npz`` next to the zone cache and the
+        tree is kept in the cache shared by the Zones instances of the process, so repeated lookups skip the index build.
+
+        Parameters
+        ----------
+        lon : float or array-like
+            Longitudes of the points.
+        lat : float or array-like
+            Latitudes of the points, with the same shape as ``lon``.
+        chunk_size : int
+            Number of points queried at once, bounding the memory used by the query results. Default value is 1000000.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array with the shape of ``lon`` holding the zone id of each point, or None for points outside every zone.
+            Points on a shared boundary get the first zone in the order of :meth:`get_zone_geodataframe`.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> zones = Zones(zones='municipalities', version=2, output_directory='data')
+        >>> zones.locate([-3.7038, 2.1734], [40.4168, 41.3851])
+        array(['28079', '08019'], dtype=object)
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        if lon.shape != lat.shape:
+            raise ValueError("lon and lat must have the same shape")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+
+        ids, tree = self._cached("spatial_index", [self._spatial_index_path()] + self._zone_files(), self._load_spatial_index)
+        flat_lon, flat_lat = lon.ravel(), lat.ravel()
+        positions = np.full(flat_lon.shape[0], -1, dtype=np.int64)
+        for start in range(0, flat_lon.shape[0], chunk_size):
+            points = shapely.points(flat_lon[start:start + chunk_size], flat_lat[start:start + chunk_size])
+            point_idx, zone_idx = tree.query(points, predicate="intersects")
+            # Keep the first zone of each point (query results are not ordered).
+            order = np.lexsort((zone_idx, point_idx))
+            point_idx, zone_idx = point_idx[order], zone_idx[order]
+            first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+            positions[start + point_idx[first]] = zone_idx[first]
+
+        result = np.full(positions.shape[0], None, dtype=object)
+        found = positions >= 0
+        result[found] = ids[positions[found]]
+        return result.reshape(lon.shape)
+
+    def get_zone_centroids(self, centroid: str = "geometric") -> pd.DataFrame:
+        """
+        Function that returns the centroid of every zone in the metric EPSG:3035 CRS (metres), as a DataFrame indexed
+        by the zone id (same order as :meth:`get_zone_geodataframe`) with the columns x and y.
+
+        Centroids are computed once and cached as ``{zones}_{version}_centroids_{centroid}.parquet`` next to the zone
+        cache.
+
+        Parameters
+        ----------
+        centroid : str
+            Default value is 'geometric'. 'geometric' is the centroid of the zone polygon; 'population' is the
+            population-weighted mean of the centroids of the MITMA districts of the zone, which is closer to where
+            trips start and end in large rural municipalities. District zones have no finer population data, so for
+            them 'population' falls back to the geometric centroid with a warning.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> zones = Zones(zones='municipalities', version=2, output_directory='data')
+        >>> centroids = zones.get_zone_centroids(centroid='population')
+        """
+        if centroid not in _CENTROIDS:
+            raise ValueError(f"centroid must be one of the following: {', '.join(_CENTROIDS)}")
+        if centroid == "population" and self.zones == "distritos":
+            warnings.warn(
+                "Population-weighted centroids need a finer zoning than districts; using geometric centroids.",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+            centroid = "geometric"
+        path = os.path.join(self.output_path, f"{self.zones}_{self.version}_centroids_{centroid}.parquet")
+        return self._cached(f"centroids_{centroid}", [path] + self._zone_files(), lambda: self._load_centroids(centroid, path))
+
+    def _load_centroids(self, centroid: str, path: str) -> pd.DataFrame:
+        cache_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.parquet")
+        if os.path.exists(path) and not (
+            os.path.exists(cache_path) and os.path.getmtime(path) < os.path.getmtime(cache_path)
+        ):
+            return pd.read_parquet(path)
+
+        if centroid == "geometric":
+            zones = self.get_zone_geodataframe()
+            points = zones.geometry.to_crs(_METRIC_CRS).centroid
+            centroids = pd.DataFrame({"x": points.x.to_numpy(), "y": points.y.to_numpy()}, index=zones.index)
+        else:
+            zone_index = self.get_zone_table().index
+            districts = Zones(zones="districts", version=self.version, output_directory=self.output_path)
+            district_centroids = districts.get_zone_centroids()
+            population = pd.to_numeric(
+                districts.get_zone_table()["population"], errors="coerce"
+            ).reindex(district_centroids.index).fillna(0).to_numpy()
+            parents = districts.map_ids(district_centroids.index.to_numpy(), "districts_mitma", _ZONE_LEVELS[self.zones])
+            codes = zone_index.get_indexer(pd.Index(parents.astype(str)))
+            known = (codes >= 0) & (population > 0)
+            weights = np.bincount(codes[known], weights=population[known], minlength=len(zone_index))
+            x = np.bincount(codes[known], weights=population[known] * district_centroids["x"].to_numpy()[known], minlength=len(zone_index))
+            y = np.bincount(codes[known], weights=population[known] * district_centroids["y"].to_numpy()[known], minlength=len(zone_index))
+            centroids = self.get_zone_centroids().copy()
+            # Zones without populated districts keep their geometric centroid.
+            weighted = weights > 0
+            centroids.loc[weighted, "x"] = x[weighted] / weights[weighted]
+            centroids.loc[weighted, "y"] = y[weighted] / weights[weighted]
+
+        centroids.index.name = "id"
+        centroids.to_parquet(path)
+        return centroids
+
+    def get_distances(self, origins, destinations, centroid: str = "geometric") -> np.ndarray:
+        """
+        Function that returns the centroid distance (km) between each origin and destination zone, for aligned
+        arrays of zone ids such as the id_origin and id_destination columns of OD data. Each distinct id is looked up
+        once and the distances are computed in a vectorised way from the cached centroids, so no distance matrix is
+        built. Pairs with an unknown zone get NaN.
+
+        Parameters
+        ----------
+        origins : array-like
+            Origin zone ids.
+        destinations : array-like
+            Destination zone ids, with the same length as ``origins``.
+        centroid : str
+            Default value is 'geometric'. The centroids used, see :meth:`get_zone_centroids`.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> zones = Zones(zones='districts', version=2, output_directory='data')
+        >>> od['distance_km'] = zones.get_distances(od['id_origin'], od['id_destination'])
+        """
+        centroids = self.get_zone_centroids(centroid)
+        coords = np.vstack([centroids[["x", "y"]].to_numpy(dtype=float), [np.nan, np.nan]])
+
+        def _positions(ids):
+            codes, uniques = pd.factorize(np.asarray(ids, dtype=object))
+            lookup = np.append(centroids.index.get_indexer(pd.Index(uniques).astype(str)), -1)
+            return lookup[codes]
+
+        origin_positions, destination_positions = _positions(origins), _positions(destinations)
+        if origin_positions.shape != destination_positions.shape:
+            raise ValueError("origins and destinations must have the same length")
+        delta = coords[origin_positions] - coords[destination_positions]
+        return np.hypot(delta[:, 0], delta[:, 1]) / 1000
+
+    def get_distance_matrix(self, centroid: str = "geometric", max_distance: float = None):
+        """
+        Function that returns the centroid distances (km) between every pair of zones, with rows and columns in the
+        order of :meth:`get_zone_geodataframe`.
+
+        Parameters
+        ----------
+        centroid : str
+            Default value is 'geometric'. The centroids used, see :meth:`get_zone_centroids`.
+        max_distance : float
+            Default value is None, which returns the dense matrix as a read-only memory-mapped float32 array, computed
+            once and cached as ``{zones}_{version}_distances_{centroid}.npy`` next to the zone cache (suited to
+            municipalities and large urban areas). If given, only the pairs closer than ``max_distance`` km are
+            computed, through a KD-tree, and returned as a ``scipy.sparse.csr_matrix`` whose stored entries are exactly
+            those pairs, with explicit zeros on the diagonal (suited to districts; requires scipy).
+
+        Returns
+        -------
+        tuple
+            ``(matrix, zone_index)``: the distance matrix and the zone ids of its rows and columns.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> zones = Zones(zones='municipalities', version=2, output_directory='data')
+        >>> distances, zone_index = zones.get_distance_matrix()
+        >>> near, zone_index = Zones(zones='districts', version=2, output_directory='data').get_distance_matrix(max_distance=50)
+        """
+        centroids = self.get_zone_centroids(centroid)
+        coords = centroids[["x", "y"]].to_numpy(dtype=float)
+        if max_distance is not None:
+            if sparse is None:
+                raise ImportError("scipy is not installed. Please install scipy (pip install pyspainmobility[sparse]) to compute sparse distance matrices")
+            # Zones without geometry have no centroid and no distances.
+            located = np.flatnonzero(np.isfinite(coords).all(axis=1))
+            tree = cKDTree(coords[located])
+            pairs = tree.sparse_distance_matrix(tree, max_distance * 1000, output_type="coo_matrix")
+            matrix = sparse.csr_matrix(
+                (pairs.data / 1000, (located[pairs.row], located[pairs.col])), shape=(len(coords), len(coords))
+            )
+            return matrix, centroids.index
+
+        if centroid == "population" and self.zones == "distritos":
+            centroid = "geometric"
+        path = os.path.join(self.output_path, f"{self.zones}_{self.version}_distances_{centroid}.npy")
+        centroid_path = os.path.join(self.output_path, f"{self.zones}_{self.version}_centroids_{centroid}.parquet")
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(centroid_path):
+            tmp_path = path + ".tmp.npy"
+            matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(coords), len(coords)))
+            # Blocks of rows bound the float64 temporaries.
+            for start in range(0, len(coords), 1024):
+                delta = coords[start:start + 1024, None, :] - coords[None, :, :]
+                matrix[start:start + 1024] = np.hypot(delta[..., 0], delta[..., 1]) / 1000
+            matrix.flush()
+            del matrix
+            os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r"), centroids.index
+
+    def get_contiguity(self, kind: str = "queen"):
+        """
+        Function that returns the contiguity graph of the zones as a symmetric ``scipy.sparse.csr_matrix`` of 0/1
+        values, with rows and columns in the order of :meth:`get_zone_geodataframe` (requires scipy).
+
+        Neighbouring pairs are found with a bulk STRtree query of all the zones at once instead of pairwise checks.
+        The graph is cached as ``{zones}_{version}_contiguity_{kind}.npz`` next to the zone cache and reused until the
+        zones change.
+
+        Parameters
+        ----------
+        kind : str
+            Default value is 'queen'. 'queen' links zones sharing at least a boundary point, 'rook' only zones sharing
+            a boundary segment. Zones overlapping each other (e.g. through digitising slivers) are linked by both.
+
+        Returns
+        -------
+        tuple
+            ``(matrix, zone_index)``: the adjacency matrix and the zone ids of its rows and columns.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> zones = Zones(zones='municipalities', version=2, output_directory='data')
+        >>> adjacency, zone_index = zones.get_contiguity(kind='rook')
+        >>> neighbours = zone_index[adjacency[zone_index.get_loc('28079')].indices]
+        """
+        if kind not in _CONTIGUITY:
+            raise ValueError(f"kind must be one of the following: {', '.join(_CONTIGUITY)}")
+        if sparse is None:
+            raise ImportError("scipy is not installed. Please install scipy (pip install pyspainmobility[sparse]) to build the contiguity graph")
+        path = os.path.join(self.output_path, f"{self.zones}_{self.version}_contiguity_{kind}.npz")
+        matrix = self._cached(f"contiguity_{kind}", [path] + self._zone_files(), lambda: self._load_contiguity(kind, path))
+        # The zone table holds the same ids without reading the geometries.
+        return matrix.copy(), self.get_zone_table().index
+
+    def _load_contiguity(self, kind: str, path: str):
+        cache_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.parquet")
+        if os.path.exists(path) and not (
+            os.path.exists(cache_path) and os.path.getmtime(path) < os.path.getmtime(cache_path)
+        ):
+            return sparse.load_npz(path).tocsr()
+
+        geometries = np.asarray(self.get_zone_geodataframe().geometry.values, dtype=object)
+        located = np.flatnonzero(~shapely.is_missing(geometries) & ~shapely.is_empty(geometries))
+        tree = shapely.STRtree(geometries[located])
+        left, right = tree.query(geometries[located], predicate="intersects")
+        pairs = left < right
+        left, right = left[pairs], right[pairs]
+        if kind == "rook":
+            # Point contacts have no shared length and no overlapping area.
+            shared = shapely.intersection(geometries[located][left], geometries[located][right])
+            segment = (shapely.length(shared) > 0) | (shapely.area(shared) > 0)
+            left, right = left[segment], right[segment]
+        rows = np.concatenate([located[left], located[right]])
+        cols = np.concatenate([located[right], located[left]])
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(geometries), len(geometries))
+        )
+        tmp_path = path + ".tmp.npz"
+        sparse.save_npz(tmp_path, matrix)
+        os.replace(tmp_path, path)
+        return matrix
+
+    def get_overlap_weights(self, target, weighting: str = "area", target_id: str = None):
+        """
+        Function that returns the sparse weights projecting zone values onto an arbitrary target layer (a regular grid,
+        service areas, ...): ``W[t, z]`` is the share of zone ``z`` falling in target polygon ``t`` (requires scipy).
+        A zone value vector ``v`` becomes ``W @ v`` on the target layer and an OD matrix ``M`` becomes ``W @ M @ W.T``
+        (see :meth:`Mobility.project`).
+
+        Overlaps are computed once in EPSG:3035 with a bulk STRtree query and cached as
+        ``{zones}_{version}_overlap_{weighting}_{digest}.npz`` next to the zone cache, keyed by a digest of the target
+        ids and geometries, so later projections onto the same layer need no geometry work.
+
+        Parameters
+        ----------
+        target : geopandas.GeoDataFrame or geopandas.GeoSeries
+            The target polygons, in any CRS.
+        weighting : str
+            Default value is 'area'. 'area' splits each zone by the share of its area in every target polygon;
+            'population' splits it by the share of its population, assuming population is uniform within each MITMA
+            district (so districts themselves are always split by area).
+        target_id : str
+            Default value is None. Column of ``target`` holding the target ids. If None, the index is used.
+
+        Returns
+        -------
+        tuple
+            ``(weights, target_index, zone_index)``: the ``scipy.sparse.csr_matrix`` of shape (targets, zones), the
+            target ids and the zone ids (order of :meth:`get_zone_geodataframe`). Zone columns sum to the share of
+            the zone covered by the target layer.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> zones = Zones(zones='municipalities', version=2, output_directory='data')
+        >>> weights, target_index, zone_index = zones.get_overlap_weights(service_areas, target_id='area_id')
+        """
+        if weighting not in _OVERLAP_WEIGHTINGS:
+            raise ValueError(f"weighting must be one of the following: {', '.join(_OVERLAP_WEIGHTINGS)}")
+        if sparse is None:
+            raise ImportError("scipy is not installed. Please install scipy (pip install pyspainmobility[sparse]) to compute overlap weights")
+        if target.crs is None:
+            raise ValueError("target must have a CRS")
+        if weighting == "population" and self.zones == "distritos":
+            weighting = "area"
+
+        target_index = pd.Index(target[target_id] if target_id is not None else target.index).astype(str)
+        geometries = shapely.to_wkb(np.asarray(gpd.GeoSeries(target.geometry).to_crs(_METRIC_CRS).values, dtype=object))
+        digest = hashlib.sha1()
+        for item in [weighting, *target_index, *(geometry or b"" for geometry in geometries)]:
+            digest.update(item.encode() if isinstance(item, str) else item)
+            digest.update(b"\0")
+        path = os.path.join(self.output_path, f"{self.zones}_{self.version}_overlap_{weighting}_{digest.hexdigest()[:16]}.npz")
+        weights = self._cached(
+            f"overlap_{weighting}_{digest.hexdigest()}",
+            [path] + self._zone_files(),
+            lambda: self._load_overlap_weights(target, weighting, path),
+        )
+        # The zone table holds the same ids without reading the geometries.
+        return weights.copy(), target_index, self.get_zone_table().index
+
+    def _load_overlap_weights(self, target, weighting: str, path: str):
+        cache_path = os.path.join(self.output_path, f"{self.zones}_{self.version}.parquet")
+        if os.path.exists(path) and not (
+            os.path.exists(cache_path) and os.path.getmtime(path) < os.path.getmtime(cache_path)
+        ):
+            return sparse.load_npz(path).tocsr()
+
+        zones = self.get_zone_geodataframe().geometry.to_crs(_METRIC_CRS)
+        zone_geometries = np.asarray(zones.values, dtype=object)
+        target_geometries = np.asarray(gpd.GeoSeries(target.geometry).to_crs(_METRIC_CRS).values, dtype=object)
+        tree = shapely.STRtree(zone_geometries)
+        target_idx, zone_idx = tree.query(target_geometries, predicate="intersects")
+        overlap = shapely.area(shapely.intersection(target_geometries[target_idx], zone_geometries[zone_idx]))
+        zone_area = shapely.area(zone_geometries[zone_idx])
+        valid = (overlap > 0) & (zone_area > 0)
+        weights = sparse.csr_matrix(
+            (overlap[valid] / zone_area[valid], (target_idx[valid], zone_idx[valid])),
+            shape=(len(target_geometries), len(zone_geometries)),
+        )
+
+        if weighting == "population":
+            # Zone shares are the population-weighted mean of the area shares of its districts.
+            districts = Zones(zones="districts", version=self.version, output_directory=self.output_path)
+            district_weights, _, district_index = districts.get_overlap_weights(target)
+            population = pd.to_numeric(districts.get_zone_table()["population"], errors="coerce")
+            population = population.reindex(district_index).fillna(0).to_numpy()
+            parents = districts.map_ids(district_index.to_numpy(), "districts_mitma", _ZONE_LEVELS[self.zones])
+            codes = zones.index.get_indexer(pd.Index(parents.astype(str)))
+            known = (codes >= 0) & (population > 0)
+            totals = np.bincount(codes[known], weights=population[known], minlength=len(zone_geometries))
+            membership = sparse.csr_matrix(
+                (population[known] / totals[codes[known]], (np.flatnonzero(known), codes[known])),
+                shape=(len(district_index), len(zone_geometries)),
+            )
+            # Zones without populated districts keep their area shares.
+            unpopulated = sparse.diags((totals == 0).astype(float))
+            weights = (district_weights @ membership + weights @ unpopulated).tocsr()
+
+        tmp_path = path + ".tmp.npz"
+        sparse.save_npz(tmp_path, weights)
+        os.replace(tmp_path, path)
+        return weights
+
+    def get_zone_table(self) -> pd.DataFrame:
+        """
+        Function that returns the zone attributes without the geometries, as a plain pandas DataFrame indexed by the
+        zone id with the same rows and columns as :meth:`get_zone_geodataframe` (name and population for version 2).
+
+        Only the names and population tables are downloaded and read (or the non-geometry columns of the cached
+        zones), so it is much faster than building the geodataframe and cheap to use in worker processes.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> zones = Zones(zones='municipalities', version=2, output_directory='data')
+        >>> table = zones.get_zone_table()
+        >>> print(table.head(2))
+                           name population
+        id
+        01001  Alegría-Dulantzi       2925
+        01002           Amurrio      10307
+        """
+        if self.complete_df is not None:
+            return pd.DataFrame(self.complete_df.drop(columns=self.complete_df.geometry.name))
+        if self._zone_table is None:
+            self._zone_table = self._cached("table", self._zone_files(), self._load_zone_table)
+        return self._zone_table
 
     def get_zone_relations(self):
         """
@@ -282,6 +953,129 @@ class Zones:
         ['census_sections', 'census_districts', 'municipalities',
          'municipalities_mitma', 'districts_mitma', 'luas_mitma']
         """
+        return self._cached("relations", self._relation_files(), self._load_zone_relations)
+
+    def map_ids(self, ids, from_level: str, to_level: str) -> np.ndarray:
+        """
+        Function that translates zone identifiers between the levels of the relation tables, e.g. MITMA districts to
+        MITMA municipalities or census sections to MITMA districts, in bulk.
+
+        The relation tables are encoded once as integer codes per level (``relations_2_index.npz``, or
+        ``relations_{zones}_1_index.npz`` for version 1, next to the zone files) and the lookup of each pair of levels
+        is an array gather, so millions of ids are mapped without per-row Python work.
+
+        Parameters
+        ----------
+        ids : array-like
+            Identifiers of ``from_level`` to translate.
+        from_level : str
+            Level of ``ids``. Version 2 levels are census_sections, census_districts, municipalities,
+            municipalities_mitma, districts_mitma and luas_mitma; version 1 levels are census_districts, municipalities,
+            municipalities_mitma and districts_mitma.
+        to_level : str
+            Level to translate the identifiers to.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array with the shape of ``ids`` holding the ``to_level`` identifier of each id, or None for unknown ids and
+            ids without a relation. An id related to several ``to_level`` identifiers is mapped to the one it shares
+            most relation rows with.
+
+        Examples
+        --------
+
+        >>> from pyspainmobility import Zones
+        >>> zones = Zones(zones='districts', version=2, output_directory='data')
+        >>> zones.map_ids(['2807901', '0801901'], 'districts_mitma', 'municipalities_mitma')
+        array(['28079', '08019'], dtype=object)
+        """
+        index = self._cached("relation_index", [self._relation_index_path()] + self._relation_files(), self._load_relation_index)
+        levels = index["levels"]
+        for level in (from_level, to_level):
+            if level not in levels:
+                raise ValueError(f"level must be one of {list(levels)}")
+        lookup = self._relation_lookup(index, from_level, to_level)
+
+        ids = np.asarray(ids)
+        keys = ids.astype(str).ravel()
+        dictionary = levels[from_level][0]
+        positions = np.minimum(np.searchsorted(dictionary, keys), max(len(dictionary) - 1, 0))
+        targets = np.full(keys.shape[0], -1, dtype=np.int64)
+        if len(dictionary):
+            found = dictionary[positions] == keys
+            targets[found] = lookup[positions[found]]
+
+        result = np.full(keys.shape[0], None, dtype=object)
+        mapped = targets >= 0
+        result[mapped] = levels[to_level][0][targets[mapped]]
+        return result.reshape(ids.shape)
+
+    def _relation_lookup(self, index: dict, from_level: str, to_level: str) -> np.ndarray:
+        """
+        Array holding, for each code of ``from_level``, the ``to_level`` code
+        it shares most relation rows with (-1 when it has none). Lookups are
+        kept with the shared index, so every instance computes them once.
+        """
+        key = (from_level, to_level)
+        lookups = index["lookups"]
+        if key not in lookups:
+            from_dictionary, from_codes = index["levels"][from_level]
+            to_dictionary, to_codes = index["levels"][to_level]
+            related = (from_codes >= 0) & (to_codes >= 0)
+            pairs = from_codes[related].astype(np.int64) * len(to_dictionary) + to_codes[related]
+            pairs, counts = np.unique(pairs, return_counts=True)
+            from_pair, to_pair = pairs // max(len(to_dictionary), 1), pairs % max(len(to_dictionary), 1)
+            order = np.lexsort((to_pair, -counts, from_pair))
+            from_pair, to_pair = from_pair[order], to_pair[order]
+            first = np.r_[True, from_pair[1:] != from_pair[:-1]] if len(from_pair) else np.zeros(0, dtype=bool)
+            lookup = np.full(len(from_dictionary), -1, dtype=np.int64)
+            lookup[from_pair[first]] = to_pair[first]
+            lookups[key] = lookup
+        return lookups[key]
+
+    def _relation_files(self) -> list:
+        if self.version == 2:
+            names = ['relacion_ine_zonificacionMitma.csv']
+        else:
+            names = [f'relaciones_{self.zones[:-1]}_mitma.csv', 'relaciones_distrito_mitma.csv', 'relaciones_municipio_mitma.csv']
+        return [self._resolve_data_file(name) for name in names]
+
+    def _relation_index_path(self) -> str:
+        # Version 1 relation rows are joined starting from the file of the zoning, so each zoning has its own index.
+        zoning = f"{self.zones}_" if self.version == 1 else ""
+        return os.path.join(self.output_path, f"relations_{zoning}{self.version}_index.npz")
+
+    def _load_relation_index(self) -> dict:
+        """
+        Load the integer-coded relation index, encoding the relation rows as
+        one sorted dictionary and one code array (-1 for missing values) per
+        level when the index file is missing or older than the relation files.
+        """
+        index_path = self._relation_index_path()
+        sources = [path for path in self._relation_files() if os.path.exists(path)]
+        if not os.path.exists(index_path) or any(os.path.getmtime(index_path) < os.path.getmtime(path) for path in sources):
+            rows = self._load_relation_rows()
+            arrays = {}
+            for level in rows.columns:
+                codes, uniques = pd.factorize(rows[level], sort=True)
+                arrays[f"dictionary_{level}"] = np.asarray(uniques, dtype=str)
+                arrays[f"codes_{level}"] = codes.astype(np.int32)
+            tmp_path = index_path + ".tmp.npz"
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, index_path)
+
+        with np.load(index_path) as data:
+            levels = [name[len("codes_"):] for name in data.files if name.startswith("codes_")]
+            levels = {level: (data[f"dictionary_{level}"], data[f"codes_{level}"]) for level in levels}
+        return {"levels": levels, "lookups": {}}
+
+    def _load_relation_rows(self) -> pd.DataFrame:
+        """
+        Relation table with one row per relation entry and one column per
+        level, as published for version 2 and joined on the MITMA
+        municipalities for version 1.
+        """
         self._ensure_zoning_files_downloaded()
         if self.version == 2:
             relacion = self._read_relation_table('relacion_ine_zonificacionMitma.csv')
@@ -297,32 +1091,28 @@ class Zones:
             relacion.rename(columns=remapping, inplace=True)
             relacion = relacion.replace('NA', None)
             return relacion
-        else:
-            used_zone = self.zones[:-1]
-            relacion = self._read_relation_table(f'relaciones_{used_zone}_mitma.csv')
-
-            relacion.rename(columns={f'{used_zone}_mitma': 'id'}, inplace=True)
 
-            if used_zone == 'municipio':
-                temp = self._read_relation_table('relaciones_distrito_mitma.csv')
-                relacion = relacion.set_index('id').join(temp.set_index('municipio_mitma')).reset_index()
+        used_zone = self.zones[:-1]
+        other_zone = 'distrito' if used_zone == 'municipio' else 'municipio'
+        relacion = self._read_relation_table(f'relaciones_{used_zone}_mitma.csv')
+        temp = self._read_relation_table(f'relaciones_{other_zone}_mitma.csv')
+        relacion = relacion.set_index('municipio_mitma').join(temp.set_index('municipio_mitma')).reset_index()
 
-            if used_zone == 'distrito':
-                temp = self._read_relation_table('relaciones_municipio_mitma.csv')
-                relacion = relacion.set_index('municipio_mitma').join(temp.set_index('municipio_mitma')).reset_index()
+        to_rename = {
+            'distrito': 'census_districts',
+            'distrito_mitma': 'districts_mitma',
+            'municipio': 'municipalities',
+            'municipio_mitma': 'municipalities_mitma',
+        }
+        return relacion.rename(columns=to_rename)
 
-            to_rename = {
-                'distrito': 'census_districts',
-                'distrito_mitma': 'districts_mitma',
-                'municipio': 'municipalities',
-                'municipio_mitma': 'municipalities_mitma',
-            }
-
-            relacion.rename(columns=to_rename, inplace=True)
-
-            temp_df = pd.DataFrame(relacion['id'].unique(), columns=['id']).set_index('id')
-            for i in list(relacion.columns):
-                if i != 'id':
-                    temp_df = temp_df.join(relacion.groupby('id')[i].apply(set))
+    def _load_zone_relations(self):
+        relacion = self._load_relation_rows()
+        if self.version == 2:
+            return relacion
 
-            return temp_df
+        id_column = 'municipalities_mitma' if self.zones == 'municipios' else 'districts_mitma'
+        relacion = relacion.rename(columns={id_column: 'id'})
+        columns = [col for col in relacion.columns if col != 'id']
+        temp_df = relacion.groupby('id', sort=False)[columns].agg(set)
+        return temp_df.reindex(pd.Index(relacion['id'].unique(), name='id'))
@@ -37,6 +37,15 @@ setup(
             "sphinx-autodoc-typehints",
             "sphinxcontrib-napoleon",
         ],
+        # for Mobility.sql()
+        "sql": [
+            "duckdb>=0.9",
+        ],
+        # for Mobility.get_od_matrices() / get_od_tensor() / project() and
+        # Zones.get_contiguity() / get_overlap_weights() / get_distance_matrix(max_distance=...)
+        "sparse": [
+            "scipy>=1.8",
+        ],
         # for running tests
         "dev": [
             "pytest>=6.0",
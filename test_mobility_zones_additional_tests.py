@@ -1,9 +1,13 @@
 import gzip
+import json
+import shutil
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import pytest
-from shapely.geometry import Point
+import shapely
+from shapely.geometry import Point, box
 
 import pyspainmobility.mobility.mobility as mobility_module
 from pyspainmobility.mobility.mobility import Mobility
@@ -11,6 +15,13 @@ from pyspainmobility.utils import utils
 from pyspainmobility.zones.zones import Zones
 
 
+@pytest.fixture(autouse=True)
+def _clear_zone_cache():
+    Zones.clear_cache()
+    yield
+    Zones.clear_cache()
+
+
 def _build_mobility(
     monkeypatch,
     tmp_path,
@@ -20,6 +31,9 @@ def _build_mobility(
     start_date=None,
     end_date=None,
     use_dask=False,
+    engine=None,
+    cache=False,
+    parquet_layout="default",
 ):
     if start_date is None:
         start_date = "2022-01-01" if version == 2 else "2020-03-11"
@@ -48,6 +62,9 @@ def _build_mobility(
         output_directory=str(tmp_path / "custom_out"),
         backend=backend,
         use_dask=use_dask,
+        engine=engine,
+        cache=cache,
+        parquet_layout=parquet_layout,
     )
     monkeypatch.setattr(mobility, "_saving_parquet", lambda *_: None)
     return mobility
@@ -813,3 +830,1165 @@ def test_get_zone_relations_version1_returns_sets(monkeypatch, tmp_path):
     assert df.loc["28079_M1", "municipalities"] == {"28079", "28080"}
     assert df.loc["28079_M1", "census_districts"] == {"2807901", "2807902"}
     assert df.loc["28079_M1", "districts_mitma"] == {"D1", "D2"}
+
+
+_OD_TWO_ROWS = (
+    "fecha|periodo|origen|destino|actividad_origen|actividad_destino|residencia|renta|edad|sexo|viajes|viajes_km\n"
+    "20220101|00|01001|01009|casa|frecuente|01|10-15|25-44|hombre|1|2\n"
+    "20220101|01|01002|01009|trabajo_estudio|no_frecuente|01|>15|25-44|mujer|2|3\n"
+)
+
+
+def test_engine_validation_rejects_unknown_engine(monkeypatch, tmp_path):
+    with pytest.raises(ValueError, match="engine must be one of the following"):
+        _build_mobility(monkeypatch, tmp_path, engine="gpu")
+
+
+def test_plan_uses_cached_file_sizes_and_selects_one_engine(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, end_date="2022-01-02", engine="auto")
+    _write_gzip(mobility._local_raw_path("2022-01-01", "Viajes"), _OD_TWO_ROWS)
+    monkeypatch.setattr(Mobility, "_available_memory", staticmethod(lambda: 8 * 1024 ** 3))
+
+    plan = mobility.plan("od")
+
+    assert {"sequential", "threads", "processes", "streaming"}.issubset(plan.index)
+    assert plan["files"].unique().tolist() == [2]
+    assert plan["cached_files"].unique().tolist() == [1]
+    cached_size = (tmp_path / "custom_out" / "20220101_Viajes_municipios_v2.csv.gz").stat().st_size
+    assert plan["est_compressed_bytes"].iloc[0] == pytest.approx(2 * cached_size)
+    assert plan["selected"].sum() == 1
+    assert plan.loc[plan["selected"], "viable"].all()
+
+
+def test_plan_falls_back_to_streaming_when_nothing_fits_in_memory(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, engine="auto")
+    monkeypatch.setattr(Mobility, "_available_memory", staticmethod(lambda: 1))
+
+    plan = mobility.plan("od", return_df=True)
+
+    assert not plan["viable"].any()
+    assert plan.index[plan["selected"]].tolist() == ["streaming"]
+
+
+@pytest.mark.parametrize("engine", ["threads", "streaming", "auto"])
+def test_get_od_data_engines_return_same_result(monkeypatch, tmp_path, capsys, engine):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas", engine=engine)
+    file_path = tmp_path / "od_engines.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS)
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path), str(file_path)])
+
+    df = mobility.get_od_data(return_df=True)
+
+    assert len(df) == 4
+    assert df["n_trips"].sum() == 6
+    if engine == "auto":
+        assert "Execution plan: engine=" in capsys.readouterr().out
+    if engine == "streaming":
+        assert (tmp_path / "custom_out" / "Viajes_municipios_2022-01-01_2022-01-01_v2.parquet").exists()
+
+
+def test_get_od_data_filters_are_applied_before_grouping(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="arrow")
+    file_path = tmp_path / "od_filters.csv.gz"
+    content = (
+        "fecha|periodo|origen|destino|actividad_origen|actividad_destino|residencia|renta|edad|sexo|viajes|viajes_km\n"
+        "20220101|07|01001.0|01009|casa|trabajo_estudio|01|10-15|25-44|hombre|1|2\n"
+        "20220101|08|01001|01009|casa|trabajo_estudio|01|>15|25-44|mujer|2|3\n"
+        "20220101|08|01001|01009|casa|frecuente|01|>15|25-44|mujer|4|5\n"
+        "20220101|12|01001|01009|casa|trabajo_estudio|01|>15|25-44|mujer|8|9\n"
+        "20220101|08|01002|01009|casa|trabajo_estudio|01|>15|25-44|mujer|16|17\n"
+    )
+    _write_gzip(file_path, content)
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+
+    df = mobility.get_od_data(
+        return_df=True,
+        filters={"id_origin": "01001", "hour": range(7, 10), "activity_destination": ["work_or_study"]},
+    )
+
+    assert sorted(df["hour"].tolist()) == [7, 8]
+    assert df["n_trips"].sum() == 3
+    assert set(df["id_origin"]) == {"01001"}
+
+
+def test_get_od_data_rejects_unknown_filter_columns(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas")
+    with pytest.raises(ValueError, match="Unsupported filter column"):
+        mobility.get_od_data(filters={"zone": ["01001"]})
+
+
+def test_get_number_of_trips_data_filters_on_output_labels(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas")
+    file_path = tmp_path / "trips_filters.csv.gz"
+    content = (
+        "fecha|zona_pernoctacion|edad|sexo|numero_viajes|personas\n"
+        "20220101|01001|25-45|mujer|2+|128.457\n"
+        "20220101|01001|25-45|hombre|2+|12.5\n"
+        "20220101|01002|25-45|mujer|1|3.5\n"
+    )
+    _write_gzip(file_path, content)
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+
+    df = mobility.get_number_of_trips_data(
+        return_df=True, filters={"gender": "female", "overnight_stay_area": ["01001.0"]}
+    )
+
+    assert len(df) == 1
+    assert df["people"].iloc[0] == pytest.approx(128.457)
+
+
+@pytest.mark.parametrize("engine", ["sequential", "streaming"])
+def test_get_od_data_time_resolutions_roll_up_during_ingest(monkeypatch, tmp_path, engine):
+    # 2022-01-01 is a Saturday, 2022-01-03 a Monday.
+    mobility = _build_mobility(
+        monkeypatch, tmp_path, backend="pandas", start_date="2022-01-01", end_date="2022-01-03", engine=engine
+    )
+    files = []
+    for day in ("20220101", "20220102", "20220103"):
+        file_path = tmp_path / f"od_{day}.csv.gz"
+        _write_gzip(
+            file_path,
+            "fecha|periodo|origen|destino|viajes|viajes_km\n"
+            f"{day}|07|01001|01009|1|2\n"
+            f"{day}|08|01001|01009|2|4\n",
+        )
+        files.append(str(file_path))
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: files)
+
+    daily = mobility.get_od_data(return_df=True, time_resolution="day")
+    assert list(daily.columns) == ["date", "id_origin", "id_destination", "n_trips", "trips_total_length_km"]
+    assert daily["n_trips"].tolist() == [3, 3, 3]
+
+    weekly = mobility.get_od_data(return_df=True, time_resolution="week")
+    assert dict(zip(weekly["week"], weekly["n_trips"])) == {"2021-W52": 6, "2022-W01": 3}
+
+    monthly = mobility.get_od_data(return_df=True, time_resolution="month")
+    assert monthly[["month", "n_trips"]].values.tolist() == [["2022-01", 9]]
+
+    profile = mobility.get_od_data(return_df=True, time_resolution="day_type")
+    profile = profile.set_index(["day_type", "hour"])["n_trips"]
+    assert profile[("weekend", 7)] == pytest.approx(1)
+    assert profile[("weekend", 8)] == pytest.approx(2)
+    assert profile[("weekday", 8)] == pytest.approx(2)
+
+
+def test_get_od_data_rejects_unknown_time_resolution(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas")
+    with pytest.raises(ValueError, match="time_resolution must be one of"):
+        mobility.get_od_data(time_resolution="quarter")
+
+
+def test_get_od_data_reuses_cached_result_until_raw_file_changes(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="arrow", cache=True)
+    file_path = tmp_path / "od_cache.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS)
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+
+    first = mobility.get_od_data(return_df=True)
+
+    calls = {"count": 0}
+    original = Mobility._process_single_file
+
+    def counting_process(*args, **kwargs):
+        calls["count"] += 1
+        return original(mobility, *args, **kwargs)
+
+    monkeypatch.setattr(mobility, "_process_single_file", counting_process)
+
+    second = mobility.get_od_data(return_df=True)
+    assert calls["count"] == 0
+    pd.testing.assert_frame_equal(first.reset_index(drop=True), second.reset_index(drop=True))
+
+    # Different arguments are cached separately.
+    mobility.get_od_data(return_df=True, time_resolution="day")
+    assert calls["count"] == 1
+
+    _write_gzip(file_path, _OD_TWO_ROWS + "20220101|02|01003|01009|casa|casa|01|>15|25-44|mujer|5|5\n")
+    third = mobility.get_od_data(return_df=True)
+    assert calls["count"] == 2
+    assert len(third) == 3
+
+
+def test_daily_datasets_share_roll_ups_and_engines(monkeypatch, tmp_path):
+    mobility = _build_mobility(
+        monkeypatch,
+        tmp_path,
+        backend="pandas",
+        version=1,
+        start_date="2020-03-11",
+        end_date="2020-03-12",
+        engine="threads",
+    )
+    files = []
+    for day in ("20200311", "20200312"):
+        file_path = tmp_path / f"trips_v1_{day}.txt.gz"
+        _write_gzip(file_path, f"fecha|distrito|numero_viajes|personas\n{day}|01001|2|1.5\n{day}|01001|1|2\n")
+        files.append(str(file_path))
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: files)
+
+    monthly = mobility.get_number_of_trips_data(return_df=True, time_resolution="month")
+
+    # Version 1 has no demographic columns: the NA age/gender keys must not drop rows.
+    assert monthly.set_index("number_of_trips")["people"].to_dict() == {"1": 4, "2": 3}
+    assert list(monthly.columns) == ["month", "overnight_stay_area", "age", "gender", "number_of_trips", "people"]
+
+    with pytest.raises(ValueError, match="time_resolution must be one of the following: day"):
+        mobility.get_number_of_trips_data(time_resolution="hour")
+
+
+def test_query_pushes_filters_and_columns_into_stored_output(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas")
+    del mobility._saving_parquet
+    file_path = tmp_path / "od_query.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS + "20220101|09|01001|01002|casa|casa|01|>15|25-44|mujer|5|7\n")
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+    mobility.get_od_data()
+
+    df = mobility.query(
+        "od",
+        filters={"id_origin": "01001", "hour": range(0, 9), "date": slice("2022-01-01", None)},
+        columns=["date", "id_destination", "n_trips"],
+    )
+
+    assert list(df.columns) == ["date", "id_destination", "n_trips"]
+    assert df.values.tolist() == [["2022-01-01", "01009", 1]]
+
+    scanner = mobility.scan("od", filters={"date": slice("2021-01-01", "2021-12-31")})
+    assert scanner.to_table().num_rows == 0
+
+    with pytest.raises(ValueError, match="Unknown filter column"):
+        mobility.query("od", filters={"zone": "01001"})
+
+
+def test_query_without_stored_output_raises(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas")
+    with pytest.raises(FileNotFoundError, match="Call the corresponding get_"):
+        mobility.query("od")
+
+
+@pytest.mark.parametrize("engine", ["sequential", "streaming"])
+def test_optimized_parquet_layout_sorts_and_records_layout(monkeypatch, tmp_path, engine):
+    pq = pytest.importorskip("pyarrow.parquet")
+    mobility = _build_mobility(
+        monkeypatch, tmp_path, backend="pandas", engine=engine, parquet_layout={"row_group_size": 2}
+    )
+    del mobility._saving_parquet
+    file_path = tmp_path / "od_layout.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS + "20220101|09|01001|01002|casa|casa|01|>15|25-44|mujer|5|7\n")
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+    mobility.get_od_data(return_df=False)
+
+    output_file = mobility._output_parquet_path("Viajes")
+    parquet_file = pq.ParquetFile(output_file)
+    layout = json.loads(parquet_file.schema_arrow.metadata[b"pyspainmobility.layout"])
+    assert layout["sort_by"] == ["date", "id_origin", "id_destination", "hour"]
+    assert layout["compression"] == "zstd"
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.metadata.row_group(0).column(0).compression == "ZSTD"
+    df = pd.read_parquet(output_file)
+    assert df[["id_origin", "id_destination", "hour"]].values.tolist() == [
+        ["01001", "01002", 9],
+        ["01001", "01009", 0],
+        ["01002", "01009", 1],
+    ]
+
+
+def test_parquet_layout_rejects_unknown_options(monkeypatch, tmp_path):
+    with pytest.raises(ValueError, match="Unknown parquet_layout option"):
+        _build_mobility(monkeypatch, tmp_path, parquet_layout={"codec": "zstd"})
+    with pytest.raises(ValueError, match="parquet_layout must be"):
+        _build_mobility(monkeypatch, tmp_path, parquet_layout="fast")
+
+
+@pytest.mark.parametrize("engine", ["sequential", "streaming"])
+@pytest.mark.parametrize("time_resolution", ["hour", "day_type"])
+def test_get_od_data_arrow_return_type_matches_pandas(monkeypatch, tmp_path, engine, time_resolution):
+    pa = pytest.importorskip("pyarrow")
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas", engine=engine)
+    file_path = tmp_path / "od_arrow.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS + "20220101|00|01001.0|01009|casa|casa|01|>15|25-44|mujer|5,5|7\n")
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+    kwargs = {"return_df": True, "keep_activity": True, "filters": {"hour": 0}, "time_resolution": time_resolution}
+
+    expected = mobility.get_od_data(**kwargs)
+    result = mobility.get_od_data(return_type="arrow", **kwargs)
+
+    if engine == "streaming":
+        assert isinstance(result, pa.RecordBatchReader)
+        result = result.read_all()
+    assert isinstance(result, pa.Table)
+    assert result.column_names == list(expected.columns)
+    assert result.to_pandas().astype(str).values.tolist() == expected.astype(str).values.tolist()
+
+
+def test_get_od_data_rejects_unknown_return_type(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path)
+    with pytest.raises(ValueError, match="return_type must be"):
+        mobility.get_od_data(return_type="polars")
+
+
+def test_sql_queries_stored_outputs_and_zone_attributes(monkeypatch, tmp_path):
+    pytest.importorskip("duckdb")
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas")
+    del mobility._saving_parquet
+    file_path = tmp_path / "od_sql.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS + "20220101|09|01001|01002|casa|casa|01|>15|25-44|mujer|5|7\n")
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+    mobility.get_od_data()
+
+    zone_table = pd.DataFrame({"name": ["Town A", "Town B"]}, index=pd.Index(["01002", "01009"], name="id"))
+    monkeypatch.setattr(Zones, "get_zone_table", lambda self: zone_table)
+
+    df = mobility.sql(
+        "SELECT z.name, SUM(od.n_trips) AS trips FROM od JOIN zones z ON od.id_destination = z.id "
+        "WHERE od.hour < ? GROUP BY z.name ORDER BY z.name",
+        params=[9],
+    )
+    assert df.values.tolist() == [["Town B", 3]]
+
+    table = mobility.sql("SELECT COUNT(*) AS n FROM od", return_type="arrow")
+    assert table.to_pylist() == [{"n": 3}]
+
+    with pytest.raises(Exception, match="overnight_stays"):
+        mobility.sql("SELECT * FROM overnight_stays")
+
+
+def test_get_od_matrices_and_tensor_follow_zone_index(monkeypatch, tmp_path):
+    pytest.importorskip("scipy")
+    mobility = _build_mobility(monkeypatch, tmp_path)
+    df = pd.DataFrame(
+        {
+            "date": ["2022-01-01", "2022-01-01", "2022-01-01", "2022-01-02", "2022-01-02"],
+            "hour": [0, 0, 0, 0, 5],
+            "id_origin": ["01002", "01002", "01001", "01001", "99999"],
+            "id_destination": ["01001", "01001", "01002", "01001", "01001"],
+            "n_trips": [1.0, 2.0, 4.0, 8.0, 16.0],
+        }
+    )
+    zone_table = pd.DataFrame({"name": ["Town B", "Town A"]}, index=pd.Index(["01002", "01001"], name="id"))
+    monkeypatch.setattr(Zones, "get_zone_table", lambda self: zone_table)
+
+    with pytest.warns(RuntimeWarning, match="99999"):
+        tensor, time_index, zone_index = mobility.get_od_tensor(df)
+    assert list(zone_index) == ["01002", "01001"]
+    assert list(time_index) == [("2022-01-01", 0), ("2022-01-02", 0)]
+    assert tensor.shape == (4, 2)
+    assert tensor.toarray().tolist() == [[0, 3], [4, 0], [0, 0], [0, 8]]
+
+    matrices, _ = mobility.get_od_matrices(df, time_keys="date", zone_index=["01001", "01002"])
+    assert matrices["2022-01-01"].toarray().tolist() == [[0, 4], [3, 0]]
+    assert matrices["2022-01-02"].toarray().tolist() == [[8, 0], [0, 0]]
+
+
+def test_od_store_is_filled_incrementally_and_sliced(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, start_date="2022-01-01", end_date="2022-01-02")
+    first = tmp_path / "od_store_1.csv.gz"
+    second = tmp_path / "od_store_2.csv.gz"
+    _write_gzip(first, _OD_TWO_ROWS + "20220101|01|01002|01009|casa|casa|01|>15|25-44|mujer|5|7\n")
+    _write_gzip(second, _OD_TWO_ROWS.replace("20220101", "20220102"))
+    requested = []
+
+    def fake_download(m_type, dates):
+        requested.append(list(dates))
+        return [str(first) if date == "2022-01-01" else str(second) for date in dates]
+
+    monkeypatch.setattr(mobility, "_donwload_helper", fake_download)
+    zone_index = ["01001", "01002", "01009"]
+
+    mobility.dates = ["2022-01-01"]
+    mobility.update_od_store(zone_index=zone_index)
+    mobility.dates = ["2022-01-01", "2022-01-02"]
+    mobility.update_od_store()
+    assert requested == [["2022-01-01"], ["2022-01-02"]]
+
+    values, dates = mobility.read_od_store(origins=["01002"], destinations=["01009", "01001"], hours=[0, 1])
+    assert dates == ["2022-01-01", "2022-01-02"]
+    assert values.shape == (2, 2, 1, 2)
+    assert values[:, :, 0, 0].tolist() == [[0, 7], [0, 2]]
+
+    with pytest.raises(ValueError, match="Unknown zone id"):
+        mobility.read_od_store(origins=["99999"])
+
+
+def test_zone_timeseries_store_answers_per_zone_series(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas", start_date="2022-01-01", end_date="2022-01-02")
+    first = tmp_path / "zone_ts_1.csv.gz"
+    second = tmp_path / "zone_ts_2.csv.gz"
+    _write_gzip(first, _OD_TWO_ROWS + "20220101|01|01009|01009|casa|casa|01|>15|25-44|mujer|5|7\n")
+    _write_gzip(second, _OD_TWO_ROWS.replace("20220101", "20220102"))
+    requested = []
+
+    def fake_download(m_type, dates):
+        requested.append(list(dates))
+        return [str(first) if date == "2022-01-01" else str(second) for date in dates]
+
+    monkeypatch.setattr(mobility, "_donwload_helper", fake_download)
+    mobility.dates = ["2022-01-01"]
+    mobility.update_zone_timeseries()
+    mobility.dates = ["2022-01-01", "2022-01-02"]
+    mobility.update_zone_timeseries()
+    mobility.update_zone_timeseries()
+    assert requested == [["2022-01-01"], ["2022-01-02"]]
+
+    daily = mobility.zone_timeseries("01009")
+    assert daily.columns.tolist() == ["id", "date", "outflow", "inflow", "intra", "outflow_km", "inflow_km"]
+    assert daily[["date", "outflow", "inflow", "intra"]].values.tolist() == [
+        ["2022-01-01", 5.0, 8.0, 5.0],
+        ["2022-01-02", 0.0, 3.0, 0.0],
+    ]
+
+    hourly = mobility.zone_timeseries(["01001", "01002"], start_date="2022-01-02", resolution="hour")
+    assert hourly[["id", "date", "hour", "outflow"]].values.tolist() == [
+        ["01001", "2022-01-02", 0, 1.0],
+        ["01002", "2022-01-02", 1, 2.0],
+    ]
+
+
+@pytest.mark.parametrize("engine, return_type", [("sequential", "pandas"), ("streaming", "pandas"), ("sequential", "arrow")])
+def test_get_od_data_materialises_aggregates_in_the_same_pass(monkeypatch, tmp_path, engine, return_type):
+    mobility = _build_mobility(
+        monkeypatch, tmp_path, backend="pandas", engine=engine, start_date="2022-01-01", end_date="2022-01-02"
+    )
+    first = tmp_path / "od_agg_1.csv.gz"
+    second = tmp_path / "od_agg_2.csv.gz"
+    _write_gzip(first, _OD_TWO_ROWS + "20220101|01|01009|01009|casa|casa|01|>15|25-44|mujer|5|7\n")
+    _write_gzip(second, _OD_TWO_ROWS.replace("20220101", "20220102"))
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(first), str(second)])
+
+    mobility.get_od_data(aggregates=True, return_type=return_type)
+
+    by_origin = mobility.read_od_aggregate("by_origin")
+    assert by_origin[["date", "id_origin", "n_trips"]].values.tolist() == [
+        ["2022-01-01", "01001", 1],
+        ["2022-01-01", "01002", 2],
+        ["2022-01-01", "01009", 5],
+        ["2022-01-02", "01001", 1],
+        ["2022-01-02", "01002", 2],
+    ]
+    assert mobility.read_od_aggregate("by_hour")[["date", "hour", "n_trips"]].values.tolist() == [
+        ["2022-01-01", 0, 1],
+        ["2022-01-01", 1, 7],
+        ["2022-01-02", 0, 1],
+        ["2022-01-02", 1, 2],
+    ]
+    daily = mobility.read_od_aggregate("daily_totals")
+    assert daily[["date", "n_trips", "intra_trips"]].values.tolist() == [["2022-01-01", 8, 5], ["2022-01-02", 3, 0]]
+    assert daily["intra_share"].tolist() == [0.625, 0.0]
+
+    with pytest.raises(ValueError, match="name must be one of"):
+        mobility.read_od_aggregate("by_zone")
+
+
+def test_od_cube_answers_cross_tabs_from_smallest_roll_up(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas", start_date="2022-01-01", end_date="2022-01-02")
+    first = tmp_path / "od_cube_1.csv.gz"
+    second = tmp_path / "od_cube_2.csv.gz"
+    _write_gzip(first, _OD_TWO_ROWS + "20220101|02|01009|01001|casa|trabajo_estudio|01|>15|NA|hombre|5|7\n")
+    _write_gzip(second, _OD_TWO_ROWS.replace("20220101", "20220102"))
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(first), str(second)])
+    mobility.build_od_cube()
+
+    read = []
+    original_read_parquet = pd.read_parquet
+    monkeypatch.setattr(pd, "read_parquet", lambda path, *a, **k: read.append(path) or original_read_parquet(path, *a, **k))
+
+    df = mobility.query_od_cube(by=["age"], filters={"activity_destination": "work_or_study"})
+    assert read[-1].endswith("activity_destination__age.parquet")
+    assert df.values.tolist() == [["NA", 5, 7]]
+
+    df = mobility.query_od_cube(by=["date", "gender"], start_date="2022-01-02")
+    assert df[["date", "gender", "n_trips"]].values.tolist() == [["2022-01-02", "female", 2], ["2022-01-02", "male", 1]]
+
+    totals = mobility.query_od_cube()
+    assert totals["n_trips"].tolist() == [11]
+
+    with pytest.raises(ValueError, match="Unknown cube dimension"):
+        mobility.query_od_cube(by=["id_origin"])
+
+
+def test_get_od_summary_merges_streaming_summaries(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas", start_date="2022-01-01", end_date="2022-01-02")
+    first = tmp_path / "od_summary_1.csv.gz"
+    second = tmp_path / "od_summary_2.csv.gz"
+    _write_gzip(first, _OD_TWO_ROWS + "20220101|02|01009|01001|casa|casa|01|>15|NA|hombre|5|50\n")
+    _write_gzip(second, _OD_TWO_ROWS.replace("20220101", "20220102"))
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(first), str(second)])
+
+    summary = mobility.get_od_summary(top_k=2, top_destinations=1, bins=[0, 1, 5, 100])
+
+    assert summary["top_flows"].values.tolist() == [["01009", "01001", 5.0], ["01002", "01009", 4.0]]
+    assert summary["top_destinations"][["id_origin", "id_destination", "n_trips"]].values.tolist() == [
+        ["01001", "01009", 2.0],
+        ["01002", "01009", 4.0],
+        ["01009", "01001", 5.0],
+    ]
+    assert summary["trip_length_histogram"]["n_trips"].tolist() == [0.0, 6.0, 5.0]
+    moments = summary["trip_length_moments"]
+    assert moments["n_trips"] == 11.0
+    assert moments["total_km"] == 60.0
+    assert moments["mean_km"] == pytest.approx(60.0 / 11.0)
+    lengths = [2.0, 2.0, 1.5, 1.5, 1.5, 1.5, 10.0, 10.0, 10.0, 10.0, 10.0]
+    assert moments["std_km"] == pytest.approx(pd.Series(lengths).std(ddof=0))
+
+
+def test_zone_cache_uses_geoparquet_and_migrates_geojson(monkeypatch, tmp_path):
+    output_dir = tmp_path / "zones_geoparquet"
+    output_dir.mkdir()
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+    legacy = gpd.GeoDataFrame(
+        {"id": ["01001", "01002"], "name": ["Town A", "Town B"], "geometry": [Point(0, 0), Point(1, 1)]},
+        crs="EPSG:4326",
+    )
+    legacy.to_file(output_dir / "municipios_2.geojson", driver="GeoJSON")
+
+    migrated = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_geodataframe()
+    assert (output_dir / "municipios_2.parquet").exists()
+    assert migrated.index.name == "id"
+
+    monkeypatch.setattr(gpd, "read_file", lambda *_args, **_kwargs: pytest.fail("GeoJSON should not be parsed"))
+    warm = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_geodataframe()
+    assert warm.index.tolist() == ["01001", "01002"]
+    assert warm["name"].tolist() == ["Town A", "Town B"]
+    assert warm.crs.to_epsg() == 4326
+
+
+def test_get_zone_table_skips_geometries(monkeypatch, tmp_path):
+    output_dir = tmp_path / "zones_table"
+    output_dir.mkdir()
+    (output_dir / "nombres_municipios.csv").write_text("ID|name\n01001|Town A\n01002|Town B\n", encoding="utf-8")
+    (output_dir / "poblacion_municipios.csv").write_text("01001|1234\n01002|NA\n", encoding="utf-8")
+    downloaded = []
+    monkeypatch.setattr(
+        utils,
+        "available_zoning_data",
+        lambda *_: pd.DataFrame(
+            {"link": [f"https://example.org/{name}" for name in [
+                "nombres_municipios.csv",
+                "poblacion_municipios.csv",
+                "zonificacion_municipios.shp",
+            ]]}
+        ),
+    )
+    monkeypatch.setattr(utils, "download_file_if_not_existing", lambda url, path: downloaded.append(url))
+    monkeypatch.setattr(gpd, "read_file", lambda *_args, **_kwargs: pytest.fail("geometries should not be read"))
+
+    table = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_table()
+    assert not isinstance(table, gpd.GeoDataFrame)
+    assert table.index.name == "id"
+    assert table["name"].tolist() == ["Town A", "Town B"]
+    assert table["population"].iloc[0] == "1234"
+    assert pd.isna(table["population"].iloc[1])
+    assert downloaded == []
+
+    gpd.GeoDataFrame(
+        {"name": ["Town A"], "population": ["1234"], "geometry": [Point(0, 0)]},
+        index=pd.Index(["01001"], name="id"),
+        crs="EPSG:4326",
+    ).to_parquet(output_dir / "municipios_2.parquet")
+    cached = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_table()
+    assert cached.index.tolist() == ["01001"]
+    assert cached.columns.tolist() == ["name", "population"]
+
+
+def test_zone_cache_is_shared_across_instances(monkeypatch, tmp_path):
+    output_dir = tmp_path / "zones_shared"
+    output_dir.mkdir()
+    (output_dir / "nombres_municipios.csv").write_text("ID|name\n01001|Town A\n", encoding="utf-8")
+    (output_dir / "poblacion_municipios.csv").write_text("01001|1234\n", encoding="utf-8")
+    rss_calls = []
+
+    def fake_available_zoning_data(*_):
+        rss_calls.append(1)
+        return pd.DataFrame({"link": ["https://example.org/nombres_municipios.csv"]})
+
+    monkeypatch.setattr(utils, "available_zoning_data", fake_available_zoning_data)
+    monkeypatch.setattr(utils, "download_file_if_not_existing", lambda *_: None)
+    reads = []
+    original_read_csv = pd.read_csv
+    monkeypatch.setattr(pd, "read_csv", lambda *a, **k: reads.append(a[0]) or original_read_csv(*a, **k))
+
+    first = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_table()
+    first["extra"] = 1
+    first.loc["01001", "name"] = "Changed"
+    first.iloc[0, first.columns.get_loc("population")] = "0"
+    second = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_table()
+    assert len(rss_calls) == 1
+    assert len(reads) == 2
+    assert "extra" not in second.columns
+    assert second.loc["01001", "name"] == "Town A"
+    assert second.loc["01001", "population"] == "1234"
+
+    (output_dir / "nombres_municipios.csv").write_text("ID|name\n01001|Town A2\n", encoding="utf-8")
+    third = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_table()
+    assert third["name"].tolist() == ["Town A2"]
+
+    Zones.set_cache_size(0)
+    try:
+        Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_table()
+        assert len(rss_calls) == 2
+    finally:
+        Zones.set_cache_size(16)
+
+
+def _write_zone_cache(output_dir, geometries, ids=None):
+    ids = ids or [f"0100{i + 1}" for i in range(len(geometries))]
+    gpd.GeoDataFrame(
+        {"name": [f"Town {i}" for i in range(len(geometries))], "geometry": geometries},
+        index=pd.Index(ids, name="id"),
+        crs="EPSG:4326",
+    ).to_parquet(output_dir / "municipios_2.parquet")
+
+
+def test_locate_maps_points_in_bulk_through_persisted_index(monkeypatch, tmp_path):
+    output_dir = tmp_path / "zones_locate"
+    output_dir.mkdir()
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+    _write_zone_cache(output_dir, [box(0, 0, 1, 1), box(1, 0, 2, 1)])
+
+    zones = Zones(zones="municipalities", version=2, output_directory=str(output_dir))
+    located = zones.locate(np.array([0.5, 1.5, 5.0, 1.0]), np.array([0.5, 0.5, 5.0, 0.5]), chunk_size=3)
+    assert located.tolist() == ["01001", "01002", None, "01001"]
+    assert (output_dir / "municipios_2_index.npz").exists()
+    assert zones.locate(1.5, 0.5).item() == "01002"
+
+    Zones.clear_cache()
+    monkeypatch.setattr(gpd, "read_parquet", lambda *_args, **_kwargs: pytest.fail("index should be read from disk"))
+    warm = Zones(zones="municipalities", version=2, output_directory=str(output_dir))
+    assert warm.locate([[0.5], [1.5]], [[0.5], [0.5]]).tolist() == [["01001"], ["01002"]]
+    with pytest.raises(ValueError):
+        warm.locate([0.5], [0.5, 0.5])
+
+
+def test_zone_geodataframe_resolutions_are_simplified_and_cached(monkeypatch, tmp_path):
+    output_dir = tmp_path / "zones_simplified"
+    output_dir.mkdir()
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+    wiggly = Point(0.5, 0.5).buffer(0.5, quad_segs=256)
+    _write_zone_cache(output_dir, [wiggly, box(1, 0, 2, 1), None])
+
+    zones = Zones(zones="municipalities", version=2, output_directory=str(output_dir))
+    full = zones.get_zone_geodataframe()
+    low = zones.get_zone_geodataframe(resolution="low")
+    assert low.index.tolist() == full.index.tolist()
+    assert low["name"].tolist() == full["name"].tolist()
+    assert low.crs.to_epsg() == 4326
+    assert low.geometry.iloc[0].is_valid
+    assert len(low.geometry.iloc[0].exterior.coords) < len(full.geometry.iloc[0].exterior.coords)
+    assert low.geometry.iloc[2] is None
+    for resolution in ("high", "medium", "low"):
+        assert (output_dir / f"municipios_2_{resolution}.parquet").exists()
+    assert zones.get_zone_geodataframe(resolution="full") is full
+
+    with pytest.raises(ValueError):
+        zones.get_zone_geodataframe(resolution="tiny")
+
+
+def test_map_ids_translates_levels_through_relation_index(monkeypatch, tmp_path):
+    out_dir = tmp_path / "relations_index"
+    out_dir.mkdir()
+    (out_dir / "relacion_ine_zonificacionMitma.csv").write_text(
+        "seccion_ine,distrito_ine,municipio_ine,municipio_mitma,distrito_mitma,gau_mitma\n"
+        "2807901001,2807901,28079,28079,2807901,28079_GAU\n"
+        "2807901002,2807901,28079,28079,2807901,28079_GAU\n"
+        "2807902001,2807902,28079,28079,2807902,28079_GAU\n"
+        "0100101001,0100101,01001,01001_AM,01001_AM,NA\n"
+        "0100201001,0100201,01002,01001_AM,01001_AM,NA\n",
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+    zones = Zones(zones="districts", version=2, output_directory=str(out_dir))
+
+    relations = zones.get_zone_relations()
+    assert relations["census_sections"].tolist()[0] == "2807901001"
+    mapped = zones.map_ids(np.array(["2807902", "01001_AM", "2807901", "99999"]), "districts_mitma", "municipalities_mitma")
+    assert mapped.tolist() == ["28079", "01001_AM", "28079", None]
+    assert zones.map_ids(["01001_AM", "28079"], "municipalities_mitma", "luas_mitma").tolist() == [None, "28079_GAU"]
+    assert zones.map_ids([["01002"]], "municipalities", "municipalities_mitma").tolist() == [["01001_AM"]]
+    assert (out_dir / "relations_2_index.npz").exists()
+
+    Zones.clear_cache()
+    monkeypatch.setattr(pd, "read_csv", lambda *_args, **_kwargs: pytest.fail("index should be read from disk"))
+    warm = Zones(zones="districts", version=2, output_directory=str(out_dir))
+    assert warm.map_ids(["2807901001"], "census_sections", "districts_mitma").tolist() == ["2807901"]
+    with pytest.raises(ValueError):
+        warm.map_ids(["28079"], "provinces", "municipalities_mitma")
+
+
+@pytest.mark.parametrize("backend", ["pandas", "arrow"])
+def test_reaggregate_rolls_district_data_up_to_coarser_zonings(monkeypatch, tmp_path, backend):
+    mobility = _build_mobility(monkeypatch, tmp_path, zones="districts", backend=backend)
+    (tmp_path / "custom_out" / "relacion_ine_zonificacionMitma.csv").write_text(
+        "seccion_ine|distrito_ine|municipio_ine|municipio_mitma|distrito_mitma|gau_mitma\n"
+        "2807901001|2807901|28079|28079|2807901|28079_GAU\n"
+        "2807902001|2807902|28079|28079|2807902|28079_GAU\n"
+        "2800501001|2800501|28005|28005|28005|28079_GAU\n",
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+    od = pd.DataFrame({
+        "date": ["2022-01-01"] * 4,
+        "hour": [8, 8, 8, 9],
+        "id_origin": ["2807901", "2807902", "2807901", "PT"],
+        "id_destination": ["2807902", "28005", "28005", "2807901"],
+        "n_trips": [1.0, 2.0, 4.0, 8.0],
+        "trips_total_length_km": [10.0, 20.0, 40.0, 80.0],
+    })
+
+    municipal = mobility.reaggregate("municipalities", data=od, return_df=True).sort_values(["hour", "id_origin", "id_destination"])
+    assert municipal[["hour", "id_origin", "id_destination", "n_trips"]].values.tolist() == [
+        [8, "28079", "28005", 6.0],
+        [8, "28079", "28079", 1.0],
+        [9, "PT", "28079", 8.0],
+    ]
+    assert (tmp_path / "custom_out" / "Viajes_municipios_2022-01-01_2022-01-01_v2_from_distritos.parquet").exists()
+
+    gau = mobility.reaggregate("gau", data=od, return_df=True)
+    assert gau.loc[gau["id_origin"] == "28079_GAU", "n_trips"].sum() == 7.0
+
+    stays = pd.DataFrame({
+        "date": ["2022-01-01"] * 2,
+        "residence_area": ["2807901", None],
+        "overnight_stay_area": ["2807902", "28005"],
+        "people": [3.0, 5.0],
+    })
+    rolled = mobility.reaggregate("municipalities", mobility_type="os", data=stays, return_df=True)
+    assert rolled["people"].sum() == 8.0
+    assert pd.isna(rolled.loc[rolled["overnight_stay_area"] == "28005", "residence_area"]).all()
+
+    with pytest.raises(ValueError):
+        mobility.reaggregate("districts", data=od)
+
+
+def test_zone_distances_use_cached_metric_centroids(monkeypatch, tmp_path):
+    output_dir = tmp_path / "zones_distances"
+    output_dir.mkdir()
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+    _write_zone_cache(output_dir, [box(-3.8, 40.3, -3.6, 40.5), box(2.0, 41.3, 2.2, 41.5), None], ids=["28079", "08019", "99999"])
+    gpd.GeoDataFrame(
+        {"population": ["100", "300", "0"], "geometry": [box(-3.8, 40.3, -3.7, 40.5), box(-3.7, 40.3, -3.6, 40.5), box(2.0, 41.3, 2.2, 41.5)]},
+        index=pd.Index(["2807901", "2807902", "0801901"], name="id"),
+        crs="EPSG:4326",
+    ).to_parquet(output_dir / "distritos_2.parquet")
+    (output_dir / "relacion_ine_zonificacionMitma.csv").write_text(
+        "seccion_ine|distrito_ine|municipio_ine|municipio_mitma|distrito_mitma|gau_mitma\n"
+        "2807901001|2807901|28079|28079|2807901|NA\n"
+        "2807902001|2807902|28079|28079|2807902|NA\n"
+        "0801901001|0801901|08019|08019|0801901|NA\n",
+        encoding="utf-8",
+    )
+
+    zones = Zones(zones="municipalities", version=2, output_directory=str(output_dir))
+    centroids = zones.get_zone_centroids()
+    assert centroids.index.tolist() == ["28079", "08019", "99999"]
+    assert 3.0e6 < centroids.loc["28079", "x"] < 3.5e6
+    assert pd.isna(centroids.loc["99999", "x"])
+
+    weighted = zones.get_zone_centroids(centroid="population")
+    assert weighted.loc["28079", "x"] > centroids.loc["28079", "x"]
+    assert weighted.loc["08019", "x"] == pytest.approx(centroids.loc["08019", "x"])
+
+    distances = zones.get_distances(pd.Series(["28079", "08019", "28079"]), ["08019", "28079", "00000"])
+    assert 480 < distances[0] < 520
+    assert distances[0] == pytest.approx(distances[1])
+    assert np.isnan(distances[2])
+
+    matrix, zone_index = zones.get_distance_matrix()
+    assert zone_index.tolist() == ["28079", "08019", "99999"]
+    assert matrix.shape == (3, 3)
+    assert matrix[0, 1] == pytest.approx(distances[0], rel=1e-5)
+    assert (output_dir / "municipios_2_distances_geometric.npy").exists()
+
+    near, _ = zones.get_distance_matrix(max_distance=100)
+    assert near.nnz == 2
+    assert (near.diagonal()[:2] == 0).all()
+    assert near[0, 1] == 0
+    far, _ = zones.get_distance_matrix(max_distance=1000)
+    assert far[0, 1] == pytest.approx(distances[0])
+
+    with pytest.warns(RuntimeWarning):
+        Zones(zones="districts", version=2, output_directory=str(output_dir)).get_zone_centroids(centroid="population")
+
+    Zones.clear_cache()
+    monkeypatch.setattr(Zones, "get_zone_geodataframe", lambda *_args, **_kwargs: pytest.fail("geometries should not be read"))
+    cached = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_zone_centroids()
+    pd.testing.assert_frame_equal(cached, centroids)
+
+
+def test_contiguity_graph_is_built_in_bulk_and_cached(monkeypatch, tmp_path):
+    output_dir = tmp_path / "zones_contiguity"
+    output_dir.mkdir()
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+    # 2x2 grid plus an isolated zone and a zone without geometry.
+    _write_zone_cache(
+        output_dir,
+        [box(0, 0, 1, 1), box(1, 0, 2, 1), box(0, 1, 1, 2), box(1, 1, 2, 2), box(5, 5, 6, 6), None],
+    )
+    zones = Zones(zones="municipalities", version=2, output_directory=str(output_dir))
+
+    queen, zone_index = zones.get_contiguity()
+    assert zone_index.tolist() == ["01001", "01002", "01003", "01004", "01005", "01006"]
+    assert (queen != queen.T).nnz == 0
+    assert sorted(zone_index[queen[0].indices]) == ["01002", "01003", "01004"]
+    assert queen[4].nnz == 0 and queen[5].nnz == 0
+
+    rook, _ = zones.get_contiguity(kind="rook")
+    assert sorted(zone_index[rook[0].indices]) == ["01002", "01003"]
+    assert (output_dir / "municipios_2_contiguity_rook.npz").exists()
+
+    Zones.clear_cache()
+    monkeypatch.setattr(shapely.STRtree, "query", lambda *_args, **_kwargs: pytest.fail("graph should be read from disk"))
+    monkeypatch.setattr(Zones, "get_zone_geodataframe", lambda *_args, **_kwargs: pytest.fail("geometries should not be read"))
+    cached, cached_index = Zones(zones="municipalities", version=2, output_directory=str(output_dir)).get_contiguity(kind="rook")
+    assert (cached != rook).nnz == 0
+    assert cached_index.tolist() == zone_index.tolist()
+    with pytest.raises(ValueError):
+        zones.get_contiguity(kind="bishop")
+
+
+def test_project_splits_data_onto_custom_polygons(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, zones="municipalities", backend="pandas")
+    output_dir = tmp_path / "custom_out"
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+    _write_zone_cache(output_dir, [box(0, 0, 0.02, 0.01), box(0.02, 0, 0.03, 0.01)], ids=["A", "B"])
+    # Two cells: the west half of A, and the east half of A plus B.
+    grid = gpd.GeoDataFrame(
+        {"cell": ["west", "east"], "geometry": [box(0, 0, 0.01, 0.01), box(0.01, 0, 0.03, 0.01)]},
+        crs="EPSG:4326",
+    )
+
+    zones = Zones(zones="municipalities", version=2, output_directory=str(output_dir))
+    weights, target_index, zone_index = zones.get_overlap_weights(grid, target_id="cell")
+    assert target_index.tolist() == ["west", "east"]
+    assert zone_index.tolist() == ["A", "B"]
+    assert weights.toarray() == pytest.approx(np.array([[0.5, 0.0], [0.5, 1.0]]), abs=1e-3)
+    assert len(list(output_dir.glob("municipios_2_overlap_area_*.npz"))) == 1
+
+    gpd.GeoDataFrame(
+        {"population": ["300", "100", "10"], "geometry": [box(0, 0, 0.01, 0.01), box(0.01, 0, 0.02, 0.01), box(0.02, 0, 0.03, 0.01)]},
+        index=pd.Index(["A1", "A2", "B1"], name="id"),
+        crs="EPSG:4326",
+    ).to_parquet(output_dir / "distritos_2.parquet")
+    (output_dir / "relacion_ine_zonificacionMitma.csv").write_text(
+        "seccion_ine|distrito_ine|municipio_ine|municipio_mitma|distrito_mitma|gau_mitma\n"
+        "1|1|A|A|A1|NA\n2|2|A|A|A2|NA\n3|3|B|B|B1|NA\n",
+        encoding="utf-8",
+    )
+    by_population, _, _ = zones.get_overlap_weights(grid, weighting="population", target_id="cell")
+    assert by_population.toarray() == pytest.approx(np.array([[0.75, 0.0], [0.25, 1.0]]), abs=1e-3)
+
+    od = pd.DataFrame({
+        "date": ["2022-01-01", "2022-01-01", "2022-01-02"],
+        "hour": [8, 8, 8],
+        "id_origin": ["A", "B", "A"],
+        "id_destination": ["B", "A", "Z"],
+        "n_trips": [10.0, 4.0, 1.0],
+        "trips_total_length_km": [20.0, 8.0, 1.0],
+    })
+    # OD slices are projected without a block-diagonal operator, and cached weights without the geometries.
+    monkeypatch.setattr(mobility_module.sparse, "kron", lambda *_args, **_kwargs: pytest.fail("no block-diagonal operator"))
+    Zones.clear_cache()
+    monkeypatch.setattr(Zones, "get_zone_geodataframe", lambda *_args, **_kwargs: pytest.fail("geometries should not be read"))
+    with pytest.warns(RuntimeWarning):
+        projected = mobility.project(grid, data=od, target_id="cell")
+    assert projected.columns.tolist() == od.columns.tolist()
+    flows = projected.set_index(["id_origin", "id_destination"])["n_trips"]
+    assert flows[("west", "east")] == pytest.approx(5.0, abs=1e-2)
+    assert flows[("east", "east")] == pytest.approx(7.0, abs=1e-2)
+    assert flows[("east", "west")] == pytest.approx(2.0, abs=1e-2)
+    assert projected["n_trips"].sum() == pytest.approx(14.0, abs=1e-2)
+    assert projected["hour"].tolist() == [8, 8, 8]
+
+    trips = pd.DataFrame({
+        "date": ["2022-01-01", "2022-01-01"],
+        "overnight_stay_area": ["A", "B"],
+        "age": ["25-45", None],
+        "gender": ["male", "female"],
+        "number_of_trips": ["1", "2+"],
+        "people": [100.0, 50.0],
+    })
+    people = mobility.project(grid, mobility_type="nt", data=trips, target_id="cell")
+    assert people["people"].sum() == pytest.approx(150.0, abs=1e-1)
+    assert people.loc[people["age"].isna(), "overnight_stay_area"].tolist() == ["east"]
+
+
+@pytest.mark.parametrize("engine", ["sequential", "streaming"])
+def test_day_type_averages_divide_by_processed_days(monkeypatch, tmp_path, engine):
+    # 2022-01-01 and 2022-01-02 are a weekend; 2022-01-02 is filtered out.
+    mobility = _build_mobility(
+        monkeypatch, tmp_path, backend="pandas", start_date="2022-01-01", end_date="2022-01-03", engine=engine
+    )
+    files = []
+    for day in ("20220101", "20220102"):
+        file_path = tmp_path / f"od_{day}.csv.gz"
+        _write_gzip(file_path, "fecha|periodo|origen|destino|viajes|viajes_km\n" f"{day}|07|01001|01009|10|2\n")
+        files.append(str(file_path))
+    # 2022-01-03 failed to download.
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: files)
+
+    profile = mobility.get_od_data(return_df=True, time_resolution="day_type", filters={"date": ["2022-01-01"]})
+    assert profile["n_trips"].tolist() == [pytest.approx(10.0)]
+    profile = mobility.get_od_data(return_df=True, time_resolution="day_type")
+    assert profile["n_trips"].tolist() == [pytest.approx(10.0)]
+
+
+def test_cached_result_follows_parquet_layout(monkeypatch, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    file_path = tmp_path / "od_cache_layout.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS)
+
+    plain = _build_mobility(monkeypatch, tmp_path, backend="pandas", cache=True)
+    del plain._saving_parquet
+    monkeypatch.setattr(plain, "_donwload_helper", lambda *_: [str(file_path)])
+    plain.get_od_data()
+
+    optimized = _build_mobility(monkeypatch, tmp_path, backend="pandas", cache=True, parquet_layout="optimized")
+    del optimized._saving_parquet
+    monkeypatch.setattr(optimized, "_donwload_helper", lambda *_: [str(file_path)])
+    optimized.get_od_data()
+    parquet_file = pq.ParquetFile(optimized._output_parquet_path("Viajes"))
+    assert b"pyspainmobility.layout" in parquet_file.schema_arrow.metadata
+    assert parquet_file.metadata.row_group(0).column(0).compression == "ZSTD"
+
+    # A second optimized call reuses the optimized cached file.
+    monkeypatch.setattr(optimized, "_process_single_file", lambda *_: pytest.fail("result should be cached"))
+    optimized.get_od_data()
+    parquet_file = pq.ParquetFile(optimized._output_parquet_path("Viajes"))
+    assert b"pyspainmobility.layout" in parquet_file.schema_arrow.metadata
+
+
+def test_cached_streaming_arrow_result_keeps_return_type(monkeypatch, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="arrow", cache=True, engine="streaming")
+    file_path = tmp_path / "od_cache_stream.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS)
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+
+    first = mobility.get_od_data(return_df=True, return_type="arrow")
+    assert isinstance(first, pa.RecordBatchReader)
+    expected = first.read_all()
+    monkeypatch.setattr(mobility, "_process_single_file_arrow", lambda *_: pytest.fail("result should be cached"))
+    second = mobility.get_od_data(return_df=True, return_type="arrow")
+    assert isinstance(second, pa.RecordBatchReader)
+    assert second.read_all().equals(expected)
+
+
+@pytest.mark.parametrize("engine, return_type", [("sequential", "pandas"), ("streaming", "pandas"), ("sequential", "arrow")])
+def test_get_od_data_keeps_zone_timeseries_store_up_to_date(monkeypatch, tmp_path, engine, return_type):
+    mobility = _build_mobility(
+        monkeypatch, tmp_path, backend="pandas", start_date="2022-01-01", end_date="2022-01-02", engine=engine
+    )
+    first = tmp_path / "zone_feed_1.csv.gz"
+    second = tmp_path / "zone_feed_2.csv.gz"
+    _write_gzip(first, _OD_TWO_ROWS)
+    _write_gzip(second, _OD_TWO_ROWS.replace("20220101", "20220102"))
+    monkeypatch.setattr(
+        mobility, "_donwload_helper",
+        lambda m_type, dates=None: [str(first) if date == "2022-01-01" else str(second) for date in (dates or mobility.dates)],
+    )
+    # Without a store, ingesting does not create one.
+    mobility.get_od_data(return_type=return_type)
+    assert not (tmp_path / "custom_out" / "zone_timeseries").exists()
+
+    mobility.dates = ["2022-01-01"]
+    mobility.update_zone_timeseries()
+    mobility.dates = ["2022-01-01", "2022-01-02"]
+    # Filtered or rolled-up ingests are not complete hourly totals.
+    mobility.get_od_data(filters={"hour": [0]}, return_type=return_type)
+    mobility.get_od_data(time_resolution="day", return_type=return_type)
+    assert mobility._zone_timeseries_dates(mobility._zone_timeseries_path()) == {"2022-01-01"}
+
+    mobility.get_od_data(return_type=return_type)
+    monkeypatch.setattr(mobility, "_process_single_file", lambda *_: pytest.fail("store should be up to date"))
+    mobility.update_zone_timeseries()
+    daily = mobility.zone_timeseries("01009")
+    assert daily[["date", "inflow"]].values.tolist() == [["2022-01-01", 3.0], ["2022-01-02", 3.0]]
+
+
+def test_cached_result_still_materialises_aggregates(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas", cache=True)
+    file_path = tmp_path / "od_cache_aggregates.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS)
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+
+    mobility.get_od_data()
+    mobility.get_od_data(aggregates=True)
+    by_origin = mobility.read_od_aggregate("by_origin")
+    assert by_origin["n_trips"].sum() == 3
+
+    # Removed aggregates are restored with the cached output.
+    shutil.rmtree(mobility._od_aggregates_path("Viajes"))
+    mobility.get_od_data(aggregates=True)
+    assert mobility.read_od_aggregate("daily_totals")["n_trips"].tolist() == [3]
+
+    monkeypatch.setattr(mobility, "_process_single_file", lambda *_: pytest.fail("result should be cached"))
+    mobility.get_od_data(aggregates=True)
+
+
+def test_version1_relation_index_is_kept_per_zoning(monkeypatch, tmp_path):
+    out_dir = tmp_path / "relations_index_v1"
+    out_dir.mkdir()
+    # Municipality 28081 has no district rows; district D3 has no municipality row.
+    (out_dir / "relaciones_municipio_mitma.csv").write_text(
+        "municipio|municipio_mitma\n28079|28079_M1\n28081|28081_M1\n", encoding="utf-8"
+    )
+    (out_dir / "relaciones_distrito_mitma.csv").write_text(
+        "distrito|distrito_mitma|municipio_mitma\n2807901|D1|28079_M1\n2808201|D3|28082_M1\n", encoding="utf-8"
+    )
+    monkeypatch.setattr(utils, "available_zoning_data", lambda *_: pd.DataFrame({"link": []}))
+
+    municipalities = Zones(zones="municipalities", version=1, output_directory=str(out_dir))
+    districts = Zones(zones="districts", version=1, output_directory=str(out_dir))
+    assert municipalities.map_ids(["28081", "2808201"], "municipalities", "municipalities_mitma").tolist() == ["28081_M1", None]
+    assert districts.map_ids(["2808201"], "census_districts", "municipalities_mitma").tolist() == ["28082_M1"]
+    assert districts.map_ids(["28081"], "municipalities", "municipalities_mitma").tolist() == [None]
+    assert (out_dir / "relations_municipios_1_index.npz").exists()
+    assert (out_dir / "relations_distritos_1_index.npz").exists()
+
+
+def test_cached_result_is_kept_per_return_type(monkeypatch, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas", cache=True)
+    file_path = tmp_path / "od_cache_return_type.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS)
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+
+    pandas_result = mobility.get_od_data(return_df=True)
+    assert isinstance(pandas_result, pd.DataFrame)
+
+    # A pandas entry is not served to an Arrow call.
+    calls = {"count": 0}
+    original = Mobility._process_single_file_arrow
+
+    def counting_process(*args, **kwargs):
+        calls["count"] += 1
+        return original(mobility, *args, **kwargs)
+
+    monkeypatch.setattr(mobility, "_process_single_file_arrow", counting_process)
+    arrow_result = mobility.get_od_data(return_df=True, return_type="arrow")
+    assert calls["count"] == 1
+    cached_arrow = mobility.get_od_data(return_df=True, return_type="arrow")
+    assert calls["count"] == 1
+    assert isinstance(cached_arrow, pa.Table)
+    assert cached_arrow.schema.remove_metadata().equals(arrow_result.schema.remove_metadata())
+
+    monkeypatch.setattr(mobility, "_process_single_file", lambda *_: pytest.fail("result should be cached"))
+    cached_pandas = mobility.get_od_data(return_df=True)
+    pd.testing.assert_frame_equal(cached_pandas.reset_index(drop=True), pandas_result.reset_index(drop=True))
+
+
+def test_cached_aggregates_follow_the_cached_result(monkeypatch, tmp_path):
+    mobility = _build_mobility(monkeypatch, tmp_path, backend="pandas", cache=True)
+    file_path = tmp_path / "od_cache_aggregates_key.csv.gz"
+    _write_gzip(file_path, _OD_TWO_ROWS)
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: [str(file_path)])
+    aggregates_path = tmp_path / "custom_out" / "Viajes_municipios_2022-01-01_2022-01-01_v2_aggregates"
+
+    mobility.get_od_data(aggregates=True)
+    assert mobility.read_od_aggregate("daily_totals")["n_trips"].tolist() == [3]
+    assert (aggregates_path / "by_hour.parquet").exists()
+
+    # A filtered call after the unfiltered one recomputes the aggregates of its own data.
+    mobility.get_od_data(aggregates=True, filters={"id_origin": ["01002"]})
+    assert mobility.read_od_aggregate("by_origin")["n_trips"].sum() == 2
+    mobility.get_od_data(aggregates=True, time_resolution="day")
+    assert not (aggregates_path / "by_hour.parquet").exists()
+
+    # Cache hits restore the aggregates stored with the hit entry.
+    monkeypatch.setattr(mobility, "_process_single_file", lambda *_: pytest.fail("result should be cached"))
+    mobility.get_od_data(aggregates=True, filters={"id_origin": ["01002"]})
+    assert (aggregates_path / "by_hour.parquet").exists()
+    assert mobility.read_od_aggregate("daily_totals")["n_trips"].tolist() == [2]
+    mobility.get_od_data(aggregates=True)
+    assert mobility.read_od_aggregate("daily_totals")["n_trips"].tolist() == [3]
+
+
+def test_zone_totals_match_for_arrow_and_pandas_results():
+    pa = pytest.importorskip("pyarrow")
+    df = pd.DataFrame({
+        "date": ["2022-01-01"] * 4,
+        "hour": [0, 0, 1, 1],
+        "id_origin": ["01001", "01001", "01009", None],
+        "id_destination": ["01009", "01001", "01009", "01001"],
+        "n_trips": [1.0, 2.0, 3.0, 4.0],
+        "trips_total_length_km": [2.0, 1.0, 3.0, 4.0],
+        "income": ["10-15", ">15", ">15", ">15"],
+    })
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    from_arrow = Mobility._zone_totals(table)
+    from_pandas = Mobility._zone_totals(df)
+    pd.testing.assert_frame_equal(from_arrow.reset_index(drop=True), from_pandas.reset_index(drop=True), check_dtype=False)
+    intra = from_arrow.set_index(["id", "hour"])["intra"]
+    assert intra[("01001", 0)] == 2.0
+    assert intra[("01009", 1)] == 3.0
+
+
+@pytest.mark.parametrize("engine, return_type", [("sequential", "pandas"), ("streaming", "pandas"), ("sequential", "arrow")])
+def test_get_od_data_keeps_od_store_up_to_date(monkeypatch, tmp_path, engine, return_type):
+    mobility = _build_mobility(
+        monkeypatch, tmp_path, backend="pandas", start_date="2022-01-01", end_date="2022-01-02", engine=engine
+    )
+    first = tmp_path / "od_store_feed_1.csv.gz"
+    second = tmp_path / "od_store_feed_2.csv.gz"
+    _write_gzip(first, _OD_TWO_ROWS)
+    _write_gzip(second, _OD_TWO_ROWS.replace("20220101", "20220102").replace("|2|3\n", "|4|3\n"))
+    monkeypatch.setattr(
+        mobility, "_donwload_helper",
+        lambda m_type, dates=None: [str(first) if date == "2022-01-01" else str(second) for date in (dates or mobility.dates)],
+    )
+    store = tmp_path / "custom_out" / "od_store" / "municipios_v2" / "n_trips"
+    # Without a store, ingesting does not create one.
+    mobility.get_od_data(return_type=return_type)
+    assert not store.exists()
+
+    mobility.dates = ["2022-01-01"]
+    mobility.update_od_store(zone_index=["01001", "01002", "01009"])
+    mobility.dates = ["2022-01-01", "2022-01-02"]
+    # Filtered or rolled-up ingests are not complete hourly values.
+    mobility.get_od_data(filters={"hour": [0]}, return_type=return_type)
+    mobility.get_od_data(time_resolution="day", return_type=return_type)
+    assert not (store / "20220102.indptr.npy").exists()
+
+    mobility.get_od_data(return_type=return_type)
+    assert (store / "20220102.indptr.npy").exists()
+    monkeypatch.setattr(mobility, "_process_single_file", lambda *_: pytest.fail("store should be up to date"))
+    mobility.update_od_store()
+    values, dates = mobility.read_od_store(origins=["01002"], destinations=["01009"], hours=[1])
+    assert dates == ["2022-01-01", "2022-01-02"]
+    assert values.ravel().tolist() == [2, 4]
+
+
+@pytest.mark.parametrize("engine", ["sequential", "threads"])
+def test_get_od_summary_merges_each_file_before_the_next(monkeypatch, tmp_path, engine):
+    mobility = _build_mobility(
+        monkeypatch, tmp_path, backend="pandas", start_date="2022-01-01", end_date="2022-01-03", engine=engine
+    )
+    files = []
+    for day in ("20220101", "20220102", "20220103"):
+        path = tmp_path / f"od_summary_stream_{day}.csv.gz"
+        _write_gzip(path, _OD_TWO_ROWS.replace("20220101", day))
+        files.append(str(path))
+    monkeypatch.setattr(mobility, "_donwload_helper", lambda *_: files)
+    mobility._planned_workers["threads"] = 1
+
+    alive = {"partials": 0, "peak": 0}
+    summarise, merge = mobility._summarise_od_file, Mobility._merge_od_summaries
+
+    def counting_summarise(*args):
+        partial = summarise(*args)
+        alive["partials"] += 1
+        alive["peak"] = max(alive["peak"], alive["partials"])
+        return partial
+
+    def counting_merge(summary, partial, capacities):
+        alive["partials"] -= 1
+        return merge(summary, partial, capacities)
+
+    monkeypatch.setattr(mobility, "_summarise_od_file", counting_summarise)
+    monkeypatch.setattr(mobility, "_merge_od_summaries", counting_merge)
+
+    summary = mobility.get_od_summary(top_k=1)
+    assert summary["trip_length_moments"]["n_trips"] == 9.0
+    # Sequentially a single partial summary is alive at a time; each worker adds at most one in flight.
+    assert alive["peak"] <= (1 if engine == "sequential" else 2)
+    assert alive["partials"] == 0